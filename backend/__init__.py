@@ -0,0 +1,39 @@
+"""
+Content-defined chunking, diffing and sync. The main classes are
+importable from here; each module is loaded on first use, so importing
+the package is cheap.
+"""
+import importlib
+
+_EXPORTS = {
+    "FileSyncer": "syncer",
+    "FileChunker": "chunker",
+    "FileHasher": "hasher",
+    "FileDiffer": "differ",
+    "DeltaEngine": "delta",
+    "ChunkTuner": "autotune",
+    "PlanApplier": "applier",
+    "TreeSyncer": "treesync",
+    "FanoutSyncer": "fanout",
+    "ChunkStore": "chunkstore",
+    "SignatureCache": "sigcache",
+    "ReportWriter": "report",
+    "encode_plan": "patch",
+    "apply_patch": "patch",
+    "decode_patch": "patch",
+}
+
+__all__ = sorted(_EXPORTS)
+
+
+def __getattr__(name):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{module}", __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
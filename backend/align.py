@@ -0,0 +1,146 @@
+import bisect
+from typing import Dict, List, Hashable, Optional, Sequence, Tuple
+
+
+def _longest_increasing(pairs: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """Longest chain of (a, b) pairs increasing in a (pairs are sorted by b)"""
+    tails: List[int] = []       # smallest a ending a chain of each length
+    tail_idx: List[int] = []    # index into pairs of that chain end
+    prev = [-1] * len(pairs)
+    for k, (a, _) in enumerate(pairs):
+        pos = bisect.bisect_left(tails, a)
+        if pos == len(tails):
+            tails.append(a)
+            tail_idx.append(k)
+        else:
+            tails[pos] = a
+            tail_idx[pos] = k
+        prev[k] = tail_idx[pos - 1] if pos else -1
+
+    chain = []
+    k = tail_idx[-1] if tail_idx else -1
+    while k != -1:
+        chain.append(pairs[k])
+        k = prev[k]
+    chain.reverse()
+    return chain
+
+
+def _greedy_in_order(a: Sequence[Hashable], b: Sequence[Hashable],
+                     alo: int, ahi: int, blo: int, bhi: int) -> List[Tuple[int, int]]:
+    """Fallback for regions without unique anchors: match equal keys in order"""
+    positions: Dict[Hashable, List[int]] = {}
+    for i in range(alo, ahi):
+        positions.setdefault(a[i], []).append(i)
+
+    matches = []
+    last = alo - 1
+    for j in range(blo, bhi):
+        cands = positions.get(b[j])
+        if not cands:
+            continue
+        k = bisect.bisect_right(cands, last)
+        if k < len(cands):
+            last = cands[k]
+            matches.append((last, j))
+    return matches
+
+
+def patience_align(a: Sequence[Hashable], b: Sequence[Hashable]) -> List[Tuple[int, int]]:
+    """
+    Order-preserving alignment of two key sequences (patience diff).
+
+    Keys occurring exactly once on both sides anchor the alignment (longest
+    increasing chain of them), equal runs are extended around the anchors,
+    and the gaps between anchors are aligned the same way. Returns
+    (a_index, b_index) pairs, increasing in both.
+    """
+    matches: List[Tuple[int, int]] = []
+    stack = [(0, len(a), 0, len(b))]
+
+    while stack:
+        alo, ahi, blo, bhi = stack.pop()
+
+        # common prefix / suffix
+        while alo < ahi and blo < bhi and a[alo] == b[blo]:
+            matches.append((alo, blo))
+            alo += 1
+            blo += 1
+        while alo < ahi and blo < bhi and a[ahi - 1] == b[bhi - 1]:
+            ahi -= 1
+            bhi -= 1
+            matches.append((ahi, bhi))
+        if alo >= ahi or blo >= bhi:
+            continue
+
+        a_count: Dict[Hashable, int] = {}
+        a_pos: Dict[Hashable, int] = {}
+        for i in range(alo, ahi):
+            a_count[a[i]] = a_count.get(a[i], 0) + 1
+            a_pos[a[i]] = i
+        b_count: Dict[Hashable, int] = {}
+        for j in range(blo, bhi):
+            b_count[b[j]] = b_count.get(b[j], 0) + 1
+
+        uniques = [(a_pos[b[j]], j) for j in range(blo, bhi)
+                   if b_count[b[j]] == 1 and a_count.get(b[j]) == 1]
+        anchors = _longest_increasing(uniques)
+        if not anchors:
+            matches.extend(_greedy_in_order(a, b, alo, ahi, blo, bhi))
+            continue
+
+        prev_a, prev_b = alo, blo
+        for ai, bj in anchors:
+            matches.append((ai, bj))
+            stack.append((prev_a, ai, prev_b, bj))
+            prev_a, prev_b = ai + 1, bj + 1
+        stack.append((prev_a, ahi, prev_b, bhi))
+
+    matches.sort(key=lambda m: m[1])
+    return matches
+
+
+def key_occurrences(keys: Sequence[Hashable]) -> Dict[Hashable, List[int]]:
+    """Key -> increasing positions it occurs at"""
+    occurrences: Dict[Hashable, List[int]] = {}
+    for i, key in enumerate(keys):
+        occurrences.setdefault(key, []).append(i)
+    return occurrences
+
+
+def align_chunks(old_keys: Sequence[Hashable], new_keys: Sequence[Hashable],
+                 occurrences: Optional[Dict[Hashable, List[int]]] = None) -> List[Tuple[int, int, bool]]:
+    """
+    Match new chunks to old ones: (new_index, old_index, moved).
+
+    In-order matches come from patience_align. Any other new chunk whose key
+    exists somewhere in the old file is a move or a repeat and is matched to
+    an unused old occurrence if there is one, any occurrence otherwise.
+    occurrences (key_occurrences(old_keys)) may be passed in when the same
+    old file is aligned against many new ones.
+    """
+    aligned = patience_align(old_keys, new_keys)
+    used_old = {i for i, _ in aligned}
+    matched_new = {j: i for i, j in aligned}
+
+    if occurrences is None:
+        occurrences = key_occurrences(old_keys)
+
+    # per key, first occurrence that may still be unused (only moves forward)
+    cursor: Dict[Hashable, int] = {}
+    result = []
+    for j, key in enumerate(new_keys):
+        if j in matched_new:
+            result.append((j, matched_new[j], False))
+            continue
+        cands = occurrences.get(key)
+        if not cands:
+            continue
+        k = cursor.get(key, 0)
+        while k < len(cands) and cands[k] in used_old:
+            k += 1
+        cursor[key] = k
+        old_i = cands[k] if k < len(cands) else cands[0]
+        used_old.add(old_i)
+        result.append((j, old_i, True))
+    return result
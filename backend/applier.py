@@ -0,0 +1,302 @@
+import os
+import json
+import time
+import base64
+import bisect
+import hashlib
+import logging
+from typing import Dict, Any, List, Optional, Tuple
+
+from .hasher import get_hash_function
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+JOURNAL_VERSION = 1
+
+# data is flushed and the finished ops journaled at least this often
+CHECKPOINT_BYTES = 64 * 1024 * 1024
+CHECKPOINT_OPS = 4096
+
+_BLOCK = 1 << 20
+
+
+def _pwrite_all(fd: int, data: bytes, offset: int) -> None:
+    view = memoryview(data)
+    while view:
+        n = os.pwrite(fd, view, offset)
+        view = view[n:]
+        offset += n
+
+
+def copy_range_at(src_fd: int, dst_fd: int, src_offset: int, dst_offset: int, size: int) -> None:
+    """Copy size bytes between explicit offsets of two files, kernel-side when possible"""
+    while size:
+        n = 0
+        if hasattr(os, "copy_file_range"):
+            try:
+                n = os.copy_file_range(src_fd, dst_fd, size, src_offset, dst_offset)
+            except OSError:
+                n = 0
+        if not n:
+            block = os.pread(src_fd, min(size, _BLOCK), src_offset)
+            if not block:
+                raise ValueError("Copy reference points past the end of the old file")
+            _pwrite_all(dst_fd, block, dst_offset)
+            n = len(block)
+        src_offset += n
+        dst_offset += n
+        size -= n
+
+
+def preallocate(fd: int, size: int) -> None:
+    """Reserve size bytes for the file (falls back to extending it sparsely)"""
+    if size and hasattr(os, "posix_fallocate"):
+        try:
+            os.posix_fallocate(fd, 0, size)
+            return
+        except OSError:
+            pass   # not supported by the filesystem
+    os.ftruncate(fd, size)
+
+
+def plan_id(operations: List[Dict[str, Any]], target: Optional[Dict[str, Any]] = None) -> str:
+    """Digest identifying a plan, so a journal is only ever resumed by the plan that wrote it"""
+    digest = hashlib.sha256()
+    for op in operations:
+        digest.update(f'{op["type"]}:{op.get("offset")}:{op.get("old_offset")}:{op["size"]};'.encode())
+        if "data" in op:
+            digest.update(op["data"].encode())
+    if target:
+        digest.update(f'{target.get("size")}:{target.get("sha256")}'.encode())
+    return digest.hexdigest()
+
+
+class PlanApplier:
+    """
+    Applies a sync plan by byte range, resumably and with verification.
+
+    Every operation writes its own range of the target (COPY runs from the
+    old file, literals from the plan) into `<output>.partial`, preallocated
+    to the target size, so operations are independent of each other and of
+    the order they run in. After each checkpoint (CHECKPOINT_BYTES or
+    CHECKPOINT_OPS) the data is fsynced and the finished operations are
+    appended to `<output>.journal`; an interrupted apply of the same plan
+    picks up from there.
+
+    `target` describes the expected result: its size, sha256 and, when the
+    plan carries them, the digests FileHasher computed for the new file's
+    chunks ({"algorithm": ..., "chunks": [[offset, size, digest], ...]}).
+    Each written range is read back and checked against the chunks inside
+    it; before the file is renamed over output_path every remaining chunk
+    (spanning operations, or written by an earlier run) and the whole-file
+    digest are checked.
+    The output is never left half written: it is either the old file or the
+    fully verified new one.
+    """
+
+    def __init__(self, output_path: str, old_file: Optional[str] = None,
+                 target: Optional[Dict[str, Any]] = None, fsync: bool = True):
+        self.output_path = output_path
+        self.old_file = old_file
+        self.target = target or {}
+        self.fsync = fsync
+        self.partial_path = f"{output_path}.partial"
+        self.journal_path = f"{output_path}.journal"
+        self.resumed_ops = 0
+        self.verified_chunks = 0
+
+        chunks = sorted(self.target.get("chunks") or [])
+        self._chunk_offsets = [c[0] for c in chunks]
+        self._chunks = chunks
+        self._verified = set()   # indexes of the chunks checked so far
+        self._hash = get_hash_function(self.target.get("algorithm", "sha256")) if chunks else None
+
+    # -- plan checks -------------------------------------------------------
+
+    @staticmethod
+    def _ranges(operations: List[Dict[str, Any]]) -> Tuple[List[int], int]:
+        """Indexes of the ops that write data, and the size they add up to"""
+        writes = [i for i, op in enumerate(operations) if op["type"] != "REMOVE"]
+        # ops from older plans may lack target offsets: they follow each other
+        position = 0
+        for i in writes:
+            operations[i].setdefault("offset", position)
+            position = operations[i]["offset"] + operations[i]["size"]
+        spans = sorted((operations[i]["offset"], operations[i]["size"]) for i in writes)
+        end = 0
+        for offset, size in spans:
+            if offset != end:
+                raise ValueError(f"Plan operations do not cover the target contiguously at offset {end}")
+            end += size
+        return writes, end
+
+    # -- journal -----------------------------------------------------------
+
+    def _load_journal(self, pid: str, size: int) -> set:
+        """Ops a previous run of this plan finished (and synced); empty if there is nothing to resume"""
+        try:
+            with open(self.journal_path, "r", encoding="utf-8") as f:
+                lines = f.read().split("\n")
+        except FileNotFoundError:
+            return set()
+        try:
+            header = json.loads(lines[0])
+            if header.get("version") != JOURNAL_VERSION or header.get("plan") != pid or \
+                    header.get("size") != size or os.path.getsize(self.partial_path) != size:
+                return set()
+        except (ValueError, OSError):
+            return set()
+        done = set()
+        # the last line may be torn by a crash mid-write: only complete lines count
+        for line in lines[1:-1]:
+            try:
+                done.update(json.loads(line))
+            except ValueError:
+                break
+        return done
+
+    def _start_journal(self, pid: str, size: int) -> None:
+        with open(self.journal_path, "w", encoding="utf-8") as f:
+            f.write(json.dumps({"version": JOURNAL_VERSION, "plan": pid, "size": size}) + "\n")
+            self._sync(f)
+
+    def _checkpoint(self, fd: int, journal, finished: List[int]) -> None:
+        if not finished:
+            return
+        if self.fsync:
+            os.fsync(fd)
+        journal.write(json.dumps(finished) + "\n")
+        self._sync(journal)
+        finished.clear()
+
+    def _sync(self, f) -> None:
+        f.flush()
+        if self.fsync:
+            os.fsync(f.fileno())
+
+    def discard(self) -> None:
+        """Drop the partial file and journal of an unfinished apply"""
+        for path in (self.partial_path, self.journal_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    # -- verification ------------------------------------------------------
+
+    def _verify_range(self, fd: int, offset: int, size: int) -> None:
+        """Check the chunks inside [offset, offset + size) against their digests"""
+        i = bisect.bisect_left(self._chunk_offsets, offset)
+        while i < len(self._chunks) and self._chunks[i][0] + self._chunks[i][1] <= offset + size:
+            self._verify_chunk(fd, i)
+            i += 1
+
+    def _verify_chunk(self, fd: int, i: int) -> None:
+        c_offset, c_size, digest = self._chunks[i][:3]
+        if digest is not None:
+            if self._hash(os.pread(fd, c_size, c_offset)) != digest:
+                raise ValueError(f"Chunk at offset {c_offset} does not match its digest")
+            self.verified_chunks += 1
+        self._verified.add(i)
+
+    def _verify_file(self, fd: int, size: int) -> None:
+        """
+        Check the chunks no single operation covered (those spanning two
+        operations, and everything an earlier run wrote), then the whole file
+        """
+        if os.fstat(fd).st_size != size:
+            raise ValueError("Synchronized file has the wrong size")
+        for i in range(len(self._chunks)):
+            if i not in self._verified:
+                self._verify_chunk(fd, i)
+        expected = self.target.get("sha256")
+        if expected:
+            digest = hashlib.sha256()
+            for offset in range(0, size, _BLOCK):
+                digest.update(os.pread(fd, min(_BLOCK, size - offset), offset))
+            if digest.hexdigest() != expected:
+                raise ValueError("Synchronized file does not match the target digest")
+
+    # -- apply -------------------------------------------------------------
+
+    def apply(self, operations: List[Dict[str, Any]], resume: bool = True) -> int:
+        """
+        Write the plan's target to output_path; returns its size. A ValueError
+        (bad plan, digest mismatch) discards the partial state; anything else
+        (I/O errors, interruption) keeps it for the next apply of the plan.
+        """
+        started = time.perf_counter()
+        writes, size = self._ranges(operations)
+        if "size" in self.target and self.target["size"] != size:
+            raise ValueError("Plan operations do not add up to the target size")
+        pid = plan_id(operations, self.target)
+
+        done = self._load_journal(pid, size) if resume else set()
+        if not done:
+            self.discard()
+            self._start_journal(pid, size)
+        self.resumed_ops = len(done)
+        if done:
+            logger.info("Resuming %s: %d of %d operations already applied",
+                        self.output_path, len(done), len(writes))
+
+        written = 0
+        src_fd = None
+        fd = os.open(self.partial_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if not done:
+                preallocate(fd, size)
+            with open(self.journal_path, "a", encoding="utf-8") as journal:
+                finished: List[int] = []
+                pending = 0
+                for i in writes:
+                    if i in done:
+                        continue
+                    op = operations[i]
+                    if op["type"] == "COPY":
+                        if src_fd is None:
+                            if not self.old_file:
+                                raise ValueError("COPY operations need the old file")
+                            src_fd = os.open(self.old_file, os.O_RDONLY)
+                        copy_range_at(src_fd, fd, op["old_offset"], op["offset"], op["size"])
+                    else:
+                        block = base64.b64decode(op["data"])
+                        if len(block) != op["size"]:
+                            raise ValueError(f"Operation at offset {op['offset']} carries the wrong amount of data")
+                        _pwrite_all(fd, block, op["offset"])
+                    self._verify_range(fd, op["offset"], op["size"])
+                    written += op["size"]
+                    pending += op["size"]
+                    finished.append(i)
+                    if pending >= CHECKPOINT_BYTES or len(finished) >= CHECKPOINT_OPS:
+                        self._checkpoint(fd, journal, finished)
+                        pending = 0
+                self._checkpoint(fd, journal, finished)
+
+            self._verify_file(fd, size)
+            if self.fsync:
+                os.fsync(fd)
+            os.close(fd)
+            fd = None
+            os.replace(self.partial_path, self.output_path)
+            self._sync_dir()
+            os.remove(self.journal_path)
+        except ValueError:
+            self.discard()
+            raise
+        finally:
+            if fd is not None:
+                os.close(fd)
+            if src_fd is not None:
+                os.close(src_fd)
+        metrics.observe("apply", time.perf_counter() - started, written, self.verified_chunks)
+        return size
+
+    def _sync_dir(self) -> None:
+        """Make the rename itself durable (POSIX only)"""
+        if not self.fsync or not hasattr(os, "O_DIRECTORY"):
+            return
+        dir_fd = os.open(os.path.dirname(os.path.abspath(self.output_path)), os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
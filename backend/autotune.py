@@ -0,0 +1,250 @@
+import os
+import math
+import random
+import hashlib
+from typing import Dict, Any, List, Optional, Tuple
+
+from .chunker import FileChunker, mapped_file, determine_chunk_size
+
+TUNING_MODES = ('auto', 'trial')
+
+# bytes of signature/metadata a chunk costs: strong digest plus offset/size
+CHUNK_OVERHEAD_BYTES = 48
+# trial windows are sized to hold about this many chunks of the candidate size
+TRIAL_WINDOW_CHUNKS = 64
+
+
+def _pow2(x: float) -> int:
+    """Nearest power of two (the gear engine's masks round down to one anyway)"""
+    return 1 << max(0, round(math.log2(max(1.0, x))))
+
+
+class ChunkTuner:
+    """
+    Picks chunking parameters (min/avg/max chunk size and rolling window)
+    for a file from its size and a sample of its content.
+
+    The baseline is the rsync rule: an average chunk of about sqrt(size)
+    bytes balances the literal bytes one edit costs (about one chunk)
+    against the per-chunk metadata and hashing, which grows with the chunk
+    count. Sampled content then shifts it: line-structured text leans
+    towards a couple of lines per chunk, high-entropy data (compressed or
+    encrypted, where edits rarely stay local) towards larger chunks.
+
+    trial() instead chunks a sample with several candidate sizes and keeps
+    the one with the smallest estimated delta.
+    """
+
+    def __init__(self, engine: str = 'gear', min_avg: int = 8, max_avg: int = 1 << 20,
+                 max_chunks: int = 1 << 20, sample_bytes: int = 64 * 1024, samples: int = 8,
+                 trial_bytes: int = 8 * 1024 * 1024):
+        """
+        min_avg/max_avg bound the average chunk size; max_chunks caps the
+        chunk count (and so the chunk map's memory) for huge files.
+        samples windows of sample_bytes each are read, spread over the file;
+        trial_bytes bounds the bytes chunked per candidate in trial().
+        """
+        self.engine = engine
+        self.min_avg = min_avg
+        self.max_avg = max_avg
+        self.max_chunks = max_chunks
+        self.sample_bytes = sample_bytes
+        self.samples = samples
+        self.trial_bytes = trial_bytes
+
+    # -- content profile ---------------------------------------------------
+
+    def _windows(self, size: int, length: int, count: int) -> List[Tuple[int, int]]:
+        """(offset, length) of count evenly spread windows"""
+        if size <= length * count:
+            return [(0, size)] if size else []
+        step = (size - length) / (count - 1) if count > 1 else 0
+        return [(int(i * step), length) for i in range(count)]
+
+    def read_sample(self, file_path: str) -> List[bytes]:
+        return self._read_windows(file_path, self.sample_bytes, self.samples)
+
+    @staticmethod
+    def profile_bytes(sample: bytes) -> Dict[str, Any]:
+        """Byte entropy (bits/byte), text-likeness and mean line length of a sample"""
+        if not sample:
+            return {"entropy": 0.0, "text": False, "line_length": None}
+        import numpy as np
+        counts = np.bincount(np.frombuffer(sample, dtype=np.uint8), minlength=256)
+        p = counts[counts > 0] / len(sample)
+        entropy = float(-(p * np.log2(p)).sum())
+        # text: no NULs and almost nothing outside printable ASCII, whitespace and UTF-8 bytes
+        binary = int(counts[0:9].sum() + counts[14:32].sum() + counts[11:13].sum() + counts[127])
+        text = counts[0] == 0 and binary <= len(sample) // 100
+        newlines = int(counts[10])
+        return {
+            "entropy": round(entropy, 3),
+            "text": bool(text),
+            "line_length": round(len(sample) / newlines, 1) if text and newlines else None
+        }
+
+    def profile(self, file_path: str) -> Dict[str, Any]:
+        prof = self.profile_bytes(b"".join(self.read_sample(file_path)))
+        prof["size"] = os.path.getsize(file_path)
+        return prof
+
+    # -- heuristic -----------------------------------------------------------
+
+    def choose(self, size: int, profile: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Chunking parameters for a file of `size` bytes with the given content profile"""
+        avg = math.sqrt(max(size, 1))
+        reason = "sqrt(size)"
+        if profile:
+            if profile.get("line_length"):
+                # a couple of lines per chunk, but never coarser than the baseline
+                avg = min(avg, max(avg / 2, 2 * profile["line_length"]))
+                reason += ", line-structured text"
+            elif profile.get("entropy", 0) >= 7.5:
+                avg *= 2
+                reason += ", high entropy"
+        avg = max(avg, size / self.max_chunks)
+        return self.params_for(_pow2(min(max(avg, self.min_avg), self.max_avg)), profile, reason)
+
+    def params_for(self, avg: int, profile: Optional[Dict[str, Any]] = None,
+                   reason: str = "") -> Dict[str, Any]:
+        """min/max/window around an average chunk size"""
+        window = 48
+        if profile and profile.get("line_length"):
+            window = int(min(64, max(16, profile["line_length"] / 2)))
+        params = {
+            "engine": self.engine,
+            "avg_chunk_size": avg,
+            "min_chunk_size": max(1, avg // 4),
+            "max_chunk_size": avg * 4,
+            # the rolling engine never cuts before window_size bytes; keep that below the average
+            "window_size": max(1, min(window, avg // 2)),
+        }
+        if reason:
+            params["reason"] = reason
+        return params
+
+    def size_params(self, size: int) -> Dict[str, Any]:
+        """The untuned parameters: average from the file size alone, FileChunker's defaults around it"""
+        c = FileChunker(determine_chunk_size(size), engine=self.engine)
+        return {"engine": c.engine, "avg_chunk_size": c.avg_chunk_size, "min_chunk_size": c.min_chunk_size,
+                "max_chunk_size": c.max_chunk_size, "window_size": c.window_size, "mode": "size"}
+
+    @staticmethod
+    def size_kwargs(params: Dict[str, Any]) -> Dict[str, Any]:
+        """min/max/window keyword arguments for FileHasher / FileSyncer (besides the average)"""
+        return {"min_chunk_size": params["min_chunk_size"], "max_chunk_size": params["max_chunk_size"],
+                "window_size": params["window_size"]}
+
+    # -- trial -----------------------------------------------------------------
+
+    def _chunk_digests(self, params: Dict[str, Any], window: bytes, inner: bool) -> List[Tuple[bytes, int]]:
+        chunker = FileChunker(params["avg_chunk_size"], window_size=params["window_size"], engine=params["engine"],
+                              min_chunk_size=params["min_chunk_size"], max_chunk_size=params["max_chunk_size"])
+        bounds = list(chunker.iter_boundaries(window))
+        if inner and len(bounds) > 2:
+            # the first and last chunk of a window are cut by the window edges, not by content
+            bounds = bounds[1:-1]
+        return [(hashlib.blake2b(window[s:e], digest_size=16).digest(), e - s) for s, e in bounds]
+
+    def estimate_delta(self, params: Dict[str, Any], old_windows: List[bytes],
+                       new_windows: List[bytes]) -> float:
+        """Estimated delta bytes per new byte: unmatched chunks plus per-chunk metadata"""
+        known = {d for w in old_windows for d, _ in self._chunk_digests(params, w, False)}
+        literal = considered = count = 0
+        for w in new_windows:
+            for digest, size in self._chunk_digests(params, w, True):
+                considered += size
+                count += 1
+                if digest not in known:
+                    literal += size
+        return (literal + count * CHUNK_OVERHEAD_BYTES) / considered if considered else float("inf")
+
+    @staticmethod
+    def synthetic_edit(window: bytes, seed: int = 0, every: int = 16 * 1024) -> bytes:
+        """A copy of window with a small insert or overwrite about every `every` bytes"""
+        rng = random.Random(seed)
+        out = bytearray()
+        pos = 0
+        while pos < len(window):
+            step = rng.randint(every // 2, every * 3 // 2)
+            out += window[pos:pos + step]
+            pos += step
+            if pos >= len(window):
+                break
+            patch = bytes(rng.getrandbits(8) for _ in range(rng.randint(1, 32)))
+            out += patch
+            if rng.random() < 0.5:   # overwrite rather than insert
+                pos += len(patch)
+        return bytes(out)
+
+    def trial(self, old_path: str, new_path: Optional[str] = None,
+              factors: Tuple[float, ...] = (0.25, 0.5, 1, 2, 4)) -> Dict[str, Any]:
+        """
+        Try the heuristic average scaled by each factor on sample windows
+        and keep the size with the smallest estimated delta. With new_path
+        the old file's windows (widened, to absorb shifted content) are the
+        reference for the new file's; without it, the sample is compared
+        against a synthetically edited copy of itself.
+
+        Windows hold about TRIAL_WINDOW_CHUNKS chunks of the candidate size,
+        and at most trial_bytes are chunked per candidate (a sixteenth of
+        that for the pure-Python rolling engine).
+        """
+        path = new_path or old_path
+        size = os.path.getsize(path)
+        prof = self.profile(path)
+        base = self.choose(max(size, os.path.getsize(old_path)), prof)
+        budget = self.trial_bytes if self.engine == 'gear' else self.trial_bytes // 16
+
+        candidates = []
+        for f in factors:
+            avg = _pow2(base["avg_chunk_size"] * f)
+            if not self.min_avg <= avg <= self.max_avg or any(c["avg_chunk_size"] == avg for c in candidates):
+                continue
+            # old windows are twice as wide as new ones: 3 bytes read per sampled byte
+            length = min(max(self.sample_bytes, TRIAL_WINDOW_CHUNKS * avg), budget // 3)
+            count = max(1, min(self.samples, budget // (3 * length)))
+            if new_path:
+                new_windows = self._read_windows(new_path, length, count)
+                old_windows = self._old_windows(old_path, size, length, count)
+            else:
+                old_windows = self._read_windows(old_path, length, count)
+                new_windows = [self.synthetic_edit(w, i) for i, w in enumerate(old_windows)]
+            params = self.params_for(avg, prof)
+            candidates.append({"avg_chunk_size": avg,
+                               "estimated_delta": round(self.estimate_delta(params, old_windows, new_windows), 6)})
+        best = min(candidates, key=lambda c: (c["estimated_delta"], -c["avg_chunk_size"]))
+        params = self.params_for(best["avg_chunk_size"], prof, "trial")
+        params["candidates"] = candidates
+        params["profile"] = prof
+        return params
+
+    def _read_windows(self, file_path: str, length: int, count: int) -> List[bytes]:
+        with mapped_file(file_path) as data:
+            return [bytes(data[o:o + n]) for o, n in self._windows(len(data), length, count)]
+
+    def _old_windows(self, old_path: str, new_size: int, length: int, count: int) -> List[bytes]:
+        """Old-file windows at the new windows' relative positions, twice as wide"""
+        with mapped_file(old_path) as data:
+            old_size = len(data)
+            windows = []
+            for o, n in self._windows(new_size, length, count):
+                center = (o + n / 2) * old_size / new_size if new_size else 0
+                start = max(0, int(center - n))
+                windows.append(bytes(data[start:start + 2 * n]))
+            return windows
+
+    # -- entry point -------------------------------------------------------------
+
+    def tune(self, old_path: str, new_path: str, mode: str = 'auto') -> Dict[str, Any]:
+        """Parameters to chunk both files of a comparison with; recorded with mode and profile"""
+        if mode not in TUNING_MODES:
+            raise ValueError(f"Unknown tuning mode: {mode!r} (expected one of {TUNING_MODES})")
+        if mode == 'trial':
+            params = self.trial(old_path, new_path)
+        else:
+            prof = self.profile(new_path)
+            params = self.choose(max(prof["size"], os.path.getsize(old_path)), prof)
+            params["profile"] = prof
+        params["mode"] = mode
+        return params
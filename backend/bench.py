@@ -0,0 +1,375 @@
+"""
+Benchmark suite: synthetic corpora, edit workloads and per-stage timings.
+
+    python -m backend.bench --sizes 16M,256M --kinds binary,log,csv \
+        --edits append,scatter,insert,move,truncate --out bench.json
+
+Every corpus and edit is derived from --seed, so two runs (e.g. on two
+commits) measure exactly the same inputs; the JSON output carries the git
+revision and parameters so results can be diffed across commits.
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import hashlib
+import argparse
+import platform
+import tempfile
+import subprocess
+from typing import Dict, Any, List, Tuple, Callable, Union
+
+CORPUS_KINDS = ('binary', 'log', 'csv')
+EDIT_KINDS = ('append', 'scatter', 'insert', 'move', 'truncate')
+STAGES = ('chunk_rolling', 'chunk_map_old', 'chunk_map_new', 'diff', 'plan', 'patch', 'reconstruct')
+
+_BLOCK = 1 << 20
+
+# a segment of the edited file: ("old", start, end) copies from the original,
+# ("new", data) inserts bytes
+Segment = Union[Tuple[str, int, int], Tuple[str, bytes]]
+
+
+def parse_size(text: str) -> int:
+    """'64M' / '2G' / '512K' / '1000' -> bytes"""
+    text = text.strip().upper()
+    units = {"K": 1 << 10, "M": 1 << 20, "G": 1 << 30}
+    if text and text[-1] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(text)
+
+
+# -- corpora -----------------------------------------------------------------
+
+def _binary_block(rng: random.Random, n: int) -> bytes:
+    return rng.getrandbits(n * 8).to_bytes(n, 'little') if n else b""
+
+
+def _log_block(rng: random.Random, n: int, state: Dict[str, int]) -> bytes:
+    levels = ("INFO", "INFO", "INFO", "DEBUG", "WARN", "ERROR")
+    paths = ("/api/users", "/api/orders", "/api/items", "/health", "/login", "/api/search")
+    lines = []
+    size = 0
+    while size < n:
+        state["t"] += rng.randint(0, 250)
+        t = state["t"]
+        line = (f"2024-01-{1 + t // 86_400_000 % 28:02d}T{t // 3_600_000 % 24:02d}:"
+                f"{t // 60_000 % 60:02d}:{t // 1000 % 60:02d}.{t % 1000:03d}Z "
+                f"{rng.choice(levels)} [worker-{rng.randint(1, 16)}] "
+                f"req={rng.getrandbits(48):012x} path={rng.choice(paths)} "
+                f"status={rng.choice((200, 200, 200, 201, 304, 404, 500))} latency={rng.randint(1, 900)}ms\n")
+        lines.append(line)
+        size += len(line)
+    return "".join(lines).encode()
+
+
+def _csv_block(rng: random.Random, n: int, state: Dict[str, int]) -> bytes:
+    countries = ("US", "DE", "FR", "JP", "BR", "IN", "GB", "CA")
+    rows = []
+    size = 0
+    if state["row"] == 0:
+        rows.append("id,timestamp,user,amount,currency,country\n")
+    while size < n:
+        state["row"] += 1
+        row = (f"{state['row']},{1_700_000_000 + state['row'] * 7},user{rng.randint(1, 50_000)},"
+               f"{rng.randint(1, 1_000_000) / 100:.2f},{rng.choice(('USD', 'EUR', 'JPY'))},"
+               f"{rng.choice(countries)}\n")
+        rows.append(row)
+        size += len(row)
+    return "".join(rows).encode()
+
+
+def generate_corpus(path: str, kind: str, size: int, seed: int = 0) -> int:
+    """Write a reproducible synthetic file of about size bytes; returns the exact size"""
+    if kind not in CORPUS_KINDS:
+        raise ValueError(f"Unknown corpus kind: {kind!r} (expected one of {CORPUS_KINDS})")
+    rng = random.Random(f"{kind}:{seed}")
+    state = {"t": 0, "row": 0}
+    written = 0
+    with open(path, "wb") as f:
+        while written < size:
+            n = min(_BLOCK, size - written)
+            if kind == "binary":
+                block = _binary_block(rng, n)
+            elif kind == "log":
+                block = _log_block(rng, n, state)
+            else:
+                block = _csv_block(rng, n, state)
+            f.write(block)
+            written += len(block)
+    return written
+
+
+# -- edits -------------------------------------------------------------------
+
+def edit_segments(kind: str, size: int, seed: int = 0, filler: Callable[[random.Random, int], bytes] = None
+                  ) -> List[Segment]:
+    """The new file as segments of the old one plus inserted bytes"""
+    if kind not in EDIT_KINDS:
+        raise ValueError(f"Unknown edit pattern: {kind!r} (expected one of {EDIT_KINDS})")
+    rng = random.Random(f"{kind}:{seed}:{size}")
+    filler = filler or _binary_block
+
+    if kind == "append":
+        return [("old", 0, size), ("new", filler(rng, max(10 * 1024, size // 1000)))]
+
+    if kind == "truncate":
+        return [("old", 0, size - size // 10)]
+
+    if kind == "move":
+        # cut 5% out of the first half and paste it into the second half
+        n = max(1, size // 20)
+        src = rng.randrange(0, max(1, size // 2 - n))
+        dst = rng.randrange(size // 2, size) if size > 1 else size
+        return [("old", 0, src), ("old", src + n, dst), ("old", src, src + n), ("old", dst, size)]
+
+    # scattered small overwrites (one per MiB or so) / block inserts
+    count = max(1, size // _BLOCK) if kind == "scatter" else max(1, size // (8 * _BLOCK))
+    points = sorted(rng.randrange(0, max(1, size)) for _ in range(count))
+    segments: List[Segment] = []
+    pos = 0
+    for p in points:
+        if p < pos:
+            continue
+        segments.append(("old", pos, p))
+        if kind == "scatter":
+            n = min(rng.randint(1, 32), size - p)
+            segments.append(("new", filler(rng, n)))
+            pos = p + n
+        else:
+            segments.append(("new", filler(rng, 4096)))
+            pos = p
+    segments.append(("old", pos, size))
+    return [s for s in segments if s[0] == "new" or s[2] > s[1]]
+
+
+def apply_segments(old_path: str, new_path: str, segments: List[Segment]) -> int:
+    written = 0
+    with open(old_path, "rb") as src, open(new_path, "wb") as dst:
+        for seg in segments:
+            if seg[0] == "new":
+                dst.write(seg[1])
+                written += len(seg[1])
+                continue
+            src.seek(seg[1])
+            remaining = seg[2] - seg[1]
+            while remaining:
+                block = src.read(min(remaining, _BLOCK))
+                dst.write(block)
+                written += len(block)
+                remaining -= len(block)
+    return written
+
+
+# -- measurement ---------------------------------------------------------------
+
+def _reset_peak_rss() -> bool:
+    """Reset the kernel's RSS high-water mark (Linux only)"""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _peak_rss() -> int:
+    """Peak resident set size in bytes (since the last reset where supported)"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _timed(stages: Dict[str, Any], name: str, nbytes: int, fn: Callable[[], Any]) -> Any:
+    _reset_peak_rss()
+    start = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - start
+    stages[name] = {
+        "seconds": round(elapsed, 6),
+        "bytes": nbytes,
+        "mb_s": round(nbytes / (1024 * 1024) / elapsed, 2) if elapsed else None,
+        "peak_rss": _peak_rss()
+    }
+    return result
+
+
+def _file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(_BLOCK), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def run_case(old_path: str, new_path: str, chunk_size: int, engine: str,
+             rolling_cap: int, work_dir: str) -> Dict[str, Any]:
+    """Time every stage on one old/new pair"""
+    from .chunker import FileChunker
+    from .syncer import FileSyncer
+    from .patch import encode_plan
+
+    old_size = os.path.getsize(old_path)
+    new_size = os.path.getsize(new_path)
+    stages: Dict[str, Any] = {}
+
+    # the rolling chunker is pure Python; time it on a bounded prefix
+    if rolling_cap:
+        sample = os.path.join(work_dir, "rolling_sample")
+        with open(old_path, "rb") as src, open(sample, "wb") as dst:
+            dst.write(src.read(rolling_cap))
+        n = os.path.getsize(sample)
+        _timed(stages, "chunk_rolling", n, lambda: FileChunker(chunk_size).chunk_file_rolling(sample))
+        os.remove(sample)
+
+    syncer = FileSyncer(chunk_size=chunk_size, engine=engine)
+    old_map = _timed(stages, "chunk_map_old", old_size, lambda: syncer.hasher.create_chunk_map(old_path))
+    new_map = _timed(stages, "chunk_map_new", new_size, lambda: syncer.hasher.create_chunk_map(new_path))
+    diff = _timed(stages, "diff", old_size + new_size, lambda: syncer.differ.compare_files(old_map, new_map))
+
+    formatted = syncer._format_results(diff)
+    formatted["old_chunks"] = old_map["chunks"]
+    formatted["new_chunks"] = new_map["chunks"]
+    analysis = {"success": True, "data": formatted, "error": None}
+    plan = _timed(stages, "plan", new_size, lambda: syncer.generate_sync_plan(analysis, copy_refs=True))
+
+    patch_path = os.path.join(work_dir, "bench.fcsp")
+    def write_patch():
+        with open(patch_path, "wb") as out:
+            return encode_plan(plan, out)
+    patch_size = _timed(stages, "patch", new_size, write_patch)
+    os.remove(patch_path)
+
+    out_path = os.path.join(work_dir, "reconstructed")
+    _timed(stages, "reconstruct", new_size,
+           lambda: syncer.apply_sync_plan(plan["operations"], old_path, out_path, plan.get("target")))
+    verified = _file_sha256(out_path) == _file_sha256(new_path)
+    os.remove(out_path)
+
+    ops = plan["operations"]
+    copied = sum(op["size"] for op in ops if op["type"] == "COPY")
+    literal = sum(op["size"] for op in ops if op["type"] in ("ADD", "MODIFY"))
+    return {
+        "old_size": old_size,
+        "new_size": new_size,
+        "chunks_old": len(old_map["chunks"]),
+        "chunks_new": len(new_map["chunks"]),
+        "stages": stages,
+        "literal_bytes": literal,
+        "delta_bytes": patch_size,
+        "delta_ratio": round(patch_size / new_size, 6) if new_size else 0.0,
+        "dedup_ratio": round(copied / new_size, 6) if new_size else 0.0,
+        "moved_chunks": diff["stats"]["moved"],
+        "verified": verified
+    }
+
+
+def _git_revision() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=os.path.dirname(__file__),
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(sizes: List[int], kinds: List[str], edits: List[str], engine: str = 'gear',
+                   chunk_size: int = None, rolling_cap: int = 4 * 1024 * 1024, seed: int = 0,
+                   work_dir: str = None, log: Callable[[str], None] = None) -> Dict[str, Any]:
+    """
+    Run every (kind, size, edit) combination and return the report.
+    chunk_size None picks one per file size like the app does.
+    """
+    from .chunker import determine_chunk_size
+
+    own_dir = work_dir is None
+    work_dir = work_dir or tempfile.mkdtemp(prefix="fcs-bench-")
+    os.makedirs(work_dir, exist_ok=True)
+    results = []
+    try:
+        for kind in kinds:
+            for size in sizes:
+                old_path = os.path.join(work_dir, f"{kind}_{size}.old")
+                actual = generate_corpus(old_path, kind, size, seed)
+                filler = _binary_block if kind == "binary" else \
+                    (lambda rng, n, k=kind: (_log_block if k == "log" else _csv_block)(rng, n, {"t": 0, "row": 1})[:n])
+                for edit in edits:
+                    new_path = os.path.join(work_dir, f"{kind}_{size}_{edit}.new")
+                    apply_segments(old_path, new_path, edit_segments(edit, actual, seed, filler))
+                    cs = chunk_size or determine_chunk_size(max(actual, os.path.getsize(new_path)))
+                    result = {"corpus": kind, "size": actual, "edit": edit, "engine": engine, "chunk_size": cs}
+                    result.update(run_case(old_path, new_path, cs, engine, rolling_cap, work_dir))
+                    results.append(result)
+                    os.remove(new_path)
+                    if log:
+                        log(format_result(result))
+                os.remove(old_path)
+    finally:
+        if own_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    return {
+        "meta": {
+            "revision": _git_revision(),
+            "timestamp": time.time(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "params": {"sizes": sizes, "kinds": kinds, "edits": edits, "engine": engine,
+                       "chunk_size": chunk_size, "rolling_cap": rolling_cap, "seed": seed}
+        },
+        "results": results
+    }
+
+
+def format_result(r: Dict[str, Any]) -> str:
+    rates = " ".join(f"{name}={s['mb_s']}MB/s" for name, s in r["stages"].items())
+    return (f"{r['corpus']:<6} {r['size'] / (1 << 20):>8.1f}MiB {r['edit']:<8} "
+            f"delta={r['delta_ratio']:.4%} dedup={r['dedup_ratio']:.2%} "
+            f"peak={max(s['peak_rss'] for s in r['stages'].values()) / (1 << 20):.0f}MiB "
+            f"ok={r['verified']} | {rates}")
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m backend.bench", description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", default="8M,64M", help="comma-separated corpus sizes (K/M/G suffixes)")
+    parser.add_argument("--kinds", default=",".join(CORPUS_KINDS))
+    parser.add_argument("--edits", default=",".join(EDIT_KINDS))
+    parser.add_argument("--engine", default="gear", choices=("gear", "rolling"))
+    parser.add_argument("--chunk-size", type=int, default=None, help="average chunk size (default: by file size)")
+    parser.add_argument("--rolling-cap", default="4M", help="prefix the rolling chunker is timed on (0 = skip)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--work-dir", default=None, help="where corpora are generated (default: a temp dir)")
+    parser.add_argument("--out", default=None, help="write the JSON report here (default: stdout)")
+    args = parser.parse_args(argv)
+
+    report = run_benchmarks(
+        sizes=[parse_size(s) for s in args.sizes.split(",") if s],
+        kinds=[k for k in args.kinds.split(",") if k],
+        edits=[e for e in args.edits.split(",") if e],
+        engine=args.engine,
+        chunk_size=args.chunk_size,
+        rolling_cap=parse_size(args.rolling_cap),
+        seed=args.seed,
+        work_dir=args.work_dir,
+        log=lambda line: print(line, file=sys.stderr)
+    )
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    return 0 if all(r["verified"] for r in report["results"]) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
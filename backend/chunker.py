@@ -1,42 +1,269 @@
 import os
-from typing import List, Dict, Any, Tuple
+import mmap
+from contextlib import contextmanager
+from typing import List, Dict, Tuple, Iterator, Optional, Callable
+
+CHUNK_ENGINES = ('rolling', 'gear')
+
+# below this size a process pool costs more than it saves
+PARALLEL_MIN_BYTES = 64 * 1024 * 1024
+PARALLEL_SEGMENT_BYTES = 16 * 1024 * 1024
+
+def determine_chunk_size(file_size: int) -> int:
+    """Average chunk size for a file of the given size"""
+    if file_size < 512:
+        return 8
+    if file_size < 1024 * 1024:
+        return 512
+    if file_size < 10 * 1024 * 1024:
+        return 4096
+    return 8192
+
+@contextmanager
+def mapped_file(file_path: str):
+    """Read-only memory map of a file (b'' for empty files, which can't be mapped)"""
+    with open(file_path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            yield b''
+            return
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            yield mm
+        finally:
+            mm.close()
+
+def write_all(fd: int, data: bytes) -> None:
+    view = memoryview(data)
+    while view:
+        n = os.write(fd, view)
+        view = view[n:]
+
+def copy_range(src_fd: int, dst_fd: int, offset: int, size: int) -> None:
+    """Append size bytes from src_fd at offset to dst_fd, kernel-side when possible"""
+    while size:
+        n = 0
+        if hasattr(os, "copy_file_range"):
+            try:
+                n = os.copy_file_range(src_fd, dst_fd, size, offset)
+            except OSError:
+                n = 0
+        if not n and hasattr(os, "sendfile"):
+            try:
+                n = os.sendfile(dst_fd, src_fd, offset, size)
+            except OSError:
+                n = 0
+        if not n:
+            block = os.pread(src_fd, min(size, 1 << 20), offset)
+            if not block:
+                raise ValueError("Copy reference points past the end of the old file")
+            write_all(dst_fd, block)
+            n = len(block)
+        offset += n
+        size -= n
 
 class FileChunker:
-    def __init__(self, avg_chunk_size: int = 64, window_size: int = 48):
+    def __init__(self, avg_chunk_size: int = 64, window_size: int = 48, engine: str = 'rolling',
+                 processes: int = 0, min_chunk_size: Optional[int] = None,
+                 max_chunk_size: Optional[int] = None):
+        """
+        min/max default to half / twice the average. The gear engine honours
+        all three; the rolling engine cuts no later than max_chunk_size and
+        no earlier than window_size bytes into a chunk.
+        """
+        if engine not in CHUNK_ENGINES:
+            raise ValueError(f"Unknown chunking engine: {engine!r} (expected one of {CHUNK_ENGINES})")
         self.avg_chunk_size = avg_chunk_size
+        self.min_chunk_size = avg_chunk_size // 2 if min_chunk_size is None else min_chunk_size
+        self.max_chunk_size = avg_chunk_size * 2 if max_chunk_size is None else max_chunk_size
+        if not self.min_chunk_size <= avg_chunk_size <= self.max_chunk_size:
+            raise ValueError(f"Chunk sizes must satisfy min <= avg <= max "
+                             f"({self.min_chunk_size}, {avg_chunk_size}, {self.max_chunk_size})")
         self.window_size = window_size
+        self.engine = engine
+        self.processes = processes
         self.prime = 31
         self.mod = 1 << 32
+        self._gear = None
+
+    def chunk_file(self, file_path: str) -> List[Tuple[int, int]]:
+        """Chunk a file with the configured engine"""
+        if self.engine == 'gear':
+            return self.chunk_file_gear(file_path)
+        return self.chunk_file_rolling(file_path)
+
+    @property
+    def gear(self):
+        """Lazily built FastCDC engine (keeps numpy off the import path)"""
+        if self._gear is None:
+            from .fastcdc import GearChunker
+            self._gear = GearChunker(self.min_chunk_size, self.avg_chunk_size, self.max_chunk_size)
+        return self._gear
+
+    def chunk_file_gear(self, file_path: str) -> List[Tuple[int, int]]:
+        """Gear-hash / FastCDC chunking with normalized chunk sizes"""
+        if not os.path.exists(file_path):
+            return []
+
+        with mapped_file(file_path) as data:
+            return list(self._iter_gear(data, file_path))
 
     def chunk_file_rolling(self, file_path: str) -> List[Tuple[int, int]]:
         """Improved content-defined chunking"""
-        chunks = []
         if not os.path.exists(file_path):
-            return chunks
+            return []
+
+        with mapped_file(file_path) as data:
+            return list(self._iter_rolling(data))
+
+    def iter_boundaries(self, data, file_path: str = None) -> Iterator[Tuple[int, int]]:
+        """
+        Yield (start, end) chunk boundaries over bytes or an mmap, in order.
+        Passing the backing file_path lets the gear engine spread hashing of
+        large files over a process pool.
+        """
+        if self.engine == 'gear':
+            return self._iter_gear(data, file_path)
+        return self._iter_rolling(data)
+
+    def iter_boundaries_from(self, data, start: int) -> Iterator[Tuple[int, int]]:
+        """Boundaries from a known chunk start onwards (same cuts a full pass makes there)"""
+        if start == 0:
+            return self.iter_boundaries(data)
+        if self.engine == 'gear':
+            return self._iter_from_cuts(self.gear.iter_cuts(data, start), start)
+        return self._iter_rolling(data, start)
+
+    def dependency_window(self) -> Tuple[int, int]:
+        """
+        (before, after): the cut ending the chunk that starts at s depends
+        only on bytes [s - before, s + after). The gear hash looks back over
+        its 32-byte window; the rolling engine only looks ahead.
+        """
+        if self.engine == 'gear':
+            from .fastcdc import HASH_WINDOW
+            return HASH_WINDOW, self.max_chunk_size
+        return 0, self.max_chunk_size + self.window_size
+
+    def rechunk(self, data, old_bounds: List[Tuple[int, int]], edits: List[Tuple[int, int, int]],
+                old_size: int) -> Iterator[Tuple[int, int, Optional[int]]]:
+        """
+        Incrementally chunk data, the new version of a file whose previous
+        version (old_size bytes) had chunks old_bounds [(offset, size)].
 
-        with open(file_path, 'rb') as f:
-            data = f.read()
+        edits are the changed ranges as (old_offset, old_len, new_len), in
+        old-file coordinates. Chunking is memoryless (the next cut only
+        depends on the current chunk start and the bytes around it), so any
+        old chunk whose dependency window lies in an unchanged region is
+        reused as is, shifted by the size delta of the edits before it; only
+        the stretch from the last clean boundary before an edit until the
+        cuts line up with old boundaries again is re-chunked. The result is
+        identical to a full pass. Yields (start, end, old_index or None).
+        """
+        n = len(data)
+        edits = sorted(edits)
+        segments = []   # unchanged old ranges [a, b) and their shift into the new file
+        a, delta = 0, 0
+        for offset, old_len, new_len in edits:
+            if offset < a or offset + old_len > old_size or old_len < 0 or new_len < 0:
+                raise ValueError(f"Invalid or overlapping edit: {(offset, old_len, new_len)}")
+            segments.append((a, offset, delta))
+            a = offset + old_len
+            delta += new_len - old_len
+        segments.append((a, old_size, delta))
+        if old_size + delta != n:
+            raise ValueError(f"Edits do not account for the new size ({old_size} + {delta} != {n})")
+
+        if self.engine == 'rolling' and min(n, old_size) <= self.window_size:
+            # tiny files take a special path in the rolling engine
+            for start, end in self.iter_boundaries(data):
+                yield start, end, None
+            return
+
+        # new offset -> index of an old chunk that can be reused there
+        before, after = self.dependency_window()
+        clean: Dict[int, int] = {}
+        seg = 0
+        for i, (offset, size) in enumerate(old_bounds):
+            while seg < len(segments) and segments[seg][1] <= offset:
+                seg += 1
+            if seg == len(segments):
+                break
+            lo, hi, shift = segments[seg]
+            if lo <= max(0, offset - before) and offset + after <= hi:
+                clean[offset + shift] = i
+
+        pos = 0
+        cuts = None
+        while pos < n:
+            i = clean.get(pos)
+            if i is not None:
+                size = old_bounds[i][1]
+                yield pos, pos + size, i
+                pos += size
+                cuts = None
+                continue
+            if cuts is None:
+                cuts = self.iter_boundaries_from(data, pos)
+            start, end = next(cuts)
+            yield start, end, None
+            pos = end
 
-        if not data:
-            return chunks
+    @staticmethod
+    def _iter_from_cuts(cuts: Iterator[int], start: int) -> Iterator[Tuple[int, int]]:
+        prev = start
+        for cut in cuts:
+            yield (prev, cut)
+            prev = cut
 
+    def _iter_gear(self, data, file_path: str = None) -> Iterator[Tuple[int, int]]:
         n = len(data)
-        if n <= self.window_size:
-            return [(0, n)]
+        if not n:
+            return
+        if file_path and self.processes > 1 and n >= PARALLEL_MIN_BYTES:
+            cuts = self._parallel_gear_cuts(file_path, n)
+        else:
+            cuts = self.gear.iter_cuts(data)
+        prev = 0
+        for cut in cuts:
+            yield (prev, cut)
+            prev = cut
 
-        i = 0
-        min_chunk = self.avg_chunk_size // 2
-        max_chunk = self.avg_chunk_size * 2
+    def _parallel_gear_cuts(self, file_path: str, n: int) -> Iterator[int]:
+        """
+        Gear candidates only depend on the 32 bytes before each position, so
+        segments are hashed independently in worker processes; the cheap
+        size-zone selection then runs over the merged candidate lists.
+        """
+        from concurrent.futures import ProcessPoolExecutor
+        from .fastcdc import segment_candidates
 
+        sizes = (self.min_chunk_size, self.avg_chunk_size, self.max_chunk_size)
+        segments = [(file_path, s, min(s + PARALLEL_SEGMENT_BYTES, n), sizes)
+                    for s in range(0, n, PARALLEL_SEGMENT_BYTES)]
+        strict: List[int] = []
+        loose: List[int] = []
+        with ProcessPoolExecutor(self.processes) as pool:
+            for seg_strict, seg_loose in pool.map(segment_candidates, segments):
+                strict.extend(seg_strict)
+                loose.extend(seg_loose)
+        return self.gear.select_cuts(strict, loose, 0, n)
+
+    def _iter_rolling(self, data, start: int = 0) -> Iterator[Tuple[int, int]]:
+        n = len(data)
+        if not n:
+            return
+        if start == 0 and n <= self.window_size:
+            yield (0, n)
+            return
+
+        i = start
         while i < n:
             chunk_start = i
-            chunk_end = min(i + max_chunk, n)
+            chunk_end = min(i + self.max_chunk_size, n)
             boundary = self._find_boundary(data, chunk_start, chunk_end)
-            chunks.append((chunk_start, boundary))
+            yield (chunk_start, boundary)
             i = boundary
 
-        return chunks
-
     def _find_boundary(self, data: bytes, start: int, end: int) -> int:
         """Find a rolling-hash boundary, then snap forward to the next newline if possible."""
         if end - start <= self.window_size:
@@ -72,4 +299,62 @@ class FileChunker:
     def _update_rolling_hash(self, current_hash: int, new_byte: int, old_byte: int) -> int:
         """Update rolling hash efficiently"""
         power = pow(self.prime, self.window_size - 1, self.mod)
-        return ((current_hash - old_byte * power) * self.prime + new_byte) % self.mod  # Fixed parentheses
\ No newline at end of file
+        return ((current_hash - old_byte * power) * self.prime + new_byte) % self.mod  # Fixed parentheses
+
+class StreamChunker:
+    """
+    Push-based front end to a FileChunker: feed() bytes as they arrive and
+    on_chunk(offset, data) is called for every chunk, with exactly the
+    boundaries a pass over the complete file would find.
+
+    A cut is final once the bytes it depends on (its dependency window)
+    have all arrived; only the undecided tail plus the few bytes of history
+    the gear hash looks back over are kept in memory.
+    """
+
+    def __init__(self, chunker: FileChunker, on_chunk: Callable[[int, memoryview], None],
+                 batch_bytes: int = 1024 * 1024):
+        self.chunker = chunker
+        self.on_chunk = on_chunk
+        self.before, self.after = chunker.dependency_window()
+        self.batch_bytes = max(batch_bytes, self.after)
+        self.buf = bytearray()
+        self.base = 0       # file offset of buf[0]
+        self.pos = 0        # start of the next chunk
+        self.size = 0
+
+    def feed(self, data) -> None:
+        self.buf += data
+        self.size += len(data)
+        if len(self.buf) - (self.pos - self.base) >= self.batch_bytes + self.after:
+            self._drain(final=False)
+
+    def finish(self) -> int:
+        """Flush the tail as end of file; returns the total size"""
+        self._drain(final=True)
+        return self.size
+
+    def _drain(self, final: bool) -> None:
+        data = bytes(self.buf)
+        n = len(data)
+        view = memoryview(data)
+        try:
+            rel = self.pos - self.base
+            if rel < n:
+                if self.base == 0 and rel == 0:
+                    bounds = self.chunker.iter_boundaries(data)
+                else:
+                    bounds = self.chunker.iter_boundaries_from(data, rel)
+                for start, end in bounds:
+                    if not final and start + self.after > n:
+                        break
+                    self.on_chunk(self.base + start, view[start:end])
+                    self.pos = self.base + end
+        finally:
+            view.release()
+
+        # keep at least one byte of history so the next pass never starts at
+        # buffer offset 0, which the engines treat as the start of the file
+        keep_from = max(0, self.pos - self.base - max(self.before, 1))
+        del self.buf[:keep_from]
+        self.base += keep_from
@@ -0,0 +1,87 @@
+import base64
+from contextlib import ExitStack
+from typing import Dict, Any, Callable, Optional
+
+from .chunker import mapped_file
+
+
+class ChunkRecord:
+    """
+    Compact chunk record: offset, size and digest only (plus a weak hash in
+    two-tier mode, where the strong digest stays None until confirmed).
+
+    The payload is not kept in memory; it is read back from the source file
+    on demand. Dict-style access (record["hash"], record["data"]) is kept so
+    records can be used wherever the old inline dicts were.
+    """
+    __slots__ = ('index', 'offset', 'size', 'hash', 'filepath', 'weak')
+
+    def __init__(self, index: int, offset: int, size: int, hash: Optional[str], filepath: str,
+                 weak: Optional[int] = None):
+        self.index = index
+        self.offset = offset
+        self.size = size
+        self.hash = hash
+        self.filepath = filepath
+        self.weak = weak
+
+    def read(self) -> bytes:
+        """Fetch the chunk's bytes from the source file"""
+        with open(self.filepath, 'rb') as f:
+            f.seek(self.offset)
+            return f.read(self.size)
+
+    @property
+    def data(self) -> str:
+        """Base64 payload, as the inline records used to carry it"""
+        return base64.b64encode(self.read()).decode('utf-8')
+
+    def __getitem__(self, key: str):
+        try:
+            return getattr(self, key)
+        except (AttributeError, TypeError):
+            raise KeyError(key)
+
+    def get(self, key: str, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.__slots__ or key == 'data'
+
+    def to_dict(self) -> Dict[str, Any]:
+        d = {
+            "index": self.index,
+            "offset": self.offset,
+            "size": self.size,
+            "hash": self.hash,
+            "filepath": self.filepath
+        }
+        if self.weak is not None:
+            d["weak"] = self.weak
+        return d
+
+    def __repr__(self) -> str:
+        digest = f"{self.hash[:12]}..." if self.hash else f"weak={self.weak}"
+        return (f"ChunkRecord(index={self.index}, offset={self.offset}, "
+                f"size={self.size}, hash={digest})")
+
+
+def payload_reader(stack: ExitStack) -> Callable[[Any], bytes]:
+    """
+    Return a function fetching a chunk's bytes. Source files are mapped once
+    (and unmapped when the stack closes); inline base64 records are decoded.
+    """
+    maps: Dict[str, Any] = {}
+
+    def read(chunk) -> bytes:
+        if not isinstance(chunk, ChunkRecord) and "data" in chunk:
+            return base64.b64decode(chunk["data"])
+        path = chunk["filepath"]
+        if path not in maps:
+            maps[path] = stack.enter_context(mapped_file(path))
+        return maps[path][chunk["offset"]:chunk["offset"] + chunk["size"]]
+
+    return read
@@ -0,0 +1,410 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from typing import Dict, Any, List, Optional, Iterable
+
+from .chunker import mapped_file, write_all
+from .hasher import FileHasher, get_hash_function
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS chunks (
+    digest   TEXT PRIMARY KEY,
+    pack     INTEGER NOT NULL,
+    offset   INTEGER NOT NULL,
+    size     INTEGER NOT NULL,
+    refcount INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS versions (
+    name     TEXT NOT NULL,
+    version  INTEGER NOT NULL,
+    size     INTEGER NOT NULL,
+    created  REAL NOT NULL,
+    chunks   TEXT NOT NULL,
+    PRIMARY KEY (name, version)
+);
+CREATE INDEX IF NOT EXISTS chunks_by_pack ON chunks (pack);
+"""
+
+
+class BloomFilter:
+    """
+    Bit-array Bloom filter over hex digests. The digests are already
+    uniformly distributed, so the k probe positions are derived from two
+    64-bit slices of the digest (double hashing) instead of hashing again.
+    """
+
+    def __init__(self, capacity: int, error_rate: float = 0.01):
+        import math
+        self.capacity = max(1, capacity)
+        self.bits = max(64, int(-self.capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.k = max(1, min(8, round(self.bits / self.capacity * math.log(2))))
+        self.array = bytearray((self.bits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, digest: str):
+        h1 = int(digest[:16], 16)
+        h2 = int(digest[16:32], 16) | 1
+        for i in range(self.k):
+            yield (h1 + i * h2) % self.bits
+
+    def add(self, digest: str) -> None:
+        for p in self._positions(digest):
+            self.array[p >> 3] |= 1 << (p & 7)
+        self.count += 1
+
+    def __contains__(self, digest: str) -> bool:
+        return all(self.array[p >> 3] & (1 << (p & 7)) for p in self._positions(digest))
+
+
+class ChunkStore:
+    """
+    Content-addressed store of chunks, deduplicated across every file and
+    version ever stored.
+
+    Chunk bytes are appended to a few large pack files; an SQLite index maps
+    each digest to (pack, offset, size, refcount) and keeps every stored
+    file version as a manifest of chunk digests. A Bloom filter in front of
+    the index answers most "do we have this chunk?" lookups without touching
+    the database. Deleting a version drops references; gc() rewrites packs
+    whose chunks are no longer referenced.
+    """
+
+    def __init__(self, store_dir: str, algorithm: str = 'sha256',
+                 pack_max_bytes: int = 256 * 1024 * 1024, expected_chunks: int = 1_000_000):
+        self.store_dir = store_dir
+        self.pack_dir = os.path.join(store_dir, "packs")
+        self.pack_max_bytes = pack_max_bytes
+        os.makedirs(self.pack_dir, exist_ok=True)
+
+        self._lock = threading.RLock()
+        self.db = sqlite3.connect(os.path.join(store_dir, "index.sqlite"), check_same_thread=False)
+        self.db.executescript(_SCHEMA)
+        row = self.db.execute("SELECT value FROM meta WHERE key = 'algorithm'").fetchone()
+        if row is None:
+            self.db.execute("INSERT INTO meta VALUES ('algorithm', ?)", (algorithm,))
+            self.db.commit()
+        elif row[0] != algorithm:
+            raise ValueError(f"Chunk store {store_dir} holds {row[0]} digests, not {algorithm}")
+        self.algorithm = algorithm
+        self.hash_bytes = get_hash_function(algorithm)
+
+        self._expected = expected_chunks
+        self._load_bloom()
+        self._pack_id, self._pack_fd, self._pack_size = None, None, 0
+
+    def close(self) -> None:
+        with self._lock:
+            if self._pack_fd is not None:
+                os.close(self._pack_fd)
+                self._pack_fd = None
+            self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # -- lookup -------------------------------------------------------------
+
+    def _load_bloom(self) -> None:
+        total = self.db.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+        self.bloom = BloomFilter(max(self._expected, total * 2))
+        for (digest,) in self.db.execute("SELECT digest FROM chunks"):
+            self.bloom.add(digest)
+
+    def _remember(self, digest: str) -> None:
+        if self.bloom.count >= self.bloom.capacity:
+            # past capacity the false-positive rate climbs; resize
+            self._expected = self.bloom.capacity * 2
+            self._load_bloom()
+        self.bloom.add(digest)
+
+    def __contains__(self, digest: str) -> bool:
+        if digest not in self.bloom:
+            return False
+        with self._lock:
+            return self.db.execute("SELECT 1 FROM chunks WHERE digest = ?", (digest,)).fetchone() is not None
+
+    def missing(self, digests: Iterable[str]) -> List[str]:
+        """Digests (in order, without repeats) the store does not hold yet"""
+        seen = set()
+        out = []
+        for d in digests:
+            if d not in seen:
+                seen.add(d)
+                if d not in self:
+                    out.append(d)
+        return out
+
+    # -- packs --------------------------------------------------------------
+
+    def _pack_path(self, pack_id: int) -> str:
+        return os.path.join(self.pack_dir, f"pack-{pack_id:06d}.pack")
+
+    def _writable_pack(self, size: int) -> int:
+        """Pack to append size bytes to: the newest one until it is full, then a fresh one"""
+        if self._pack_fd is not None and self._pack_size and self._pack_size + size > self.pack_max_bytes:
+            os.close(self._pack_fd)
+            self._pack_fd = None
+            self._pack_id += 1
+        if self._pack_fd is None:
+            if self._pack_id is None:
+                self._pack_id = max(self._pack_ids(), default=1)
+            path = self._pack_path(self._pack_id)
+            if os.path.exists(path) and os.path.getsize(path) and \
+                    os.path.getsize(path) + size > self.pack_max_bytes:
+                self._pack_id += 1
+                path = self._pack_path(self._pack_id)
+            self._pack_fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+            self._pack_size = os.fstat(self._pack_fd).st_size
+        return self._pack_id
+
+    def _append(self, data) -> Dict[str, int]:
+        pack_id = self._writable_pack(len(data))
+        offset = self._pack_size
+        write_all(self._pack_fd, data)
+        self._pack_size += len(data)
+        return {"pack": pack_id, "offset": offset}
+
+    def read_chunk(self, digest: str) -> bytes:
+        with self._lock:
+            row = self.db.execute("SELECT pack, offset, size FROM chunks WHERE digest = ?",
+                                  (digest,)).fetchone()
+        if row is None:
+            raise KeyError(digest)
+        pack, offset, size = row
+        with open(self._pack_path(pack), 'rb') as f:
+            f.seek(offset)
+            data = f.read(size)
+        if len(data) != size:
+            raise ValueError(f"Pack {pack} is truncated at chunk {digest}")
+        return data
+
+    # -- versions -----------------------------------------------------------
+
+    def put_file(self, file_path: str, name: str, hasher: FileHasher) -> Dict[str, Any]:
+        """
+        Store a new version of `name`: chunks the store already holds (from
+        any file) are only referenced, new ones are appended to a pack.
+        """
+        if hasher.algorithm != self.algorithm:
+            raise ValueError(f"Hasher uses {hasher.algorithm}, store holds {self.algorithm} digests")
+        if not os.path.exists(file_path):
+            raise FileNotFoundError(f"File not found: {file_path}")
+
+        digests: List[str] = []
+        stored_bytes = 0
+        dedup_bytes = 0
+        appended: Dict[int, int] = {}   # pack -> where this version's new chunks start in it
+        with self._lock, mapped_file(file_path) as data:
+            try:
+                view = memoryview(data)
+                try:
+                    for start, end in hasher.chunker.iter_boundaries(data, file_path):
+                        with view[start:end] as chunk:
+                            digest = self.hash_bytes(chunk)
+                            digests.append(digest)
+                            if digest in self:
+                                self.db.execute("UPDATE chunks SET refcount = refcount + 1 WHERE digest = ?",
+                                                (digest,))
+                                dedup_bytes += end - start
+                            else:
+                                loc = self._append(chunk)
+                                appended.setdefault(loc["pack"], loc["offset"])
+                                self.db.execute("INSERT INTO chunks VALUES (?, ?, ?, ?, 1)",
+                                                (digest, loc["pack"], loc["offset"], end - start))
+                                self._remember(digest)
+                                stored_bytes += end - start
+                finally:
+                    view.release()
+                size = len(data)
+
+                if self._pack_fd is not None:
+                    os.fsync(self._pack_fd)
+                row = self.db.execute("SELECT MAX(version) FROM versions WHERE name = ?", (name,)).fetchone()
+                version = (row[0] or 0) + 1
+                self.db.execute("INSERT INTO versions VALUES (?, ?, ?, ?, ?)",
+                                (name, version, size, time.time(), json.dumps(digests)))
+                self.db.commit()
+            except BaseException:
+                self._abort_put(appended)
+                raise
+
+        logger.info(f"Stored {name} v{version}: {len(digests)} chunks, "
+                    f"{stored_bytes} new bytes, {dedup_bytes} deduplicated")
+        return {
+            "name": name,
+            "version": version,
+            "size": size,
+            "chunks": len(digests),
+            "stored_bytes": stored_bytes,
+            "dedup_bytes": dedup_bytes,
+            "dedup_ratio": round(dedup_bytes / size, 4) if size else 0.0
+        }
+
+    def _abort_put(self, appended: Dict[int, int]) -> None:
+        """Undo a failed put_file: pending refcounts/rows, appended bytes, Bloom entries"""
+        self.db.rollback()
+        if self._pack_fd is not None:
+            os.close(self._pack_fd)
+            self._pack_fd = None
+        self._pack_id = None
+        for pack, offset in appended.items():
+            try:
+                os.truncate(self._pack_path(pack), offset)
+            except OSError as e:
+                logger.warning(f"Could not trim pack {pack} after a failed store: {e}")
+        self._load_bloom()
+
+    def versions(self, name: str) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self.db.execute("SELECT version, size, created FROM versions WHERE name = ? ORDER BY version",
+                                   (name,)).fetchall()
+        return [{"version": v, "size": s, "created": c} for v, s, c in rows]
+
+    def manifest(self, name: str, version: Optional[int] = None) -> Dict[str, Any]:
+        """Chunk digests of a stored version (the latest by default)"""
+        with self._lock:
+            if version is None:
+                row = self.db.execute("SELECT version, size, chunks FROM versions WHERE name = ? "
+                                      "ORDER BY version DESC LIMIT 1", (name,)).fetchone()
+            else:
+                row = self.db.execute("SELECT version, size, chunks FROM versions WHERE name = ? AND version = ?",
+                                      (name, version)).fetchone()
+        if row is None:
+            raise KeyError(f"{name} v{version}" if version else name)
+        return {"name": name, "version": row[0], "size": row[1], "chunks": json.loads(row[2])}
+
+    def restore(self, name: str, output_path: str, version: Optional[int] = None,
+                verify: bool = True) -> int:
+        """Reassemble a stored version into output_path (atomically)"""
+        manifest = self.manifest(name, version)
+        tmp = f"{output_path}.{os.getpid()}.tmp"
+        written = 0
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            for digest in manifest["chunks"]:
+                data = self.read_chunk(digest)
+                if verify and self.hash_bytes(data) != digest:
+                    raise ValueError(f"Chunk {digest} is corrupt in the store")
+                write_all(fd, data)
+                written += len(data)
+            os.close(fd)
+            fd = None
+            if written != manifest["size"]:
+                raise ValueError("Restored file has the wrong size")
+            os.replace(tmp, output_path)
+        finally:
+            if fd is not None:
+                os.close(fd)
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        return written
+
+    def delete_version(self, name: str, version: int) -> None:
+        """Drop a version; its chunks stay in the packs until gc()"""
+        manifest = self.manifest(name, version)
+        with self._lock:
+            self.db.executemany("UPDATE chunks SET refcount = refcount - 1 WHERE digest = ?",
+                                ((d,) for d in manifest["chunks"]))
+            self.db.execute("DELETE FROM versions WHERE name = ? AND version = ?", (name, version))
+            self.db.commit()
+
+    # -- garbage collection ---------------------------------------------------
+
+    def gc(self, min_dead_ratio: float = 0.5) -> Dict[str, Any]:
+        """
+        Drop unreferenced chunks. Packs whose dead share reaches
+        min_dead_ratio have their live chunks copied to a new pack (fully
+        dead packs are just dropped); other packs keep the dead bytes for now.
+        Old packs are only deleted once the index points away from them, so
+        a crash at any point leaves at worst an unreferenced pack file,
+        which the next gc() removes.
+        """
+        rewritten = 0
+        with self._lock:
+            if self._pack_fd is not None:
+                os.close(self._pack_fd)
+                self._pack_fd = None
+            self._pack_id = None
+            packed_before = self._packed_bytes()
+            try:
+                packs = self.db.execute(
+                    "SELECT pack, SUM(size), SUM(CASE WHEN refcount <= 0 THEN size ELSE 0 END) "
+                    "FROM chunks GROUP BY pack").fetchall()
+                for pack, total, dead in packs:
+                    if not dead or dead / total < min_dead_ratio:
+                        continue
+                    self._compact_pack(pack)
+                    rewritten += 1
+                removed = self.db.execute("SELECT COUNT(*) FROM chunks WHERE refcount <= 0").fetchone()[0]
+                self.db.execute("DELETE FROM chunks WHERE refcount <= 0")
+                self.db.commit()
+            except BaseException:
+                self.db.rollback()
+                raise
+            finally:
+                self._load_bloom()
+
+            # the index no longer points into compacted or fully dead packs
+            referenced = {p for (p,) in self.db.execute("SELECT DISTINCT pack FROM chunks")}
+            for pack in self._pack_ids():
+                if pack not in referenced:
+                    os.remove(self._pack_path(pack))
+            for entry in os.listdir(self.pack_dir):
+                if entry.endswith(".tmp"):   # an interrupted compaction
+                    os.remove(os.path.join(self.pack_dir, entry))
+            freed = packed_before - self._packed_bytes()
+        return {"chunks_removed": removed, "packs_rewritten": rewritten, "bytes_freed": freed}
+
+    def _compact_pack(self, pack: int) -> None:
+        """Copy the live chunks of pack into a new pack and point the index at it (uncommitted)"""
+        live = self.db.execute("SELECT digest, offset, size FROM chunks WHERE pack = ? AND refcount > 0 "
+                               "ORDER BY offset", (pack,)).fetchall()
+        if not live:
+            return
+        new_pack = max(self._pack_ids(), default=0) + 1
+        path = self._pack_path(new_pack)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        moves = []
+        with open(self._pack_path(pack), 'rb') as src, open(tmp, 'wb') as dst:
+            for digest, offset, size in live:
+                src.seek(offset)
+                moves.append((new_pack, dst.tell(), digest))
+                dst.write(src.read(size))
+            dst.flush()
+            os.fsync(dst.fileno())
+        os.replace(tmp, path)
+        self.db.executemany("UPDATE chunks SET pack = ?, offset = ? WHERE digest = ?", moves)
+
+    def _pack_ids(self) -> List[int]:
+        return [int(e[5:-5]) for e in os.listdir(self.pack_dir) if e.startswith("pack-") and e.endswith(".pack")]
+
+    def _packed_bytes(self) -> int:
+        return sum(os.path.getsize(self._pack_path(p)) for p in self._pack_ids())
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            chunks, stored, dead = self.db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0), "
+                "COALESCE(SUM(CASE WHEN refcount <= 0 THEN size ELSE 0 END), 0) FROM chunks").fetchone()
+            versions, logical = self.db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM versions").fetchone()
+        packs = [e for e in os.listdir(self.pack_dir) if e.endswith(".pack")]
+        return {
+            "algorithm": self.algorithm,
+            "chunks": chunks,
+            "versions": versions,
+            "stored_bytes": stored,
+            "dead_bytes": dead,
+            "logical_bytes": logical,
+            "packs": len(packs),
+            "dedup_ratio": round(1 - stored / logical, 4) if logical else 0.0
+        }
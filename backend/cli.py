@@ -0,0 +1,227 @@
+"""
+Command-line interface to the sync pipeline, without the web app.
+
+    python -m backend signature OLD -o old.sig
+    python -m backend diff OLD NEW [--json]
+    python -m backend patch OLD NEW -o update.fcsp
+    python -m backend patch --signature old.sig NEW > update.fcsp
+    python -m backend apply OLD update.fcsp [-o OUT]
+    python -m backend bench [bench options]
+
+Backend modules are imported by the subcommand that needs them, so
+startup stays cheap. "-" reads stdin / writes stdout. Exit codes:
+0 success (diff: files identical), 1 files differ, 2 usage or I/O error,
+3 invalid input or failed verification (bad patch/signature, digest
+mismatch), plus bench's own codes.
+"""
+import os
+import sys
+import json
+import logging
+import argparse
+from contextlib import contextmanager
+from typing import List, Optional
+
+EXIT_OK = 0
+EXIT_DIFFERENT = 1
+EXIT_ERROR = 2
+EXIT_INVALID = 3
+
+logger = logging.getLogger(__name__)
+
+
+@contextmanager
+def _output(path: Optional[str], binary: bool = False):
+    """File to write to, or stdout for None / "-" """
+    if path in (None, "-"):
+        yield sys.stdout.buffer if binary else sys.stdout
+        sys.stdout.flush()
+        return
+    with open(path, "wb" if binary else "w", encoding=None if binary else "utf-8") as f:
+        yield f
+
+
+@contextmanager
+def _input(path: str, binary: bool = False):
+    if path == "-":
+        yield sys.stdin.buffer if binary else sys.stdin
+        return
+    with open(path, "rb" if binary else "r", encoding=None if binary else "utf-8") as f:
+        yield f
+
+
+def _require_files(*paths: str) -> None:
+    for path in paths:
+        if path != "-" and not os.path.isfile(path):
+            raise FileNotFoundError(f"No such file: {path}")
+
+
+def _syncer(args):
+    from .syncer import FileSyncer
+    if args.chunk_size:
+        return FileSyncer(chunk_size=args.chunk_size, engine=args.engine, algorithm=args.algorithm)
+    return FileSyncer(engine=args.engine, algorithm=args.algorithm, tuning=args.tuning)
+
+
+# -- subcommands -------------------------------------------------------------
+
+def cmd_signature(args) -> int:
+    from .chunker import determine_chunk_size
+    from .hasher import FileHasher
+    from .delta import DeltaEngine
+    _require_files(args.file)
+    chunk_size = args.chunk_size or determine_chunk_size(os.path.getsize(args.file))
+    engine = DeltaEngine(FileHasher(chunk_size, engine=args.engine, algorithm=args.algorithm))
+    signature = engine.create_signature(args.file)
+    with _output(args.output) as out:
+        json.dump(signature, out, separators=(",", ":"))
+        out.write("\n")
+    return EXIT_OK
+
+
+def _analyze(args):
+    _require_files(args.old, args.new)
+    syncer = _syncer(args)
+    res = syncer.analyze_files(args.old, args.new)
+    if not res["success"]:
+        raise ValueError(res["error"])
+    return syncer, res
+
+
+def cmd_diff(args) -> int:
+    syncer, res = _analyze(args)
+    data = res["data"]
+    s = data["summary"]
+    # same chunk digests in the same order; the counts alone miss reordered content
+    identical = s.get("old_size") == s.get("new_size") and \
+        [(c["size"], c["hash"]) for c in data["old_chunks"]] == [(c["size"], c["hash"]) for c in data["new_chunks"]]
+    with _output(args.output) as out:
+        if args.json:
+            json.dump({"summary": s, "chunking": data.get("chunking")}, out, indent=2, default=str)
+            out.write("\n")
+        else:
+            out.write(f"{args.old} -> {args.new}: {s['total_chunks']} chunks, "
+                      f"{s['unchanged']} unchanged, {s.get('moved', 0)} moved, {s['modified']} modified, "
+                      f"{s['added']} added ({s['bytes_added']} bytes), "
+                      f"{s['removed']} removed ({s['bytes_removed']} bytes), "
+                      f"{s['changed_percent']:.1f}% changed\n")
+    return EXIT_OK if identical else EXIT_DIFFERENT
+
+
+def _signature_plan(args):
+    """Copy-reference plan from a signature of the old file (no old file needed)"""
+    from .delta import DeltaEngine
+    _require_files(args.signature, args.new)
+    with _input(args.signature) as f:
+        signature = json.load(f)
+    delta = DeltaEngine.for_signature(signature).compute_delta(signature, args.new)
+    return delta, delta["target"]["sha256"]
+
+
+def cmd_patch(args) -> int:
+    from .patch import encode_plan
+    if args.signature:
+        if args.new is not None:
+            raise argparse.ArgumentTypeError("with --signature give only the new file")
+        args.new = args.old
+        plan, target_sha256 = _signature_plan(args)
+    else:
+        if args.new is None:
+            raise argparse.ArgumentTypeError("patch needs OLD and NEW (or --signature SIG NEW)")
+        syncer, res = _analyze(args)
+        plan = syncer.generate_sync_plan(res, copy_refs=True)
+        target_sha256 = plan["target"]["sha256"]
+    with _output(args.output, binary=True) as out:
+        size = encode_plan(plan, out, codec=args.codec, target_sha256=target_sha256)
+    logger.info("Wrote %d byte patch", size)
+    return EXIT_OK
+
+
+def cmd_apply(args) -> int:
+    from .patch import apply_patch
+    _require_files(args.old, args.patch)
+    output = args.output or args.old   # in place, renamed over it once verified
+    with _input(args.patch, binary=True) as fp:
+        written = apply_patch(fp, args.old, output)
+    logger.info("Wrote %d bytes to %s", written, output)
+    return EXIT_OK
+
+
+def cmd_bench(args) -> int:
+    from .bench import main as bench_main
+    return bench_main(args.bench_args)
+
+
+# -- entry point -------------------------------------------------------------
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m backend", description=__doc__.strip().splitlines()[0])
+    parser.add_argument("-v", "--verbose", action="count", default=0, help="-v info, -vv debug logging")
+    sub = parser.add_subparsers(dest="command", metavar="COMMAND")
+    sub.required = True
+
+    chunking = argparse.ArgumentParser(add_help=False)
+    chunking.add_argument("--chunk-size", type=int, default=None, help="average chunk size (default: tuned)")
+    chunking.add_argument("--engine", default="gear", choices=("gear", "rolling"))
+    chunking.add_argument("--algorithm", default="sha256", help="strong chunk digest")
+    chunking.add_argument("--tuning", default="auto", choices=("auto", "trial"),
+                          help="chunk-size tuning when --chunk-size is not given")
+
+    p = sub.add_parser("signature", parents=[chunking], help="chunk signature of a file (JSON)")
+    p.add_argument("file")
+    p.add_argument("-o", "--output", help="write here instead of stdout")
+    p.set_defaults(func=cmd_signature)
+
+    p = sub.add_parser("diff", parents=[chunking], help="compare two files (exit 1 if they differ)")
+    p.add_argument("old")
+    p.add_argument("new")
+    p.add_argument("--json", action="store_true", help="summary as JSON")
+    p.add_argument("-o", "--output", help="write here instead of stdout")
+    p.set_defaults(func=cmd_diff)
+
+    p = sub.add_parser("patch", parents=[chunking], help="binary patch turning OLD into NEW")
+    p.add_argument("old", metavar="OLD", help="old file (or the new file, with --signature)")
+    p.add_argument("new", metavar="NEW", nargs="?")
+    p.add_argument("--signature", help="signature of the old file instead of the file itself")
+    p.add_argument("--codec", default=None, choices=("none", "zlib", "zstd"),
+                   help="literal compression (default: zstd if installed, else zlib)")
+    p.add_argument("-o", "--output", help="write here instead of stdout")
+    p.set_defaults(func=cmd_patch)
+
+    p = sub.add_parser("apply", help="apply a binary patch to OLD (verified, atomic)")
+    p.add_argument("old")
+    p.add_argument("patch", help="patch file, or - for stdin")
+    p.add_argument("-o", "--output", help="write the result here (default: replace OLD)")
+    p.set_defaults(func=cmd_apply)
+
+    # everything after "bench" goes to the benchmark's own parser
+    p = sub.add_parser("bench", help="run the benchmark suite (bench -h for its options)", add_help=False)
+    p.set_defaults(func=cmd_bench)
+    return parser
+
+
+def main(argv: List[str] = None) -> int:
+    parser = build_parser()
+    args, extra = parser.parse_known_args(argv)
+    if args.command == "bench":
+        args.bench_args = extra
+    elif extra:
+        parser.error(f"unrecognized arguments: {' '.join(extra)}")
+    level = {0: logging.WARNING, 1: logging.INFO}.get(args.verbose, logging.DEBUG)
+    logging.basicConfig(level=level, stream=sys.stderr, format="%(levelname)s %(name)s: %(message)s")
+    try:
+        return args.func(args)
+    except argparse.ArgumentTypeError as e:
+        parser.error(str(e))
+    except ValueError as e:
+        logger.error("%s", e)
+        return EXIT_INVALID
+    except OSError as e:
+        logger.error("%s", e)
+        return EXIT_ERROR
+    except KeyboardInterrupt:
+        return 130
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,151 @@
+import os
+import zlib
+import base64
+import hashlib
+from typing import Dict, Any, List, Tuple
+
+from .chunker import mapped_file
+from .hasher import FileHasher
+
+SIGNATURE_VERSION = 1
+# 2: operations use the sync-plan schema (target offset + old_offset)
+DELTA_VERSION = 2
+
+
+class DeltaEngine:
+    """
+    rsync-style signature/delta workflow on top of content-defined chunks.
+
+    The side holding the *old* copy sends a signature (per-chunk offset,
+    size, weak Adler-32 and strong hash). The side holding the *new* copy
+    chunks it with the same parameters and answers with a delta: COPY
+    references into the old copy for every chunk the signature already has,
+    and literal bytes only for new regions. Deltas use the sync-plan
+    operation schema (COPY with target `offset` and source `old_offset`,
+    ADD with inline data) plus a `target` (size, sha256), so they are
+    applied by PlanApplier or encoded as binary patches like any plan.
+    """
+
+    def __init__(self, hasher: FileHasher):
+        self.hasher = hasher
+
+    def create_signature(self, file_path: str) -> Dict[str, Any]:
+        if not os.path.exists(file_path):
+            raise FileNotFoundError(f"File not found: {file_path}")
+
+        chunks = []
+        with mapped_file(file_path) as data:
+            view = memoryview(data)
+            try:
+                for start, end in self.hasher.chunker.iter_boundaries(data):
+                    chunk = view[start:end]
+                    chunks.append([start, end - start, zlib.adler32(chunk), self.hasher.hash_bytes(chunk)])
+                    chunk.release()
+            finally:
+                view.release()
+            size = len(data)
+
+        return {
+            "version": SIGNATURE_VERSION,
+            "params": self.hasher.signature_params(),
+            "size": size,
+            "chunks": chunks
+        }
+
+    @staticmethod
+    def for_signature(signature: Dict[str, Any]) -> 'DeltaEngine':
+        """Engine chunking with the same parameters as the given signature"""
+        if signature.get("version") != SIGNATURE_VERSION:
+            raise ValueError(f"Unsupported signature version: {signature.get('version')!r}")
+        return DeltaEngine(FileHasher.from_signature_params(signature["params"]))
+
+    def compute_delta(self, signature: Dict[str, Any], new_file: str) -> Dict[str, Any]:
+        """Delta turning the signature's file into new_file"""
+        if signature.get("params") != self.hasher.signature_params():
+            raise ValueError("Signature was built with different chunking parameters")
+        if not os.path.exists(new_file):
+            raise FileNotFoundError(f"File not found: {new_file}")
+
+        # weak hash -> [(strong, old_offset, size)]
+        weak_index: Dict[int, List[Tuple[str, int, int]]] = {}
+        for offset, size, weak, strong in signature["chunks"]:
+            weak_index.setdefault(weak, []).append((strong, offset, size))
+
+        ops: List[Dict[str, Any]] = []
+        literal_bytes = 0
+        copied_bytes = 0
+        digest = hashlib.sha256()
+
+        with mapped_file(new_file) as data:
+            view = memoryview(data)
+            try:
+                literal_start = None
+                for start, end in self.hasher.chunker.iter_boundaries(data):
+                    chunk = view[start:end]
+                    digest.update(chunk)
+                    match = self._lookup(weak_index, chunk)
+                    chunk.release()
+
+                    if match is None:
+                        if literal_start is None:
+                            literal_start = start
+                        continue
+
+                    if literal_start is not None:
+                        ops.append(self._literal(data, literal_start, start))
+                        literal_bytes += start - literal_start
+                        literal_start = None
+
+                    old_offset, size = match
+                    prev = ops[-1] if ops else None
+                    if prev and prev["type"] == "COPY" and prev["old_offset"] + prev["size"] == old_offset:
+                        prev["size"] += size
+                    else:
+                        ops.append({"type": "COPY", "offset": start, "old_offset": old_offset, "size": size})
+                    copied_bytes += size
+
+                if literal_start is not None:
+                    ops.append(self._literal(data, literal_start, len(data)))
+                    literal_bytes += len(data) - literal_start
+            finally:
+                view.release()
+            target_size = len(data)
+
+        return {
+            "version": DELTA_VERSION,
+            "source_size": signature["size"],
+            "target": {"size": target_size, "sha256": digest.hexdigest()},
+            "operations": ops,
+            "stats": {
+                "copied_bytes": copied_bytes,
+                "literal_bytes": literal_bytes,
+                "operations": len(ops)
+            }
+        }
+
+    def _lookup(self, weak_index, chunk) -> Any:
+        candidates = weak_index.get(zlib.adler32(chunk))
+        if not candidates:
+            return None
+        strong = self.hasher.hash_bytes(chunk)
+        for cand_strong, offset, size in candidates:
+            if cand_strong == strong:
+                return offset, size
+        return None
+
+    @staticmethod
+    def _literal(data, start: int, end: int) -> Dict[str, Any]:
+        return {
+            "type": "ADD",
+            "offset": start,
+            "size": end - start,
+            "data": base64.b64encode(data[start:end]).decode('utf-8')
+        }
+
+    @staticmethod
+    def check_delta(delta: Dict[str, Any]) -> None:
+        """Refuse deltas in another format before they reach an applier"""
+        if delta.get("version") != DELTA_VERSION:
+            raise ValueError(f"Unsupported delta version: {delta.get('version')!r}")
+        if "operations" not in delta or "target" not in delta:
+            raise ValueError("Delta needs operations and a target")
@@ -1,16 +1,35 @@
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional
+import time
 import base64
+from contextlib import ExitStack
+from .chunkmap import payload_reader
+from .align import align_chunks
+from .metrics import metrics
 
 class FileDiffer:
-    def compare_files(self, old_map: Dict[str, Any], new_map: Dict[str, Any]) -> Dict[str, Any]:
+    def __init__(self, similarity_threshold: float = 0.7, max_candidates: int = 8):
+        self.similarity_threshold = similarity_threshold
+        self.max_candidates = max_candidates
+
+    def compare_files(self, old_map: Dict[str, Any], new_map: Dict[str, Any],
+                      baseline: Optional[Any] = None) -> Dict[str, Any]:
+        """
+        baseline: prebuilt old-side structures for comparing one old file
+        against many new ones (see fanout.BaselineIndex): `occurrences` of
+        each old digest and a `similarity` index sketching every old chunk,
+        used instead of being rebuilt for each comparison.
+        """
+        started = time.perf_counter()
         result = {
             "unchanged_chunks": [],
+            "matches": [],
             "added_chunks": [],
             "removed_chunks": [],
             "modified_chunks": [],
             "stats": {
                 "total_chunks": 0,
                 "unchanged": 0,
+                "moved": 0,
                 "added": 0,
                 "removed": 0,
                 "modified": 0,
@@ -23,50 +42,44 @@ class FileDiffer:
             }
         }
 
+        old_algo = old_map.get('algorithm', 'sha256')
+        if old_algo != new_map.get('algorithm', 'sha256'):
+            raise ValueError(f"Chunk maps were hashed with different algorithms "
+                             f"({old_algo} vs {new_map.get('algorithm', 'sha256')})")
+        weak_algo = old_map.get('weak_algorithm')
+        if weak_algo != new_map.get('weak_algorithm'):
+            raise ValueError(f"Chunk maps were hashed with different weak algorithms "
+                             f"({weak_algo} vs {new_map.get('weak_algorithm')})")
+        two_tier = weak_algo is not None
+
         old_chunks = old_map.get('chunks', [])
         new_chunks = new_map.get('chunks', [])
-        old_hash_map = {c['hash']: c for c in old_chunks}
 
-        # Track matched chunks
+        # Track matched chunks; pairs maps new index -> old index
         matched_old = set()
         matched_new = set()
+        pairs = {}
 
-        # First pass - find exact matches
-        for new_idx, new_c in enumerate(new_chunks):
-            if new_c['hash'] in old_hash_map:
-                old_c = old_hash_map[new_c['hash']]
-                result["unchanged_chunks"].append(new_c)
+        with ExitStack() as stack:
+            read = payload_reader(stack)
+
+            # First pass - align exact matches in order, then pick up moved/repeated chunks
+            occurrences = baseline.occurrences if baseline is not None and not two_tier else None
+            for new_idx, old_c, moved in self._exact_matches(old_chunks, new_chunks,
+                                                            two_tier, old_algo, read, occurrences):
+                result["unchanged_chunks"].append(new_chunks[new_idx])
+                result["matches"].append({"new_index": new_idx, "old_index": old_c['index'], "moved": moved})
                 result["stats"]["unchanged"] += 1
+                if moved:
+                    result["stats"]["moved"] += 1
                 matched_old.add(old_c['index'])
                 matched_new.add(new_idx)
+                pairs[new_idx] = old_c['index']
 
-        # Second pass - find modified chunks using content comparison
-        for new_idx, new_c in enumerate(new_chunks):
-            if new_idx in matched_new:
-                continue
-                
-            best_match = None
-            best_similarity = 0
-            
-            for old_c in old_chunks:
-                if old_c['index'] in matched_old:
-                    continue
-                
-                # Simple similarity check (could be improved)
-                similarity = self.calculate_similarity(old_c['data'], new_c['data'])
-                if similarity > best_similarity:
-                    best_similarity = similarity
-                    best_match = old_c
-
-            if best_match and best_similarity > 0.7:  # 30% similarity threshold
-                result["modified_chunks"].append({
-                    "old_chunk": best_match,
-                    "new_chunk": new_c
-                })
-                result["stats"]["modified"] += 1
-                result["stats"]["bytes_changed"] += new_c['size']
-                matched_old.add(best_match['index'])
-                matched_new.add(new_idx)
+            # Second pass - find modified chunks among near-duplicate candidates
+            if len(matched_new) < len(new_chunks) and len(matched_old) < len(old_chunks):
+                self._match_modified(old_chunks, new_chunks, matched_old, matched_new,
+                                     pairs, read, result, baseline.similarity if baseline is not None else None)
 
         # Identify remaining additions and removals
         result["added_chunks"] = [new_c for idx, new_c in enumerate(new_chunks) 
@@ -89,8 +102,111 @@ class FileDiffer:
             100.0
         )
 
+        metrics.observe("diff", time.perf_counter() - started,
+                        result["stats"]["old_size"] + result["stats"]["new_size"],
+                        len(old_chunks) + len(new_chunks))
         return result
 
+    @staticmethod
+    def _exact_matches(old_chunks, new_chunks, two_tier: bool, algorithm: str, read, occurrences=None):
+        """
+        Align the two chunk sequences (see align.align_chunks) and yield
+        (new_index, old_chunk, moved). In two-tier mode the alignment runs on
+        (weak hash, size) and the strong digest is computed only for aligned
+        pairs, which are dropped if it disagrees.
+        """
+        if not two_tier:
+            aligned = align_chunks([c['hash'] for c in old_chunks], [c['hash'] for c in new_chunks], occurrences)
+            for new_idx, old_idx, moved in aligned:
+                yield new_idx, old_chunks[old_idx], moved
+            return
+
+        from .hasher import get_hash_function
+        strong = get_hash_function(algorithm)
+
+        def confirm(c):
+            if c['hash'] is None:
+                digest = strong(read(c))
+                if isinstance(c, dict):
+                    c['hash'] = digest
+                else:
+                    c.hash = digest
+            return c['hash']
+
+        old_keys = [(c['weak'], c['size']) for c in old_chunks]
+        aligned = align_chunks(old_keys, [(c['weak'], c['size']) for c in new_chunks])
+        by_key: Dict[Any, List[Any]] = {}
+        for new_idx, old_idx, moved in aligned:
+            old_c = old_chunks[old_idx]
+            digest = confirm(new_chunks[new_idx])
+            if confirm(old_c) == digest:
+                yield new_idx, old_c, moved
+                continue
+            # weak collision: look for the real copy among the other occurrences
+            if not by_key:
+                for c in old_chunks:
+                    by_key.setdefault(old_keys[c['index']], []).append(c)
+            for other in by_key[old_keys[old_idx]]:
+                if other is not old_c and confirm(other) == digest:
+                    yield new_idx, other, True
+                    break
+
+    def _match_modified(self, old_chunks, new_chunks, matched_old, matched_new,
+                        pairs, read, result, index=None) -> None:
+        """
+        Sketch every unmatched old chunk once into a similarity index, then
+        verify only the candidates it returns for each unmatched new chunk
+        (plus the old chunk following the previous match, which catches
+        in-place edits too small to sketch well). A prebuilt index over all
+        old chunks may be passed in; matched ones are skipped at lookup.
+        """
+        from .similarity import SimilarityIndex, byte_similarity
+
+        old_by_index = {c['index']: c for c in old_chunks}
+        if index is None:
+            index = SimilarityIndex()
+            for old_c in old_chunks:
+                if old_c['index'] not in matched_old:
+                    index.add(old_c['index'], index.sketch(read(old_c)))
+
+        prev_old = -1
+        for new_idx, new_c in enumerate(new_chunks):
+            if new_idx in matched_new:
+                prev_old = pairs[new_idx]
+                continue
+
+            new_data = read(new_c)
+            candidates = index.candidates(index.sketch(new_data))
+            if prev_old + 1 in old_by_index:
+                candidates.insert(0, prev_old + 1)
+
+            best_match = None
+            best_similarity = 0
+            checked = 0
+            for old_idx in candidates:
+                if old_idx in matched_old:
+                    continue
+                old_c = old_by_index[old_idx]
+                similarity = byte_similarity(read(old_c), new_data)
+                if similarity > best_similarity:
+                    best_similarity = similarity
+                    best_match = old_c
+                checked += 1
+                if checked >= self.max_candidates:
+                    break
+
+            if best_match and best_similarity > self.similarity_threshold:
+                result["modified_chunks"].append({
+                    "old_chunk": best_match,
+                    "new_chunk": new_c
+                })
+                result["stats"]["modified"] += 1
+                result["stats"]["bytes_changed"] += new_c['size']
+                matched_old.add(best_match['index'])
+                matched_new.add(new_idx)
+                pairs[new_idx] = best_match['index']
+                prev_old = best_match['index']
+
     @staticmethod
     def calculate_similarity(a: str, b: str) -> float:
         """Basic content similarity score between two base64 strings"""
@@ -0,0 +1,337 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import logging
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, Any, List, Optional
+
+from .autotune import ChunkTuner
+from .chunker import mapped_file
+from .chunkmap import ChunkRecord
+from .hasher import FileHasher
+from .sigcache import SignatureCache
+
+logger = logging.getLogger(__name__)
+
+INDEX_VERSION = 1
+MANIFEST_VERSION = 1
+
+_ARRAYS = ("offsets", "sizes", "digests", "sketches")
+
+
+class BaselineIndex:
+    """
+    The old-side state of a comparison, built once for a baseline file and
+    reused against any number of targets.
+
+    On disk (a directory of .npy arrays plus meta.json, written last) it
+    holds every baseline chunk's offset, size, raw digest and similarity
+    sketch; load() maps the arrays read-only, so pool workers share them
+    through the page cache. The structures the differ needs (chunk records,
+    digest occurrences, the similarity index) are derived from the arrays
+    once per process, on first use.
+    """
+
+    def __init__(self, meta: Dict[str, Any], arrays: Dict[str, Any]):
+        self.meta = meta
+        self.arrays = arrays
+        self._chunk_map = None
+        self._occurrences = None
+        self._similarity = None
+
+    @classmethod
+    def build(cls, path: str, hasher: FileHasher) -> 'BaselineIndex':
+        """Chunk, hash and sketch the baseline (strong digests only)"""
+        import numpy as np
+        from .similarity import SimilarityIndex
+
+        if hasher.weak_algorithm is not None:
+            raise ValueError("Baseline indexes need strong digests (no weak_algorithm)")
+        st = os.stat(path)
+        chunk_map = hasher.create_chunk_map(path)
+        chunks = chunk_map["chunks"]
+        sim = SimilarityIndex()
+        sketches = np.zeros((len(chunks), sim.num_super_features), dtype=np.uint32)
+        with mapped_file(path) as data:
+            for i, c in enumerate(chunks):
+                sketches[i] = sim.sketch(data[c["offset"]:c["offset"] + c["size"]])
+        digest_size = len(chunks[0]["hash"]) // 2 if chunks else 0
+        digests = np.frombuffer(b"".join(bytes.fromhex(c["hash"]) for c in chunks), dtype=np.uint8)
+        meta = {
+            "version": INDEX_VERSION,
+            "path": os.path.abspath(path),
+            "size": st.st_size,
+            "mtime_ns": st.st_mtime_ns,
+            "params": hasher.signature_params(),
+            "chunks": len(chunks),
+            "similarity": {"num_super_features": sim.num_super_features,
+                           "features_per_sf": sim.features_per_sf, "shingle_size": sim.shingle_size},
+        }
+        arrays = {
+            "offsets": np.array([c["offset"] for c in chunks], dtype=np.int64),
+            "sizes": np.array([c["size"] for c in chunks], dtype=np.int64),
+            # raw digests as rows of bytes ("S" arrays would drop trailing NULs)
+            "digests": digests.reshape(len(chunks), digest_size),
+            "sketches": sketches,
+        }
+        index = cls(meta, arrays)
+        index._chunk_map = chunk_map
+        return index
+
+    def save(self, index_dir: str) -> None:
+        import numpy as np
+        os.makedirs(index_dir, exist_ok=True)
+        meta_path = os.path.join(index_dir, "meta.json")
+        if os.path.exists(meta_path):
+            os.remove(meta_path)   # incomplete until meta.json is back
+        for name in _ARRAYS:
+            tmp = os.path.join(index_dir, f"{name}.{os.getpid()}.tmp.npy")
+            np.save(tmp, self.arrays[name])
+            os.replace(tmp, os.path.join(index_dir, f"{name}.npy"))
+        tmp = f"{meta_path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.meta, f)
+        os.replace(tmp, meta_path)
+
+    @classmethod
+    def load(cls, index_dir: str) -> 'BaselineIndex':
+        import numpy as np
+        with open(os.path.join(index_dir, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("version") != INDEX_VERSION:
+            raise ValueError(f"Unsupported baseline index version: {meta.get('version')!r}")
+        arrays = {name: np.load(os.path.join(index_dir, f"{name}.npy"), mmap_mode="r") for name in _ARRAYS}
+        return cls(meta, arrays)
+
+    def is_current(self, path: str, params: Dict[str, Any]) -> bool:
+        """Still describes path as it is now, chunked with params"""
+        try:
+            st = os.stat(path)
+        except OSError:
+            return False
+        return (self.meta["path"] == os.path.abspath(path) and self.meta["size"] == st.st_size
+                and self.meta["mtime_ns"] == st.st_mtime_ns and self.meta["params"] == params)
+
+    # -- derived, per process ------------------------------------------------
+
+    def chunk_map(self) -> Dict[str, Any]:
+        """The baseline's chunk map, as FileHasher.create_chunk_map returns it"""
+        if self._chunk_map is None:
+            path = self.meta["path"]
+            offsets = self.arrays["offsets"].tolist()
+            sizes = self.arrays["sizes"].tolist()
+            digests = self.arrays["digests"]
+            raw, width = digests.tobytes(), digests.shape[1]
+            hashes = [raw[k:k + width].hex() for k in range(0, len(raw), width)] if width else [""] * len(offsets)
+            self._chunk_map = {
+                "filepath": path,
+                "algorithm": self.meta["params"]["algorithm"],
+                "weak_algorithm": None,
+                "chunks": [ChunkRecord(i, o, s, h, path) for i, (o, s, h) in enumerate(zip(offsets, sizes, hashes))],
+                "hashes": hashes,
+            }
+        return self._chunk_map
+
+    @property
+    def occurrences(self) -> Dict[str, List[int]]:
+        if self._occurrences is None:
+            from .align import key_occurrences
+            self._occurrences = key_occurrences(self.chunk_map()["hashes"])
+        return self._occurrences
+
+    @property
+    def similarity(self):
+        if self._similarity is None:
+            from .similarity import SimilarityIndex
+            index = SimilarityIndex(**self.meta["similarity"])
+            for i, sketch in enumerate(self.arrays["sketches"].tolist()):
+                index.add(i, tuple(sketch))
+            self._similarity = index
+        return self._similarity
+
+
+# the baseline a pool worker diffs against, loaded once by _init_worker
+_worker_baseline: Optional[BaselineIndex] = None
+
+
+def _init_worker(index_dir: str) -> None:
+    global _worker_baseline
+    _worker_baseline = BaselineIndex.load(index_dir)
+
+
+def _diff_target(task: Dict[str, Any], baseline: Optional[BaselineIndex] = None) -> Dict[str, Any]:
+    """
+    Worker: diff one target against the baseline and build its copy-reference
+    plan (written as a binary patch, or returned inline).
+    """
+    from .syncer import FileSyncer
+    from .patch import encode_plan
+
+    baseline = baseline or _worker_baseline
+    opts = task["options"]
+    started = time.time()
+    entry = {"path": task["path"], "new_size": task["new_size"]}
+    try:
+        params = baseline.meta["params"]
+        cache = SignatureCache(opts["cache_dir"]) if opts.get("cache_dir") else None
+        syncer = FileSyncer(chunk_size=params["avg_chunk_size"], engine=params["engine"],
+                            similarity_threshold=opts["similarity_threshold"], cache=cache,
+                            algorithm=params["algorithm"], min_chunk_size=params["min_chunk_size"],
+                            max_chunk_size=params["max_chunk_size"], window_size=params["window_size"])
+        old_map = baseline.chunk_map()
+        new_map = syncer.hasher.create_chunk_map(task["target"])
+        diff = syncer.differ.compare_files(old_map, new_map, baseline)
+        data = syncer._format_results(diff)
+        data["old_chunks"] = old_map["chunks"]
+        data["new_chunks"] = new_map["chunks"]
+        plan = syncer.generate_sync_plan({"data": data}, copy_refs=True)
+
+        ops = plan["operations"]
+        copied = sum(op["size"] for op in ops if op["type"] == "COPY")
+        literal = sum(op["size"] for op in ops if op["type"] in ("ADD", "MODIFY"))
+        old_size = baseline.meta["size"]
+        entry.update(summary=data["summary"], bytes_copied=copied, bytes_literal=literal, operations=len(ops),
+                     # share of the baseline and target bytes that are the same content
+                     similarity=round(copied / max(old_size, task["new_size"]), 6)
+                     if max(old_size, task["new_size"]) else 1.0,
+                     status="ok")
+        if task.get("patch_path"):
+            with open(task["patch_path"], "wb") as out:
+                entry["patch_size"] = encode_plan(plan, out, target_sha256=plan["target"]["sha256"])
+            entry["patch"] = os.path.basename(task["patch_path"])
+        else:
+            entry["plan"] = ops
+    except Exception as e:
+        logger.error(f"Fan-out diff failed for {task['path']}: {e}", exc_info=True)
+        entry.update(status="error", error=str(e))
+    finally:
+        entry["elapsed"] = round(time.time() - started, 4)
+    return entry
+
+
+class FanoutSyncer:
+    """
+    One baseline against many targets.
+
+    The baseline is chunked, hashed and sketched once into a BaselineIndex
+    (kept in index_dir and reused while the baseline and parameters are
+    unchanged); every target is then chunked with the same parameters and
+    diffed against it by a process pool whose workers load the index once,
+    memory-mapped. The result is a per-target plan or patch plus a ranking
+    of the targets by similarity to the baseline.
+    """
+
+    def __init__(self, chunk_size: Optional[int] = None, engine: str = 'gear',
+                 similarity_threshold: float = 0.7, processes: int = 0,
+                 algorithm: str = 'sha256', cache: Optional[SignatureCache] = None):
+        """
+        chunk_size: average chunk size for the baseline and every target
+        (None tunes it once from the baseline and the largest target);
+        processes: pool size (0 = one per CPU, 1 runs in this process).
+        """
+        self.chunk_size = chunk_size
+        self.engine = engine
+        self.similarity_threshold = similarity_threshold
+        self.processes = processes or os.cpu_count() or 1
+        self.algorithm = algorithm
+        self.cache = cache
+
+    def hasher_for(self, baseline: str, targets: List[str]) -> FileHasher:
+        """The one hasher every file of the batch is chunked with"""
+        if self.chunk_size:
+            return FileHasher(self.chunk_size, engine=self.engine, algorithm=self.algorithm, cache=self.cache)
+        tuner = ChunkTuner(self.engine)
+        size = max([os.path.getsize(baseline)] + [os.path.getsize(t) for t in targets])
+        params = tuner.choose(size, tuner.profile(baseline))
+        return FileHasher(params["avg_chunk_size"], engine=self.engine, algorithm=self.algorithm,
+                          cache=self.cache, **ChunkTuner.size_kwargs(params))
+
+    def baseline_index(self, baseline: str, hasher: FileHasher, index_dir: str) -> BaselineIndex:
+        """The saved index for baseline if it is current, else a freshly built (and saved) one"""
+        params = hasher.signature_params()
+        if os.path.exists(os.path.join(index_dir, "meta.json")):
+            try:
+                index = BaselineIndex.load(index_dir)
+                if index.is_current(baseline, params):
+                    return index
+            except (OSError, ValueError):
+                logger.warning(f"Rebuilding unreadable baseline index in {index_dir}")
+        index = BaselineIndex.build(baseline, hasher)
+        index.save(index_dir)
+        return index
+
+    def diff_many(self, baseline: str, targets: Dict[str, str], index_dir: Optional[str] = None,
+                  patch_dir: Optional[str] = None, manifest_path: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Diff every target (name -> path) against baseline. With patch_dir
+        each plan is written there as a binary patch and the manifest only
+        references it; otherwise plans are kept inline. Without index_dir
+        the index lives in a temporary directory for this call only.
+        """
+        for path in [baseline] + list(targets.values()):
+            if not os.path.isfile(path):
+                raise FileNotFoundError(f"File not found: {path}")
+        started = time.time()
+        own_index_dir = index_dir is None
+        index_dir = index_dir or tempfile.mkdtemp(prefix="fcs-baseline-")
+        if patch_dir:
+            os.makedirs(patch_dir, exist_ok=True)
+        try:
+            hasher = self.hasher_for(baseline, list(targets.values()))
+            t = time.time()
+            index = self.baseline_index(baseline, hasher, index_dir)
+            index_seconds = time.time() - t
+
+            tasks = []
+            for name, path in targets.items():
+                patch_path = None
+                if patch_dir:
+                    patch_path = os.path.join(patch_dir, hashlib.sha256(name.encode()).hexdigest()[:24] + ".fcsp")
+                tasks.append({"path": name, "target": path, "new_size": os.path.getsize(path),
+                              "patch_path": patch_path,
+                              "options": {"similarity_threshold": self.similarity_threshold,
+                                          "cache_dir": self.cache.cache_dir if self.cache else None}})
+            # longest jobs first: with a shared queue this keeps the tail short
+            tasks.sort(key=lambda t: t["new_size"], reverse=True)
+            entries = {e["path"]: e for e in self._run(tasks, index, index_dir)}
+        finally:
+            if own_index_dir:
+                shutil.rmtree(index_dir, ignore_errors=True)
+
+        ranked = sorted((e for e in entries.values() if e["status"] == "ok"),
+                        key=lambda e: (-e["similarity"], e["path"]))
+        manifest = {
+            "version": MANIFEST_VERSION,
+            "baseline": os.path.abspath(baseline),
+            "params": index.meta["params"],
+            "baseline_chunks": index.meta["chunks"],
+            "targets": [entries[name] for name in sorted(entries)],
+            "ranking": [{"path": e["path"], "similarity": e["similarity"]} for e in ranked],
+            "stats": {
+                "targets": len(entries),
+                "errors": sum(1 for e in entries.values() if e["status"] == "error"),
+                "index_seconds": round(index_seconds, 3),
+                "worker_seconds": round(sum(e["elapsed"] for e in entries.values()), 3),
+                "elapsed": round(time.time() - started, 3),
+            }
+        }
+        if manifest_path:
+            tmp = f"{manifest_path}.{os.getpid()}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(manifest, f, separators=(",", ":"))
+            os.replace(tmp, manifest_path)
+        return manifest
+
+    def _run(self, tasks: List[Dict[str, Any]], index: BaselineIndex, index_dir: str):
+        if self.processes <= 1 or len(tasks) <= 1:
+            for task in tasks:
+                yield _diff_target(task, index)
+            return
+        with ProcessPoolExecutor(max_workers=min(self.processes, len(tasks)),
+                                 initializer=_init_worker, initargs=(index_dir,)) as pool:
+            futures = [pool.submit(_diff_target, task) for task in tasks]
+            for future in as_completed(futures):
+                yield future.result()
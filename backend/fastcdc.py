@@ -0,0 +1,139 @@
+import bisect
+import hashlib
+from typing import Iterator, List, Tuple
+
+import numpy as np
+
+from .chunker import mapped_file
+
+# 256 pseudo-random 32-bit gear values, derived from SHA-256 so the table
+# (and therefore every chunk boundary) is stable across platforms/versions.
+GEAR = np.array(
+    [int.from_bytes(hashlib.sha256(bytes([i])).digest()[:4], 'little') for i in range(256)],
+    dtype=np.uint32
+)
+
+# A 32-bit gear hash ((h << 1) + GEAR[b]) only depends on the last 32 bytes.
+HASH_WINDOW = 32
+
+
+class GearChunker:
+    """FastCDC-style chunker: gear hash + normalized chunking, batched with NumPy.
+
+    The gear hash at every byte position is computed for a whole block at once
+    (log2(32) shift-and-add passes), so the only per-chunk Python work left is
+    picking the first candidate cut point inside each size zone.
+    """
+
+    def __init__(self, min_size: int, avg_size: int, max_size: int,
+                 normalization: int = 2, block_size: int = 1 << 18):
+        self.min_size = max(1, min_size)
+        self.avg_size = max(self.min_size, avg_size)
+        self.max_size = max(self.avg_size, max_size)
+        self.block_size = max(block_size, self.max_size)
+
+        bits = max(1, self.avg_size.bit_length() - 1)
+        # stricter mask before the average size, looser one after it
+        self.mask_s = self._mask(bits + normalization)
+        self.mask_l = self._mask(max(1, bits - normalization))
+
+    @staticmethod
+    def _mask(bits: int) -> int:
+        # use the high bits: bit k of a gear hash only depends on the last k+1 bytes
+        bits = min(bits, 31)
+        return ((1 << bits) - 1) << (32 - bits)
+
+    def candidates(self, buf, start: int, end: int) -> Tuple[List[int], List[int]]:
+        """Return candidate cut offsets (strict, loose) for bytes in [start, end)."""
+        if end <= start:
+            return [], []
+
+        lo = max(0, start - (HASH_WINDOW - 1))
+        data = np.frombuffer(buf, dtype=np.uint8, count=end - lo, offset=lo)
+        h = GEAR[data]
+        del data
+
+        # h_2w[i] = h_w[i] + (h_w[i - w] << w), starting from h_1[i] = GEAR[b_i]
+        tmp = np.empty_like(h)
+        shift = 1
+        while shift < min(HASH_WINDOW, len(h)):
+            n = len(h) - shift
+            np.left_shift(h[:n], shift, out=tmp[:n])
+            np.add(h[shift:], tmp[:n], out=h[shift:])
+            shift <<= 1
+
+        h = h[start - lo:]
+        # the strict mask is a superset of the loose one, so its matches are a
+        # subset of the loose matches; a match at byte i means "cut at i + 1"
+        np.bitwise_and(h, np.uint32(self.mask_l), out=tmp[:len(h)])
+        loose = np.flatnonzero(tmp[:len(h)] == 0)
+        strict = loose[(h[loose] & np.uint32(self.mask_s)) == 0]
+        return (strict + (start + 1)).tolist(), (loose + (start + 1)).tolist()
+
+    def iter_cuts(self, buf, start: int = 0, end: int = None) -> Iterator[int]:
+        """Yield chunk end offsets for buf[start:end]."""
+        if end is None:
+            end = len(buf)
+
+        strict: List[int] = []
+        loose: List[int] = []
+        scanned = start
+        s = start
+
+        while s < end:
+            if end - s <= self.min_size:
+                yield end
+                return
+
+            limit = min(s + self.max_size, end)
+            if scanned < limit:
+                # drop consumed candidates and hash the next block
+                strict = strict[bisect.bisect_right(strict, s):]
+                loose = loose[bisect.bisect_right(loose, s):]
+                while scanned < limit:
+                    stop = min(scanned + self.block_size, end)
+                    ns, nl = self.candidates(buf, scanned, stop)
+                    strict.extend(ns)
+                    loose.extend(nl)
+                    scanned = stop
+
+            s = self._select(strict, loose, s, limit)
+            yield s
+
+    def select_cuts(self, strict: List[int], loose: List[int], start: int, end: int) -> Iterator[int]:
+        """Yield chunk end offsets from candidate lists precomputed for [start, end)"""
+        s = start
+        while s < end:
+            if end - s <= self.min_size:
+                yield end
+                return
+            s = self._select(strict, loose, s, min(s + self.max_size, end))
+            yield s
+
+    def _select(self, strict: List[int], loose: List[int], s: int, limit: int) -> int:
+        normal = min(s + self.avg_size, limit)
+
+        i = bisect.bisect_left(strict, s + self.min_size)
+        if i < len(strict) and strict[i] < normal:
+            return strict[i]
+
+        j = bisect.bisect_left(loose, normal)
+        if j < len(loose) and loose[j] < limit:
+            return loose[j]
+
+        return limit
+
+    def chunk_bytes(self, buf, start: int = 0, end: int = None) -> List[Tuple[int, int]]:
+        chunks = []
+        prev = start
+        for cut in self.iter_cuts(buf, start, end):
+            chunks.append((prev, cut))
+            prev = cut
+        return chunks
+
+
+def segment_candidates(args: Tuple[str, int, int, Tuple[int, int, int]]) -> Tuple[List[int], List[int]]:
+    """Process-pool worker: candidate cut points for one segment of a file"""
+    file_path, start, end, sizes = args
+    with mapped_file(file_path) as data:
+        return GearChunker(*sizes).candidates(data, start, end)
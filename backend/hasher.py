@@ -1,13 +1,117 @@
 import os
+import zlib
+import time
 import hashlib
 import base64
-from typing import Dict, List, Any, Tuple
-from .chunker import FileChunker
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Any, Tuple, Iterator, Optional, Callable
+from .chunker import FileChunker, mapped_file
+from .chunkmap import ChunkRecord
+from .sigcache import SignatureCache
+from .metrics import metrics
+
+# per-chunk dumps; costly on big files, so only emitted when this logger is at DEBUG
+chunk_logger = logging.getLogger(__name__ + ".chunks")
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+try:
+    import blake3
+except ImportError:
+    blake3 = None
+
+# strong digests: name -> fn(bytes-like) -> hex string
+HASH_ALGORITHMS = {
+    "sha256":  lambda data: hashlib.sha256(data).hexdigest(),
+    "blake2b": lambda data: hashlib.blake2b(data, digest_size=32).hexdigest(),
+    "blake2s": lambda data: hashlib.blake2s(data).hexdigest(),
+}
+# weak (candidate) hashes: name -> fn(bytes-like) -> int
+WEAK_ALGORITHMS = {
+    "adler32": zlib.adler32,
+}
+if xxhash is not None:
+    HASH_ALGORITHMS["xxh3_128"] = lambda data: xxhash.xxh3_128_hexdigest(data)
+    WEAK_ALGORITHMS["xxh64"] = xxhash.xxh64_intdigest
+if blake3 is not None:
+    HASH_ALGORITHMS["blake3"] = lambda data: blake3.blake3(data).hexdigest()
+
+# report hashing progress at most once per this many bytes
+PROGRESS_STEP = 1024 * 1024
+
+def get_hash_function(name: str):
+    try:
+        return HASH_ALGORITHMS[name]
+    except KeyError:
+        raise ValueError(f"Unknown or unavailable hash algorithm: {name!r} "
+                         f"(available: {sorted(HASH_ALGORITHMS)})")
+
+def get_weak_function(name: str):
+    try:
+        return WEAK_ALGORITHMS[name]
+    except KeyError:
+        raise ValueError(f"Unknown or unavailable weak hash: {name!r} "
+                         f"(available: {sorted(WEAK_ALGORITHMS)})")
 
 class FileHasher:
-    def __init__(self, avg_chunk_size: int = 16):
-        self.chunker = FileChunker(avg_chunk_size)
+    def __init__(self, avg_chunk_size: int = 16, engine: str = 'rolling',
+                 cache: Optional[SignatureCache] = None,
+                 workers: int = 1, batch_size: int = 256, processes: int = 0,
+                 algorithm: str = 'sha256', weak_algorithm: Optional[str] = None,
+                 min_chunk_size: Optional[int] = None, max_chunk_size: Optional[int] = None,
+                 window_size: int = 48):
+        """
+        min_chunk_size/max_chunk_size/window_size: see FileChunker (the
+        autotune module picks all four sizes per file).
+
+        workers/batch_size: hash batches of chunks on a thread pool (hashlib
+        releases the GIL on large buffers); processes: worker processes for
+        the gear engine's boundary stage on large files.
+
+        algorithm: strong digest (sha256, blake2b, blake2s, plus xxh3_128 /
+        blake3 when installed). weak_algorithm (adler32, xxh64) enables
+        two-tier mode: chunks only get the cheap weak hash up front and the
+        strong digest is computed later, for match candidates only.
+        """
+        self.algorithm = algorithm
+        self.weak_algorithm = weak_algorithm
+        self.hash_bytes = get_hash_function(algorithm)
+        self.weak_hash = get_weak_function(weak_algorithm) if weak_algorithm else None
+        self.chunker = FileChunker(avg_chunk_size, window_size=window_size, engine=engine, processes=processes,
+                                   min_chunk_size=min_chunk_size, max_chunk_size=max_chunk_size)
         self.text_extensions = {'.txt', '.log', '.csv', '.json', '.xml'}
+        self.cache = cache
+        self.workers = max(1, workers)
+        self.batch_size = max(1, batch_size)
+
+    def signature_params(self) -> Dict[str, Any]:
+        """Everything that affects the chunk map; a change invalidates cached maps"""
+        return {
+            "engine": self.chunker.engine,
+            "avg_chunk_size": self.chunker.avg_chunk_size,
+            "min_chunk_size": self.chunker.min_chunk_size,
+            "max_chunk_size": self.chunker.max_chunk_size,
+            "window_size": self.chunker.window_size,
+            "algorithm": self.algorithm,
+            "weak_algorithm": self.weak_algorithm
+        }
+
+    @classmethod
+    def from_signature_params(cls, params: Dict[str, Any]) -> 'FileHasher':
+        """Rebuild a hasher that chunks exactly like the one that produced params"""
+        hasher = cls(params["avg_chunk_size"], engine=params["engine"],
+                     algorithm=params.get("algorithm", "sha256"),
+                     weak_algorithm=params.get("weak_algorithm"),
+                     min_chunk_size=params["min_chunk_size"], max_chunk_size=params["max_chunk_size"],
+                     window_size=params["window_size"])
+        if hasher.signature_params() != params:
+            raise ValueError(f"Unsupported chunking parameters: {params}")
+        return hasher
 
     @staticmethod
     def sha256_hash(data: bytes) -> str:
@@ -17,46 +121,259 @@ class FileHasher:
         ext = os.path.splitext(file_path)[1].lower()
         return ext in self.text_extensions
 
-    def create_chunk_map(self, file_path: str) -> Dict[str, Any]:
+    def iter_chunk_records(self, file_path: str, include_data: bool = False,
+                           progress: Optional[Callable[[int, int], None]] = None) -> Iterator[Any]:
+        """
+        Single pass over a memory-mapped file: find boundaries, hash each
+        chunk in place and yield its record. Only the current chunk is ever
+        copied, so memory stays flat regardless of file size.
+
+        Records are compact ChunkRecords; include_data=True yields the legacy
+        dicts carrying the base64 payload inline instead. progress, if given,
+        is called as progress(bytes_chunked, bytes_hashed) about every MiB.
+        """
+        if not os.path.exists(file_path):
+            raise FileNotFoundError(f"File not found: {file_path}")
+
+        with mapped_file(file_path) as data:
+            view = memoryview(data)
+            try:
+                boundaries = self.chunker.iter_boundaries(data, file_path)
+                chunked = [0]   # end of the last boundary found, ahead of hashing on the pool
+                reported = 0
+                timing = {"chunk": 0.0, "hash": 0.0, "sizes": []}
+                if metrics.enabled:
+                    boundaries = self._timed_boundaries(boundaries, timing)
+                if progress is not None:
+                    boundaries = self._track_boundaries(boundaries, chunked)
+                if self.workers > 1:
+                    hashed = self._hash_parallel(view, boundaries, timing)
+                else:
+                    hashed = self._hash_sequential(view, boundaries, timing)
+
+                for i, (start, end, chunk_hash, weak) in enumerate(hashed):
+                    record = ChunkRecord(i, start, end - start, chunk_hash, file_path, weak)
+                    if include_data:
+                        record = record.to_dict()
+                        record["data"] = base64.b64encode(view[start:end]).decode('utf-8')
+                    if progress is not None and end - reported >= PROGRESS_STEP:
+                        reported = end
+                        progress(chunked[0], end)
+                    yield record
+                if progress is not None:
+                    progress(len(data), len(data))
+                if metrics.enabled:
+                    count = len(timing["sizes"])
+                    metrics.observe("chunk", timing["chunk"], len(data), count, timing["sizes"])
+                    metrics.observe("hash", timing["hash"], len(data), count)
+            finally:
+                view.release()
+
+    @staticmethod
+    def _timed_boundaries(boundaries: Iterator[Tuple[int, int]], timing: Dict[str, Any]) -> Iterator[Tuple[int, int]]:
+        """Pass boundaries through, adding up the time spent finding them and their sizes"""
+        clock = time.perf_counter
+        sizes = timing["sizes"]
+        it = iter(boundaries)
+        while True:
+            t = clock()
+            bounds = next(it, None)
+            timing["chunk"] += clock() - t
+            if bounds is None:
+                return
+            sizes.append(bounds[1] - bounds[0])
+            yield bounds
+
+    @staticmethod
+    def _track_boundaries(boundaries: Iterator[Tuple[int, int]], chunked: List[int]) -> Iterator[Tuple[int, int]]:
+        """Pass boundaries through, recording how far chunking has got"""
+        for bounds in boundaries:
+            chunked[0] = bounds[1]
+            yield bounds
+
+    def _digest(self, chunk) -> Tuple[Optional[str], Optional[int]]:
+        """(strong, weak) for a chunk; in two-tier mode the strong one is deferred"""
+        if self.weak_hash is not None:
+            return None, self.weak_hash(chunk)
+        return self.hash_bytes(chunk), None
+
+    def _hash_sequential(self, view: memoryview, boundaries: Iterator[Tuple[int, int]],
+                         timing: Dict[str, Any]) -> Iterator[Tuple]:
+        if not metrics.enabled:
+            for start, end in boundaries:
+                yield (start, end) + self._digest(view[start:end])
+            return
+        clock = time.perf_counter
+        for start, end in boundaries:
+            t = clock()
+            digests = self._digest(view[start:end])
+            timing["hash"] += clock() - t
+            yield (start, end) + digests
+
+    def _hash_batch(self, view: memoryview, batch: List[Tuple[int, int]]) -> Tuple[List[Tuple], float]:
+        """Digests for a batch of chunks, plus the time it took"""
+        t = time.perf_counter()
+        hashed = [(start, end) + self._digest(view[start:end]) for start, end in batch]
+        return hashed, time.perf_counter() - t
+
+    def _hash_parallel(self, view: memoryview, boundaries: Iterator[Tuple[int, int]],
+                       timing: Dict[str, Any]) -> Iterator[Tuple]:
+        """
+        Hash batches of chunks on a thread pool while boundaries are still
+        being found. Results come back in submission order, and at most two
+        batches per worker are in flight, so memory stays bounded. Hash time
+        is summed over the workers.
+        """
+        with ThreadPoolExecutor(self.workers) as pool:
+            pending = deque()
+            batch = []
+            for bounds in boundaries:
+                batch.append(bounds)
+                if len(batch) >= self.batch_size:
+                    pending.append(pool.submit(self._hash_batch, view, batch))
+                    batch = []
+                    if len(pending) >= self.workers * 2:
+                        hashed, seconds = pending.popleft().result()
+                        timing["hash"] += seconds
+                        yield from hashed
+            if batch:
+                pending.append(pool.submit(self._hash_batch, view, batch))
+            while pending:
+                hashed, seconds = pending.popleft().result()
+                timing["hash"] += seconds
+                yield from hashed
+
+    def create_chunk_map(self, file_path: str, include_data: bool = False,
+                         progress: Optional[Callable[[int, int], None]] = None) -> Dict[str, Any]:
         if not os.path.exists(file_path):
             raise FileNotFoundError(f"File not found: {file_path}")
 
+        use_cache = self.cache is not None and not include_data
+        if use_cache:
+            params = self.signature_params()
+            cached = self.cache.get(file_path, params)
+            metrics.inc("signature_cache_hits" if cached is not None else "signature_cache_misses")
+            if cached is not None:
+                if progress is not None:
+                    size = os.path.getsize(file_path)
+                    progress(size, size)
+                return cached
+            identity = self.cache.file_identity(file_path)
+
         # Determine chunking method
         # if self.is_text_file(file_path):
         #     chunks = self.line_based_chunks(file_path)
         # else:
-        chunks = self.chunker.chunk_file_rolling(file_path)
-
-        chunk_info = []
-        hashes = []
-
-        # Process chunks
-        for i, (start, end) in enumerate(chunks):
-            with open(file_path, 'rb') as f:
-                f.seek(start)
-                chunk_data = f.read(end - start)
-                chunk_hash = self.sha256_hash(chunk_data)
-                chunk_info.append({
-                    "index": i,
-                    "offset": start,
-                    "size": end - start,
-                    "hash": chunk_hash,
-                    "data": base64.b64encode(chunk_data).decode('utf-8'),
-                    "filepath": file_path
-                })
-                hashes.append(chunk_hash)
-
-        # Debug logging
-        print(f"\nChunk map for {os.path.basename(file_path)}:")
-        for chunk in chunk_info:
-            decoded = base64.b64decode(chunk['data']).decode('utf-8', errors='replace')
-            print(f"Chunk {chunk['index']:02d} [{chunk['offset']:04d}-{chunk['offset']+chunk['size']:04d}]: {decoded!r}")
+        chunk_info = None
+        if use_cache:
+            # an older map of the same path lets appends skip re-chunking the prefix
+            previous = self.cache.latest(file_path, params)
+            if previous is not None and previous["identity"]["inode"] == identity["inode"]:
+                edits = self.detect_append(previous, file_path)
+                if edits is not None:
+                    metrics.inc("incremental_chunk_maps")
+                    chunk_info = self._rechunk_records(previous, file_path, edits)
+                    if progress is not None:
+                        size = os.path.getsize(file_path)
+                        progress(size, size)
+        if chunk_info is None:
+            chunk_info = list(self.iter_chunk_records(file_path, include_data, progress))
+        hashes = [c["hash"] for c in chunk_info]
 
-        return {
+        if chunk_logger.isEnabledFor(logging.DEBUG):
+            chunk_logger.debug(f"Chunk map for {os.path.basename(file_path)}:")
+            for chunk in chunk_info:
+                decoded = base64.b64decode(chunk['data']).decode('utf-8', errors='replace')
+                chunk_logger.debug(f"Chunk {chunk['index']:02d} [{chunk['offset']:04d}-{chunk['offset']+chunk['size']:04d}]: {decoded!r}")
+
+        chunk_map = {
             "filepath": file_path,
+            "algorithm": self.algorithm,
+            "weak_algorithm": self.weak_algorithm,
             "chunks": chunk_info,
             "hashes": hashes
         }
+        if use_cache:
+            self.cache.put(file_path, params, chunk_map, identity)
+        return chunk_map
+
+    def update_chunk_map(self, old_map: Dict[str, Any], file_path: str,
+                         edits: Optional[List[Tuple[int, int, int]]] = None) -> Dict[str, Any]:
+        """
+        Chunk map of file_path, a new version of the file old_map describes
+        (chunked with the same parameters), re-chunking only around the
+        changes. edits are (old_offset, old_len, new_len) ranges in old-file
+        coordinates; without them an append is detected, and anything else
+        falls back to a full pass.
+        """
+        if old_map.get("algorithm", "sha256") != self.algorithm or \
+                old_map.get("weak_algorithm") != self.weak_algorithm:
+            raise ValueError("Previous chunk map was hashed with different algorithms")
+        if edits is None:
+            edits = self.detect_append(old_map, file_path)
+        if edits is None:
+            chunk_info = list(self.iter_chunk_records(file_path))
+        else:
+            chunk_info = self._rechunk_records(old_map, file_path, edits)
+        return {
+            "filepath": file_path,
+            "algorithm": self.algorithm,
+            "weak_algorithm": self.weak_algorithm,
+            "chunks": chunk_info,
+            "hashes": [c.hash for c in chunk_info]
+        }
+
+    def detect_append(self, old_map: Dict[str, Any], file_path: str) -> Optional[List[Tuple[int, int, int]]]:
+        """
+        [(old_size, 0, appended)] if file_path is the old file with bytes
+        appended, else None. Every chunk of the old map is re-hashed against
+        its strong digest, so an edit anywhere in the prefix falls back to a
+        full pass; this skips chunking the prefix, not reading it. Two-tier
+        maps only carry weak hashes, which cannot prove the prefix
+        unchanged, so they always get a full pass.
+        """
+        chunks = old_map["chunks"]
+        old_size = sum(c["size"] for c in chunks)
+        new_size = os.path.getsize(file_path)
+        if not chunks or new_size < old_size or any(c["hash"] is None for c in chunks):
+            return None
+
+        with mapped_file(file_path) as data:
+            view = memoryview(data)
+            try:
+                for c in chunks:
+                    with view[c["offset"]:c["offset"] + c["size"]] as piece:
+                        if self.hash_bytes(piece) != c["hash"]:
+                            return None
+            finally:
+                view.release()
+        return [(old_size, 0, new_size - old_size)]
+
+    def _rechunk_records(self, old_map: Dict[str, Any], file_path: str,
+                         edits: List[Tuple[int, int, int]]) -> List[ChunkRecord]:
+        """Records for file_path, reusing old_map's digests wherever the chunker reuses its boundaries"""
+        old_chunks = old_map["chunks"]
+        old_size = sum(c["size"] for c in old_chunks)
+        records = []
+        # only the re-chunked (and re-hashed) stretches count as work done
+        with mapped_file(file_path) as data, metrics.stage("chunk") as stage:
+            view = memoryview(data)
+            fresh = []
+            try:
+                bounds = [(c["offset"], c["size"]) for c in old_chunks]
+                for i, (start, end, old_idx) in enumerate(self.chunker.rechunk(data, bounds, edits, old_size)):
+                    if old_idx is not None:
+                        oc = old_chunks[old_idx]
+                        chunk_hash, weak = oc["hash"], oc.get("weak")
+                    else:
+                        chunk_hash, weak = self._digest(view[start:end])
+                        fresh.append(end - start)
+                    records.append(ChunkRecord(i, start, end - start, chunk_hash, file_path, weak))
+            finally:
+                view.release()
+            stage.add(sum(fresh), len(fresh))
+            stage.chunk_sizes = fresh
+        return records
 
     def line_based_chunks(self, file_path: str) -> List[Tuple[int, int]]:
         chunks = []
@@ -0,0 +1,154 @@
+import io
+import os
+import time
+import uuid
+import hashlib
+import logging
+from typing import Dict, Any, List, Optional, Callable, Union
+
+from .chunker import StreamChunker
+from .chunkmap import ChunkRecord
+from .hasher import FileHasher
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class ChunkingSink:
+    """
+    Writable, readable upload target that chunks and hashes the data while
+    it streams in, so the finished upload never has to be re-read.
+
+    Small uploads stay in memory; once spool_bytes is exceeded the data
+    goes to a temporary file in spool_dir, which finalize() renames into
+    place (no second copy). finalize() also hands the chunk map to the
+    hasher's signature cache, so a later create_chunk_map() of the saved
+    file is a cache hit; the map carries the SHA-256 of the whole upload.
+
+    hasher may also be a callable taking the first spool_bytes of the
+    upload and returning the hasher to use, so the chunking parameters can
+    be tuned to the content; chunking then starts once that head is in.
+    """
+
+    def __init__(self, hasher: Union[FileHasher, Callable[[bytes], FileHasher]], spool_dir: str,
+                 spool_bytes: int = 1024 * 1024):
+        self.spool_dir = spool_dir
+        self.spool_bytes = spool_bytes
+        self.records: List[ChunkRecord] = []
+        self.hasher: Optional[FileHasher] = None
+        self.stream: Optional[StreamChunker] = None
+        self._choose_hasher = None
+        if isinstance(hasher, FileHasher):
+            self._start(hasher)
+        else:
+            self._choose_hasher = hasher
+        self._fp = io.BytesIO()
+        self._sha256 = hashlib.sha256()   # whole upload, for plan / patch verification
+        self._spool_path: Optional[str] = None
+        self._finished = False
+        self._feed_seconds = 0.0   # chunking + hashing, hashing alone below
+        self._hash_seconds = 0.0
+
+    def _start(self, hasher: FileHasher) -> None:
+        self.hasher = hasher
+        self.stream = StreamChunker(hasher.chunker, self._on_chunk)
+
+    def _start_deferred(self) -> None:
+        """Pick the hasher from the buffered head and chunk it"""
+        head = self._fp.getvalue()
+        self._start(self._choose_hasher(head))
+        self._feed(head)
+
+    def _feed(self, data) -> None:
+        t = time.perf_counter()
+        self.stream.feed(data)
+        self._feed_seconds += time.perf_counter() - t
+
+    def _on_chunk(self, offset: int, chunk: memoryview) -> None:
+        t = time.perf_counter()
+        strong, weak = self.hasher._digest(chunk)
+        self._hash_seconds += time.perf_counter() - t
+        self.records.append(ChunkRecord(len(self.records), offset, len(chunk), strong, None, weak))
+
+    def _rollover(self) -> None:
+        os.makedirs(self.spool_dir, exist_ok=True)
+        self._spool_path = os.path.join(self.spool_dir, f"upload_{uuid.uuid4().hex}.part")
+        spooled = open(self._spool_path, "w+b")
+        spooled.write(self._fp.getbuffer())
+        self._fp = spooled
+
+    # -- file-like interface used by the multipart parser --------------------
+
+    def write(self, data) -> int:
+        if self._finished:
+            raise ValueError("Upload already finalized")
+        self._fp.write(data)
+        self._sha256.update(data)
+        if self.stream is not None:
+            self._feed(data)
+        if self._spool_path is None and self._fp.tell() > self.spool_bytes:
+            if self.stream is None:
+                self._start_deferred()
+            self._rollover()
+        return len(data)
+
+    def seek(self, offset: int, whence: int = 0) -> int:
+        return self._fp.seek(offset, whence)
+
+    def tell(self) -> int:
+        return self._fp.tell()
+
+    def read(self, size: int = -1) -> bytes:
+        return self._fp.read(size)
+
+    def readline(self, size: int = -1) -> bytes:
+        return self._fp.readline(size)
+
+    def flush(self) -> None:
+        self._fp.flush()
+
+    def close(self) -> None:
+        """Discard the upload unless it was finalized"""
+        self._fp.close()
+        if self._spool_path and os.path.exists(self._spool_path):
+            os.remove(self._spool_path)
+
+    # -- result ----------------------------------------------------------------
+
+    def finalize(self, dest_path: str) -> Dict[str, Any]:
+        """Move the upload to dest_path and return its chunk map"""
+        if not self._finished:
+            if self.stream is None:
+                self._start_deferred()
+            t = time.perf_counter()
+            self.stream.finish()
+            self._feed_seconds += time.perf_counter() - t
+            self._finished = True
+            metrics.observe("chunk", self._feed_seconds - self._hash_seconds, self.stream.size,
+                            len(self.records), (r.size for r in self.records))
+            metrics.observe("hash", self._hash_seconds, self.stream.size, len(self.records))
+
+        if self._spool_path is None:
+            with open(dest_path, "wb") as out:
+                out.write(self._fp.getbuffer())
+        else:
+            self._fp.flush()
+            self._fp.close()
+            os.replace(self._spool_path, dest_path)
+            self._spool_path = None
+            self._fp = open(dest_path, "rb")
+
+        for record in self.records:
+            record.filepath = dest_path
+        chunk_map = {
+            "filepath": dest_path,
+            "algorithm": self.hasher.algorithm,
+            "weak_algorithm": self.hasher.weak_algorithm,
+            "chunks": self.records,
+            "hashes": [r.hash for r in self.records],
+            "sha256": self._sha256.hexdigest()
+        }
+        if self.hasher.cache is not None:
+            self.hasher.cache.put(dest_path, self.hasher.signature_params(), chunk_map)
+        logger.info(f"Ingested {dest_path}: {self.stream.size} bytes, {len(self.records)} chunks")
+        return chunk_map
@@ -0,0 +1,144 @@
+import time
+import uuid
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+JOB_STATES = ('queued', 'running', 'done', 'failed')
+
+
+class JobQueueFull(Exception):
+    """Raised by JobManager.submit when the backlog limit is reached"""
+
+
+class JobManager:
+    """
+    Background execution of long comparisons.
+
+    Jobs run on a bounded thread pool; jobs below small_job_bytes get a
+    separate lane so quick comparisons are not stuck behind large ones.
+    Each job carries a progress dict the task updates through the callback
+    it is handed, and its result is kept (for the most recent keep_finished
+    jobs) until a client fetches it.
+    """
+
+    def __init__(self, max_workers: int = 2, small_workers: int = 2,
+                 small_job_bytes: int = 8 * 1024 * 1024, max_queued: int = 64,
+                 keep_finished: int = 100):
+        self.small_job_bytes = small_job_bytes
+        self.max_queued = max_queued
+        self.keep_finished = keep_finished
+        self._pool = ThreadPoolExecutor(max(1, max_workers), thread_name_prefix="job")
+        self._small_pool = ThreadPoolExecutor(max(1, small_workers), thread_name_prefix="job-small")
+        self._jobs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+
+    def submit(self, fn: Callable[..., Any], size: int = 0, **kwargs) -> str:
+        """
+        Queue fn(progress=callback, **kwargs) and return the job id. size
+        (bytes to process) picks the lane and seeds progress["bytes_total"].
+        """
+        with self._lock:
+            queued = sum(1 for j in self._jobs.values() if j["status"] == "queued")
+            if queued >= self.max_queued:
+                raise JobQueueFull(f"{queued} jobs already queued")
+            job_id = uuid.uuid4().hex
+            self._jobs[job_id] = {
+                "id": job_id,
+                "status": "queued",
+                "lane": "small" if size <= self.small_job_bytes else "large",
+                "created": time.time(),
+                "started": None,
+                "finished": None,
+                "progress": {"stage": "queued", "bytes_total": size,
+                             "bytes_chunked": 0, "bytes_hashed": 0},
+                "result": None,
+                "error": None
+            }
+        pool = self._small_pool if size <= self.small_job_bytes else self._pool
+        pool.submit(self._run, job_id, fn, kwargs)
+        return job_id
+
+    def _run(self, job_id: str, fn: Callable[..., Any], kwargs: Dict[str, Any]) -> None:
+        self._update(job_id, status="running", started=time.time())
+
+        def progress(stage: str, **counters) -> None:
+            with self._changed:
+                p = self._jobs[job_id]["progress"]
+                p["stage"] = stage
+                p.update(counters)
+                self._changed.notify_all()
+
+        try:
+            result = fn(progress=progress, **kwargs)
+            self._update(job_id, status="done", result=result, finished=time.time(),
+                         progress_stage="done")
+        except Exception as e:
+            logger.error(f"Job {job_id} failed: {e}", exc_info=True)
+            self._update(job_id, status="failed", error=str(e), finished=time.time(),
+                         progress_stage="failed")
+        self._prune()
+
+    def _update(self, job_id: str, progress_stage: Optional[str] = None, **fields) -> None:
+        with self._changed:
+            job = self._jobs[job_id]
+            job.update(fields)
+            if progress_stage:
+                job["progress"]["stage"] = progress_stage
+            self._changed.notify_all()
+
+    def _prune(self) -> None:
+        """Forget the oldest finished jobs beyond keep_finished"""
+        with self._lock:
+            finished = [k for k, j in self._jobs.items() if j["status"] in ("done", "failed")]
+            for k in finished[:max(0, len(finished) - self.keep_finished)]:
+                del self._jobs[k]
+
+    def status(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Job state without its result, or None for unknown ids"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            snapshot = {k: v for k, v in job.items() if k != "result"}
+            snapshot["progress"] = dict(job["progress"])
+        return snapshot
+
+    def result(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Status, progress, result and error of a job, or None for unknown ids"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            return {"status": job["status"], "progress": dict(job["progress"]),
+                    "result": job["result"], "error": job["error"]}
+
+    def wait(self, job_id: str, since: Optional[Dict[str, Any]] = None,
+             timeout: float = 15.0) -> Optional[Dict[str, Any]]:
+        """
+        Block until the job's status or progress differs from `since` (a
+        previous status() snapshot) or timeout passes; returns the new
+        snapshot. Used to stream progress without busy polling.
+        """
+        deadline = time.time() + timeout
+        with self._changed:
+            while True:
+                job = self._jobs.get(job_id)
+                if job is None:
+                    return None
+                if since is None or job["status"] != since["status"] or job["progress"] != since["progress"]:
+                    break
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                self._changed.wait(remaining)
+        return self.status(job_id)
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._pool.shutdown(wait=wait)
+        self._small_pool.shutdown(wait=wait)
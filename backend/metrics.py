@@ -0,0 +1,284 @@
+import os
+import sys
+import time
+import threading
+from contextlib import contextmanager
+from typing import Dict, Any, List, Optional, Iterable
+
+STAGES = ('chunk', 'hash', 'diff', 'plan', 'apply')
+
+# stage duration buckets (seconds) for the Prometheus histogram
+DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0)
+# chunk sizes are bucketed by powers of two: le=2**k for k in this range
+CHUNK_SIZE_EXPONENTS = range(3, 25)   # 8 B .. 16 MiB
+
+
+def peak_rss() -> int:
+    """Process resident-set high-water mark in bytes"""
+    try:
+        import resource
+    except ImportError:   # not on Windows
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _traced_memory():
+    """(current, peak) from tracemalloc while it traces, else None (without importing it)"""
+    tracemalloc = sys.modules.get("tracemalloc")
+    if tracemalloc is None or not tracemalloc.is_tracing():
+        return None
+    return tracemalloc.get_traced_memory()
+
+
+def current_rss() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return 0
+
+
+class Stage:
+    """Counters one `with metrics.stage(...)` block fills in"""
+    __slots__ = ("name", "bytes", "chunks", "chunk_sizes", "seconds")
+
+    def __init__(self, name: str, nbytes: int = 0):
+        self.name = name
+        self.bytes = nbytes
+        self.chunks = 0
+        self.chunk_sizes: Optional[Iterable[int]] = None
+        self.seconds: Optional[float] = None
+
+    def add(self, nbytes: int = 0, chunks: int = 0) -> None:
+        self.bytes += nbytes
+        self.chunks += chunks
+
+
+class Metrics:
+    """
+    Process-wide counters for the pipeline stages (chunk, hash, diff, plan,
+    apply): call counts, time, bytes and chunks processed, a duration
+    histogram per stage and a power-of-two histogram of chunk sizes, plus
+    memory high-water marks. Rendered in the Prometheus text format.
+
+    Everything is aggregated when a stage ends, so the per-chunk hot loops
+    only pay for what they already compute.
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stages: Dict[str, Dict[str, Any]] = {}
+            self._chunk_sizes = [0] * (len(CHUNK_SIZE_EXPONENTS) + 1)
+            self._chunk_size_sum = 0
+            self._counters: Dict[str, int] = {}
+            self._traced_peak: Dict[str, int] = {}
+
+    def _stage_entry(self, name: str) -> Dict[str, Any]:
+        entry = self._stages.get(name)
+        if entry is None:
+            entry = self._stages[name] = {"calls": 0, "seconds": 0.0, "bytes": 0, "chunks": 0,
+                                          "buckets": [0] * (len(DURATION_BUCKETS) + 1)}
+        return entry
+
+    def observe(self, name: str, seconds: float, nbytes: int = 0, chunks: int = 0,
+                chunk_sizes: Optional[Iterable[int]] = None) -> None:
+        """Record one run of a stage"""
+        if not self.enabled:
+            return
+        histogram = None
+        if chunk_sizes is not None:
+            histogram, total = self._size_histogram(chunk_sizes)
+        traced = _traced_memory()
+        if traced is not None:
+            traced = traced[1]
+        with self._lock:
+            entry = self._stage_entry(name)
+            entry["calls"] += 1
+            entry["seconds"] += seconds
+            entry["bytes"] += nbytes
+            entry["chunks"] += chunks
+            i = 0
+            while i < len(DURATION_BUCKETS) and seconds > DURATION_BUCKETS[i]:
+                i += 1
+            entry["buckets"][i] += 1
+            if histogram is not None:
+                for k, n in enumerate(histogram):
+                    self._chunk_sizes[k] += n
+                self._chunk_size_sum += total
+            if traced is not None:
+                self._traced_peak[name] = max(self._traced_peak.get(name, 0), traced)
+
+    @staticmethod
+    def _size_histogram(sizes: Iterable[int]):
+        lo = CHUNK_SIZE_EXPONENTS.start
+        top = len(CHUNK_SIZE_EXPONENTS)
+        counts = [0] * (top + 1)
+        total = 0
+        for size in sizes:
+            # smallest k with size <= 2**k, shifted to a bucket index
+            k = (size - 1).bit_length() - lo if size > 1 else 0
+            counts[min(max(k, 0), top)] += 1
+            total += size
+        return counts, total
+
+    @contextmanager
+    def stage(self, name: str, nbytes: int = 0):
+        """
+        Time a block as one run of stage `name`. The yielded Stage takes
+        bytes/chunk counts (stage.add) and chunk sizes (stage.chunk_sizes)
+        discovered while it runs.
+        """
+        st = Stage(name, nbytes)
+        if not self.enabled:
+            yield st
+            return
+        start = time.perf_counter()
+        try:
+            yield st
+        finally:
+            st.seconds = time.perf_counter() - start
+            self.observe(name, st.seconds, st.bytes, st.chunks, st.chunk_sizes)
+
+    def inc(self, name: str, value: int = 1) -> None:
+        """Bump a plain counter (cache hits and the like)"""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "stages": {k: {f: (list(v) if f == "buckets" else v) for f, v in e.items()}
+                           for k, e in self._stages.items()},
+                "chunk_sizes": list(self._chunk_sizes),
+                "chunk_size_sum": self._chunk_size_sum,
+                "counters": dict(self._counters),
+                "traced_peak": dict(self._traced_peak),
+                "peak_rss": peak_rss(),
+                "rss": current_rss()
+            }
+
+    def render(self, prefix: str = "fcs") -> str:
+        """Prometheus text exposition format"""
+        snap = self.snapshot()
+        lines: List[str] = []
+
+        def family(name: str, kind: str, help_text: str) -> str:
+            full = f"{prefix}_{name}"
+            lines.append(f"# HELP {full} {help_text}")
+            lines.append(f"# TYPE {full} {kind}")
+            return full
+
+        stages = snap["stages"]
+        for field, kind, help_text in (
+                ("calls", "stage_runs_total", "Completed runs of each pipeline stage"),
+                ("seconds", "stage_seconds_total", "Time spent in each pipeline stage"),
+                ("bytes", "stage_bytes_total", "Bytes processed by each pipeline stage"),
+                ("chunks", "stage_chunks_total", "Chunks processed by each pipeline stage")):
+            name = family(kind, "counter", help_text)
+            for stage, e in sorted(stages.items()):
+                value = round(e[field], 6) if field == "seconds" else e[field]
+                lines.append(f'{name}{{stage="{stage}"}} {value}')
+
+        name = family("stage_duration_seconds", "histogram", "Duration of single stage runs")
+        for stage, e in sorted(stages.items()):
+            cumulative = 0
+            for bound, n in zip(DURATION_BUCKETS + ("+Inf",), e["buckets"]):
+                cumulative += n
+                lines.append(f'{name}_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+            lines.append(f'{name}_sum{{stage="{stage}"}} {round(e["seconds"], 6)}')
+            lines.append(f'{name}_count{{stage="{stage}"}} {e["calls"]}')
+
+        name = family("chunk_size_bytes", "histogram", "Sizes of the chunks produced by the chunker")
+        cumulative = 0
+        bounds = [2 ** k for k in CHUNK_SIZE_EXPONENTS] + ["+Inf"]
+        for bound, n in zip(bounds, snap["chunk_sizes"]):
+            cumulative += n
+            lines.append(f'{name}_bucket{{le="{bound}"}} {cumulative}')
+        lines.append(f"{name}_sum {snap['chunk_size_sum']}")
+        lines.append(f"{name}_count {cumulative}")
+
+        for counter, value in sorted(snap["counters"].items()):
+            name = family(f"{counter}_total", "counter", counter.replace("_", " ").capitalize())
+            lines.append(f"{name} {value}")
+
+        if snap["traced_peak"]:
+            name = family("stage_traced_peak_bytes", "gauge",
+                          "Python heap high-water mark seen at the end of a stage (tracemalloc)")
+            for stage, value in sorted(snap["traced_peak"].items()):
+                lines.append(f'{name}{{stage="{stage}"}} {value}')
+
+        name = family("process_peak_resident_memory_bytes", "gauge", "Resident set high-water mark")
+        lines.append(f"{name} {snap['peak_rss']}")
+        name = family("process_resident_memory_bytes", "gauge", "Current resident set size")
+        lines.append(f"{name} {snap['rss']}")
+        return "\n".join(lines) + "\n"
+
+
+# shared by every hasher/differ/syncer in the process
+metrics = Metrics()
+
+
+class RequestProfiler:
+    """
+    Optional per-request profiling: mode 'cpu' runs cProfile on the calling
+    thread, 'memory' turns on tracemalloc (process-wide, so only one memory
+    profile runs at a time). stop() returns a plain-text report.
+    """
+    MODES = ('cpu', 'memory')
+    _memory_lock = threading.Lock()
+
+    def __init__(self, mode: str, limit: int = 40):
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown profile mode: {mode!r} (expected one of {self.MODES})")
+        self.mode = mode
+        self.limit = limit
+        self._profile = None
+        self._started = None
+
+    def start(self) -> bool:
+        """False when a memory profile is already running elsewhere"""
+        # imported here: the profilers are slow to import and rarely used
+        import cProfile
+        import tracemalloc
+        if self.mode == "memory":
+            if not self._memory_lock.acquire(blocking=False):
+                return False
+            if tracemalloc.is_tracing():
+                self._memory_lock.release()
+                return False
+            tracemalloc.start(10)
+        else:
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        self._started = time.perf_counter()
+        return True
+
+    def stop(self) -> str:
+        import io
+        import pstats
+        import tracemalloc
+        elapsed = time.perf_counter() - self._started
+        out = io.StringIO()
+        out.write(f"# {self.mode} profile, {elapsed:.3f}s wall\n")
+        if self.mode == "cpu":
+            self._profile.disable()
+            pstats.Stats(self._profile, stream=out).sort_stats("cumulative").print_stats(self.limit)
+            return out.getvalue()
+        try:
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+            self._memory_lock.release()
+        out.write(f"# traced current={current} peak={peak}\n")
+        for stat in snapshot.statistics("lineno")[:self.limit]:
+            out.write(f"{stat}\n")
+        return out.getvalue()
@@ -0,0 +1,335 @@
+import io
+import os
+import time
+import zlib
+import base64
+import hashlib
+import tempfile
+from typing import Dict, Any, List, BinaryIO, Optional, Iterator, Tuple
+
+from .chunker import copy_range, write_all
+from .metrics import metrics
+
+# Patch layout (all integers are unsigned LEB128 varints unless noted):
+#
+#   magic "FCSP" | version u8 | codec u8 | flags u8
+#   target_size | op_count | op_section_len
+#   [sha256 of target, 32 bytes, if FLAG_DIGEST]
+#   op section:      COPY   = 0x01 old_offset length
+#                    INSERT = 0x02 length
+#   literal section: all INSERT payloads back to back, compressed with codec
+MAGIC = b"FCSP"
+VERSION = 1
+
+CODECS = {"none": 0, "zlib": 1, "zstd": 2}
+CODEC_NAMES = {v: k for k, v in CODECS.items()}
+
+FLAG_DIGEST = 0x01
+
+OP_COPY = 0x01
+OP_INSERT = 0x02
+
+_BLOCK = 1 << 20
+
+
+def encode_varint(value: int) -> bytes:
+    if value < 0:
+        raise ValueError("varints are unsigned")
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def read_varint(fp: BinaryIO) -> int:
+    result = 0
+    shift = 0
+    while True:
+        b = fp.read(1)
+        if not b:
+            raise ValueError("Truncated patch: unexpected end of varint")
+        result |= (b[0] & 0x7F) << shift
+        if not b[0] & 0x80:
+            return result
+        shift += 7
+
+
+def default_codec() -> str:
+    try:
+        import zstandard  # noqa: F401
+        return "zstd"
+    except ImportError:
+        return "zlib"
+
+
+def _compressor(codec: str, level: Optional[int]):
+    if codec == "zlib":
+        return zlib.compressobj(6 if level is None else level)
+    if codec == "zstd":
+        import zstandard
+        return zstandard.ZstdCompressor(level=3 if level is None else level).compressobj()
+    return None
+
+
+class _LiteralReader:
+    """File-like view over the (possibly compressed) literal section"""
+
+    def __init__(self, fp: BinaryIO, codec: str):
+        self.fp = fp
+        self.codec = codec
+        self.buf = bytearray()
+        self.pos = 0   # read position in buf; consumed bytes are dropped once per block
+        self.eof = False
+        if codec == "zlib":
+            self.decomp = zlib.decompressobj()
+        elif codec == "zstd":
+            import zstandard
+            self.fp = zstandard.ZstdDecompressor().stream_reader(fp)
+
+    def _fill(self) -> None:
+        try:
+            self._fill_block()
+        except zlib.error as e:
+            raise ValueError(f"Corrupt patch literal section: {e}")
+
+    def _fill_block(self) -> None:
+        # never inflate more than one block at a time
+        if self.pos:
+            del self.buf[:self.pos]
+            self.pos = 0
+        if self.codec == "zlib":
+            if self.decomp.unconsumed_tail:
+                self.buf += self.decomp.decompress(self.decomp.unconsumed_tail, _BLOCK)
+                return
+            raw = self.fp.read(_BLOCK)
+            if not raw:
+                self.buf += self.decomp.flush()
+                self.eof = True
+                return
+            self.buf += self.decomp.decompress(raw, _BLOCK)
+            return
+
+        raw = self.fp.read(_BLOCK)
+        if not raw:
+            self.eof = True
+        self.buf += raw
+
+    def read(self, n: int) -> bytes:
+        while len(self.buf) - self.pos < n and not self.eof:
+            self._fill()
+        if len(self.buf) - self.pos < n:
+            raise ValueError("Truncated patch: literal section too short")
+        out = bytes(self.buf[self.pos:self.pos + n])
+        self.pos += n
+        return out
+
+
+def file_sha256(file_path: str) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(_BLOCK), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _plan_ops(operations: List[Dict[str, Any]]) -> Iterator[Tuple[int, Any]]:
+    """(OP_COPY, (old_offset, size)) / (OP_INSERT, bytes) from sync plan operations"""
+    for op in operations:
+        t = op["type"]
+        if t == "REMOVE":
+            continue
+        if t == "COPY":
+            yield OP_COPY, (op["old_offset"], op["size"])
+        else:
+            yield OP_INSERT, base64.b64decode(op["data"])
+
+
+def encode_plan(plan: Dict[str, Any], out: BinaryIO, codec: Optional[str] = None,
+                level: Optional[int] = None, target_sha256: Optional[str] = None) -> int:
+    """
+    Write a sync plan (copy-reference or inline) as a binary patch.
+    Adjacent literals are merged into one INSERT. Returns bytes written.
+    """
+    codec = codec or default_codec()
+    if codec not in CODECS:
+        raise ValueError(f"Unknown patch codec: {codec!r}")
+
+    ops = bytearray()
+    op_count = 0
+    target_size = 0
+    comp = _compressor(codec, level)
+
+    with tempfile.SpooledTemporaryFile(max_size=8 * _BLOCK) as literals:
+        pending = 0
+
+        def flush_insert():
+            nonlocal pending, op_count
+            if pending:
+                ops.append(OP_INSERT)
+                ops.extend(encode_varint(pending))
+                op_count += 1
+                pending = 0
+
+        for kind, value in _plan_ops(plan["operations"]):
+            if kind == OP_COPY:
+                flush_insert()
+                old_offset, size = value
+                ops.append(OP_COPY)
+                ops.extend(encode_varint(old_offset))
+                ops.extend(encode_varint(size))
+                op_count += 1
+                target_size += size
+            else:
+                literals.write(comp.compress(value) if comp else value)
+                pending += len(value)
+                target_size += len(value)
+        flush_insert()
+        if comp:
+            literals.write(comp.flush())
+
+        header = bytearray(MAGIC)
+        header.append(VERSION)
+        header.append(CODECS[codec])
+        header.append(FLAG_DIGEST if target_sha256 else 0)
+        header.extend(encode_varint(target_size))
+        header.extend(encode_varint(op_count))
+        header.extend(encode_varint(len(ops)))
+        if target_sha256:
+            header.extend(bytes.fromhex(target_sha256))
+
+        out.write(header)
+        out.write(ops)
+        total = len(header) + len(ops)
+        literals.seek(0)
+        while True:
+            block = literals.read(_BLOCK)
+            if not block:
+                break
+            out.write(block)
+            total += len(block)
+    return total
+
+
+def read_header(fp: BinaryIO) -> Dict[str, Any]:
+    if fp.read(4) != MAGIC:
+        raise ValueError("Not a patch file (bad magic)")
+    fixed = fp.read(3)
+    if len(fixed) != 3:
+        raise ValueError("Truncated patch header")
+    version, codec_id, flags = fixed
+    if version != VERSION:
+        raise ValueError(f"Unsupported patch version: {version}")
+    if codec_id not in CODEC_NAMES:
+        raise ValueError(f"Unknown patch codec id: {codec_id}")
+    header = {
+        "version": version,
+        "codec": CODEC_NAMES[codec_id],
+        "target_size": read_varint(fp),
+        "op_count": read_varint(fp),
+        "op_section_len": read_varint(fp),
+        "target_sha256": None
+    }
+    if flags & FLAG_DIGEST:
+        digest = fp.read(32)
+        if len(digest) != 32:
+            raise ValueError("Truncated patch header")
+        header["target_sha256"] = digest.hex()
+    return header
+
+
+def iter_patch(fp: BinaryIO) -> Iterator[Tuple[int, Any]]:
+    """
+    Stream a patch: yields the header dict first, then (OP_COPY, (old_offset, size))
+    and (OP_INSERT, (size, reader)) items; reader.read(size) returns the literal.
+    Only the op section (a few bytes per op) is held in memory.
+    """
+    header = read_header(fp)
+    yield header
+    op_section = fp.read(header["op_section_len"])
+    if len(op_section) != header["op_section_len"]:
+        raise ValueError("Truncated patch: op section too short")
+    ops = io.BytesIO(op_section)
+    literals = _LiteralReader(fp, header["codec"])
+    for _ in range(header["op_count"]):
+        code = ops.read(1)
+        if code == bytes([OP_COPY]):
+            yield OP_COPY, (read_varint(ops), read_varint(ops))
+        elif code == bytes([OP_INSERT]):
+            yield OP_INSERT, (read_varint(ops), literals)
+        else:
+            raise ValueError(f"Bad patch opcode: {code!r}")
+
+
+def decode_patch(fp: BinaryIO) -> Dict[str, Any]:
+    """Decode a patch back into a copy-reference sync plan"""
+    items = iter_patch(fp)
+    header = next(items)
+    operations = []
+    offset = 0
+    for kind, value in items:
+        if kind == OP_COPY:
+            old_offset, size = value
+            operations.append({"type": "COPY", "offset": offset, "old_offset": old_offset, "size": size})
+        else:
+            size, reader = value
+            operations.append({"type": "ADD", "offset": offset, "size": size,
+                               "data": base64.b64encode(reader.read(size)).decode("utf-8")})
+        offset += size
+    return {"format": "copy", "operations": operations, "target_size": header["target_size"],
+            "target_sha256": header["target_sha256"]}
+
+
+def apply_patch(fp: BinaryIO, old_file: str, output_path: str, verify: bool = True) -> int:
+    """
+    Apply a binary patch read sequentially from fp (a file or request
+    stream). Copies go straight from old_file to the output, literals are
+    decompressed a block at a time, and the result is renamed into place
+    only once its size (and digest, when the patch carries one) match.
+    """
+    started = time.perf_counter()
+    # a private temp file: concurrent applies to the same output must not share one
+    dst_fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(output_path)),
+                                   prefix=f".{os.path.basename(output_path)}.", suffix=".tmp")
+    os.fchmod(dst_fd, 0o644)
+    written = 0
+    src_fd = None
+    try:
+        items = iter_patch(fp)
+        header = next(items)
+        for kind, value in items:
+            if kind == OP_COPY:
+                old_offset, size = value
+                if src_fd is None:
+                    src_fd = os.open(old_file, os.O_RDONLY)
+                copy_range(src_fd, dst_fd, old_offset, size)
+            else:
+                size, reader = value
+                remaining = size
+                while remaining:
+                    block = reader.read(min(remaining, _BLOCK))
+                    write_all(dst_fd, block)
+                    remaining -= len(block)
+            written += size
+        os.close(dst_fd)
+        dst_fd = None
+
+        if written != header["target_size"]:
+            raise ValueError("Patched file has the wrong size")
+        if verify and header["target_sha256"]:
+            if file_sha256(tmp) != header["target_sha256"]:
+                raise ValueError("Patched file does not match the patch digest")
+        os.replace(tmp, output_path)
+    finally:
+        if dst_fd is not None:
+            os.close(dst_fd)
+        if src_fd is not None:
+            os.close(src_fd)
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    metrics.observe("apply", time.perf_counter() - started, written)
+    return written
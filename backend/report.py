@@ -0,0 +1,155 @@
+import os
+import base64
+from contextlib import ExitStack
+from typing import Dict, Any, List, Optional, Iterator
+
+from .chunkmap import ChunkRecord, payload_reader
+
+DETAIL_LEVELS = ('summary', 'changes', 'full')
+
+
+def snippet(raw: bytes, truncated: bool = False) -> str:
+    """One-line preview of a chunk: newlines shown as ↵, an ellipsis if it was cut"""
+    text = raw.decode("utf-8", errors="replace").replace("\r\n", "\n").replace("\n", "↵").strip()
+    return text + " …" if truncated else text
+
+
+def _b64_prefix(data: str, limit: int) -> bytes:
+    """The first limit bytes of a base64 payload, decoding only what they need"""
+    return base64.b64decode(data[:(limit + 2) // 3 * 4])[:limit]
+
+
+class ReportWriter:
+    """
+    Plain-text analysis report of a comparison, produced line by line so it
+    can be streamed to a file (write) or a response (lines) without holding
+    it in memory.
+
+    detail: 'summary' (totals only), 'changes' (plus the added, modified and
+    removed chunks) or 'full' (plus every chunk of both files and every plan
+    operation). Chunk previews are cut to snippet_bytes (None: whole chunk)
+    and each listing to max_entries lines.
+    """
+
+    def __init__(self, old_fn: str, new_fn: str, diff_data: Dict[str, Any], sync_plan: Dict[str, Any],
+                 detail: str = 'changes', snippet_bytes: Optional[int] = 80, max_entries: int = 10000):
+        if detail not in DETAIL_LEVELS:
+            raise ValueError(f"Unknown report detail level: {detail!r} (expected one of {DETAIL_LEVELS})")
+        self.old_fn = old_fn
+        self.new_fn = new_fn
+        self.diff_data = diff_data
+        self.sync_plan = sync_plan
+        self.detail = detail
+        self.snippet_bytes = snippet_bytes
+        self.max_entries = max_entries
+
+    def lines(self) -> Iterator[str]:
+        yield from self._summary()
+        if self.detail == 'summary':
+            return
+        with ExitStack() as stack:
+            read = payload_reader(stack)
+            if self.detail == 'full':
+                yield from self._chunks(self.diff_data.get("old_chunks", []), "Old File Chunks", read)
+                yield from self._chunks(self.diff_data.get("new_chunks", []), "New File Chunks", read)
+                yield from self._operations(self.sync_plan["operations"], "Synchronization Plan", read)
+            else:
+                yield from self._operations(self.sync_plan.get("changes", []), "Changes", read)
+
+    def write(self, path: str) -> int:
+        """Stream the report to path (renamed into place when complete); returns its size"""
+        tmp = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                for line in self.lines():
+                    f.write(line)
+                    f.write("\n")
+                size = f.tell()
+            os.replace(tmp, path)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        return size
+
+    # -- sections ------------------------------------------------------------
+
+    def _summary(self) -> Iterator[str]:
+        yield f"Old File: {self.old_fn}"
+        yield f"New File: {self.new_fn}"
+        yield "=" * 50
+
+        s = self.diff_data["summary"]
+        yield "=== Summary ==="
+        yield f"Total Chunks : {s['total_chunks']}"
+        yield f"Unchanged    : {s['unchanged']}"
+        yield f"Moved        : {s.get('moved', 0)}"
+        yield f"Added        : {s['added']} ({s['bytes_added']} bytes)"
+        yield f"Removed      : {s['removed']} ({s['bytes_removed']} bytes)"
+        yield f"Modified     : {s['modified']}"
+        yield f"Change%      : {s['changed_percent']:.1f}%"
+        c = self.diff_data.get("chunking")
+        if c:
+            yield (f"Chunking     : avg {c['avg_chunk_size']} (min {c['min_chunk_size']}, "
+                   f"max {c['max_chunk_size']}, window {c['window_size']}), {c.get('mode', 'fixed')}")
+        yield ""
+
+        ops = self.sync_plan["operations"]
+        by_type: Dict[str, List[int]] = {}
+        for op in ops:
+            entry = by_type.setdefault(op["type"], [0, 0])
+            entry[0] += 1
+            entry[1] += op["size"]
+        yield "=== Synchronization Plan ==="
+        yield f"Total Ops : {len(ops)}"
+        yield f"Efficiency : {self.sync_plan['efficiency']:.1f}%"
+        for t, (count, size) in sorted(by_type.items()):
+            yield f"  {t:9} {count} ops, {size} bytes"
+        yield ""
+
+    def _limited(self, items: List[Any]) -> Iterator[Any]:
+        yield from items[:self.max_entries]
+
+    def _more(self, items: List[Any]) -> Iterator[str]:
+        if len(items) > self.max_entries:
+            yield f"… {len(items) - self.max_entries} more not shown"
+
+    def _head(self, read, chunk) -> bytes:
+        """The first snippet_bytes of a chunk or operation, without reading the rest"""
+        limit = self.snippet_bytes
+        if limit is None or chunk["size"] <= limit:
+            return read(chunk)
+        if not isinstance(chunk, ChunkRecord) and "data" in chunk:
+            return _b64_prefix(chunk["data"], limit)
+        return read({"filepath": chunk["filepath"], "offset": chunk["offset"], "size": limit})
+
+    def _chunks(self, chunks: List[Any], title: str, read) -> Iterator[str]:
+        yield f"=== {title} ==="
+        for c in self._limited(chunks):
+            raw = self._head(read, c)
+            yield f"Chunk {c['index'] + 1}: {snippet(raw, len(raw) < c['size'])}"
+        yield from self._more(chunks)
+        yield ""
+
+    def _operations(self, ops: List[Dict[str, Any]], title: str, read) -> Iterator[str]:
+        yield f"=== {title} ==="
+        old_chunks = self.diff_data.get("old_chunks", [])
+        old_path = old_chunks[0]["filepath"] if old_chunks and "filepath" in old_chunks[0] else None
+        for i, op in enumerate(self._limited(ops), 1):
+            t, off, sz = op["type"], op["offset"], op["size"]
+            if t == "UNCHANGED":
+                yield f"{i}. UNCHANGED @offset {off:<3} size {sz}"
+            elif t == "COPY":
+                yield f"{i}. COPY      @offset {off:<3} size {sz} from old @{op['old_offset']}"
+            elif t == "REMOVE":
+                yield f"{i}. REMOVE    @offset {off:<3} size {sz}"
+                if old_path:
+                    # removed content is only in the old file
+                    raw = self._head(read, {"filepath": old_path, "offset": off, "size": sz})
+                    yield f"    → {snippet(raw, len(raw) < sz)}"
+            else:  # ADD or MODIFY
+                yield f"{i}. {t:8}@offset {off:<3} size {sz}"
+                if op.get("data"):
+                    raw = self._head(read, op)
+                    yield f"    → {snippet(raw, len(raw) < sz)}"
+        yield from self._more(ops)
+        yield ""
@@ -0,0 +1,181 @@
+import os
+import json
+import hashlib
+import logging
+from typing import Dict, Any, Optional
+
+from .chunkmap import ChunkRecord
+
+logger = logging.getLogger(__name__)
+
+CACHE_FORMAT = 2
+
+
+class SignatureCache:
+    """
+    Persistent on-disk store of chunk maps.
+
+    Entries are keyed by the file's identity (absolute path, size, mtime,
+    inode) together with the chunking parameters, so editing the file or
+    changing the chunker simply misses the cache. The store is kept under
+    max_bytes by evicting the least recently used entries.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int = 256 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def file_identity(file_path: str) -> Dict[str, Any]:
+        st = os.stat(file_path)
+        return {
+            "path": os.path.abspath(file_path),
+            "size": st.st_size,
+            "mtime_ns": st.st_mtime_ns,
+            "inode": st.st_ino
+        }
+
+    def _entry_path(self, identity: Dict[str, Any], params: Dict[str, Any]) -> str:
+        key = json.dumps([CACHE_FORMAT, identity, params], sort_keys=True)
+        return os.path.join(self.cache_dir, hashlib.sha256(key.encode()).hexdigest() + ".json")
+
+    def _latest_path(self, file_path: str, params: Dict[str, Any]) -> str:
+        key = json.dumps([CACHE_FORMAT, os.path.abspath(file_path), params], sort_keys=True)
+        return os.path.join(self.cache_dir, hashlib.sha256(key.encode()).hexdigest() + ".latest")
+
+    def _load(self, entry: str, file_path: str, params: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        try:
+            with open(entry, 'r', encoding='utf-8') as f:
+                stored = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if stored.get("params") != params:
+            return None
+
+        # bump recency for LRU eviction
+        try:
+            os.utime(entry)
+        except OSError:
+            pass
+
+        chunks = [ChunkRecord(i, off, size, h, file_path, weak)
+                  for i, (off, size, h, weak) in enumerate(stored["chunks"])]
+        return {
+            "filepath": file_path,
+            "algorithm": params.get("algorithm", "sha256"),
+            "weak_algorithm": params.get("weak_algorithm"),
+            "identity": stored["identity"],
+            "chunks": chunks,
+            "hashes": [c.hash for c in chunks]
+        }
+
+    def get(self, file_path: str, params: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Cached chunk map for file_path, or None if missing or stale"""
+        identity = self.file_identity(file_path)
+        cached = self._load(self._entry_path(identity, params), file_path, params)
+        if cached is None or cached.pop("identity") != identity:
+            return None
+        return cached
+
+    def latest(self, file_path: str, params: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Most recently cached chunk map for this path, whatever version of
+        the file it describes (its "identity" says which); a starting point
+        for incremental re-chunking. The records still point at file_path,
+        so their payload must not be read if the file has changed.
+        """
+        try:
+            with open(self._latest_path(file_path, params), 'r', encoding='utf-8') as f:
+                entry = os.path.join(self.cache_dir, os.path.basename(f.read().strip()))
+        except OSError:
+            return None
+        return self._load(entry, file_path, params)
+
+    def put(self, file_path: str, params: Dict[str, Any], chunk_map: Dict[str, Any],
+            identity: Optional[Dict[str, Any]] = None) -> None:
+        """
+        Store a chunk map. Pass the identity taken before chunking so a file
+        modified in the meantime is not cached under its new identity.
+        """
+        current = self.file_identity(file_path)
+        if identity is not None and identity != current:
+            return
+        identity = current
+        entry = self._entry_path(identity, params)
+        payload = {
+            "identity": identity,
+            "params": params,
+            "chunks": [[c["offset"], c["size"], c["hash"], c.get("weak")] for c in chunk_map["chunks"]]
+        }
+        tmp = f"{entry}.{os.getpid()}.tmp"
+        try:
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(payload, f, separators=(',', ':'))
+            os.replace(tmp, entry)
+            latest = self._latest_path(file_path, params)
+            with open(f"{latest}.{os.getpid()}.tmp", 'w', encoding='utf-8') as f:
+                f.write(os.path.basename(entry))
+            os.replace(f"{latest}.{os.getpid()}.tmp", latest)
+        except OSError:
+            logger.warning(f"Could not write signature cache entry for {file_path}", exc_info=True)
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            return
+
+        self.evict()
+
+    def evict(self) -> None:
+        """
+        Drop least recently used entries until the store fits in max_bytes,
+        along with the per-path .latest pointers to them
+        """
+        entries = []
+        pointers = []
+        total = 0
+        with os.scandir(self.cache_dir) as it:
+            for e in it:
+                if e.name.endswith(".latest"):
+                    pointers.append(e.path)
+                    continue
+                if not e.name.endswith(".json"):
+                    continue
+                try:
+                    st = e.stat()
+                except OSError:
+                    continue
+                entries.append((st.st_mtime_ns, st.st_size, e.path))
+                total += st.st_size
+
+        entries.sort()
+        evicted = set()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+                evicted.add(os.path.basename(path))
+            except OSError:
+                pass
+        if evicted:
+            self._drop_pointers(pointers, evicted)
+
+    @staticmethod
+    def _drop_pointers(pointers, evicted: set) -> None:
+        for path in pointers:
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    target = f.read().strip()
+                if target in evicted:
+                    os.remove(path)
+            except OSError:
+                pass
+
+    def clear(self) -> None:
+        with os.scandir(self.cache_dir) as it:
+            for e in it:
+                if e.name.endswith((".json", ".latest")):
+                    os.remove(e.path)
@@ -0,0 +1,88 @@
+import zlib
+from typing import Dict, List, Tuple, Hashable
+
+import numpy as np
+
+from .fastcdc import GEAR
+
+# 32-bit odd multipliers / offsets for the min-hash permutations (fixed so
+# sketches are comparable across runs)
+_rng = np.random.RandomState(0x5EED)
+_PERM_A = (_rng.randint(1, 1 << 31, size=64, dtype=np.int64) * 2 + 1).astype(np.uint32)
+_PERM_B = _rng.randint(0, 1 << 32, size=64, dtype=np.int64).astype(np.uint32)
+del _rng
+
+
+class SimilarityIndex:
+    """
+    Near-duplicate chunk lookup with super-feature sketches.
+
+    Each chunk is sketched once: min-hashes of its shingle hashes under
+    several permutations (features), grouped into super-features. Two chunks
+    sharing any super-feature are likely to be similar, so a lookup only
+    touches the chunks in a few hash buckets instead of every chunk.
+    """
+
+    def __init__(self, num_super_features: int = 4, features_per_sf: int = 3, shingle_size: int = 8):
+        if num_super_features * features_per_sf > len(_PERM_A):
+            raise ValueError("Too many features requested")
+        if shingle_size & (shingle_size - 1):
+            raise ValueError("shingle_size must be a power of two")
+        self.num_super_features = num_super_features
+        self.features_per_sf = features_per_sf
+        self.shingle_size = shingle_size
+        num_features = num_super_features * features_per_sf
+        self._a = _PERM_A[:num_features, None]
+        self._b = _PERM_B[:num_features, None]
+        self._buckets: List[Dict[int, List[Hashable]]] = [{} for _ in range(num_super_features)]
+
+    def _shingle_hashes(self, data: bytes) -> np.ndarray:
+        """Gear hash of every shingle_size-byte window of data"""
+        if len(data) < self.shingle_size:
+            return np.array([zlib.crc32(data)], dtype=np.uint32)
+
+        h = GEAR[np.frombuffer(data, dtype=np.uint8)]
+        shift = 1
+        while shift < self.shingle_size:
+            h[shift:] += h[:-shift] << shift
+            shift <<= 1
+        return h[self.shingle_size - 1:]
+
+    def sketch(self, data: bytes) -> Tuple[int, ...]:
+        """Super-features of a chunk's content"""
+        if not data:
+            return (0,) * self.num_super_features
+
+        shingles = self._shingle_hashes(data)
+        features = (shingles[None, :] * self._a + self._b).min(axis=1)
+        m = self.features_per_sf
+        return tuple(
+            zlib.crc32(features[i * m:(i + 1) * m].tobytes())
+            for i in range(self.num_super_features)
+        )
+
+    def add(self, key: Hashable, sketch: Tuple[int, ...]) -> None:
+        for bucket, sf in zip(self._buckets, sketch):
+            bucket.setdefault(sf, []).append(key)
+
+    def candidates(self, sketch: Tuple[int, ...]) -> List[Hashable]:
+        """Keys sharing at least one super-feature, most shared first"""
+        counts: Dict[Hashable, int] = {}
+        for bucket, sf in zip(self._buckets, sketch):
+            for key in bucket.get(sf, ()):
+                counts[key] = counts.get(key, 0) + 1
+        return sorted(counts, key=lambda k: -counts[k])
+
+
+def byte_similarity(a: bytes, b: bytes) -> float:
+    """Fraction of positions holding the same byte (relative to the longer chunk)"""
+    max_len = max(len(a), len(b))
+    if not max_len:
+        return 0
+    n = min(len(a), len(b))
+    if not n:
+        return 0.0
+    matches = np.count_nonzero(
+        np.frombuffer(a, dtype=np.uint8, count=n) == np.frombuffer(b, dtype=np.uint8, count=n)
+    )
+    return int(matches) / max_len
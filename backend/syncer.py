@@ -1,45 +1,103 @@
 import os
 import logging
 import base64
-from typing import Dict, Any, List
-from pathlib import Path
-from .chunker import FileChunker
+import hashlib
+from contextlib import ExitStack
+from typing import Dict, Any, List, Optional, Callable
+from .chunker import mapped_file, determine_chunk_size, write_all, copy_range  # noqa: F401 (re-exported)
 from .hasher import FileHasher
 from .differ import FileDiffer
+from .sigcache import SignatureCache
+from .metrics import metrics
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 class FileSyncer:
-    def __init__(self, chunk_size: int = 16):
+    def __init__(self, chunk_size: int = 16, engine: str = 'rolling', similarity_threshold: float = 0.7,
+                 cache: Optional[SignatureCache] = None,
+                 workers: int = 1, batch_size: int = 256, processes: int = 0,
+                 algorithm: str = 'sha256', weak_algorithm: Optional[str] = None,
+                 min_chunk_size: Optional[int] = None, max_chunk_size: Optional[int] = None,
+                 window_size: int = 48, tuning: Optional[str] = None):
+        """
+        chunk_size: average chunk size (with optional min/max/window, see
+        FileChunker). tuning='auto' instead tunes the parameters per
+        analyzed pair from the files' size and content, tuning='trial' by
+        trying candidate sizes on a sample; see autotune.ChunkTuner.
+        """
         self.chunk_size = chunk_size
-        self.hasher = FileHasher(chunk_size)
-        self.differ = FileDiffer()
+        self.tuning = tuning
+        self.tuner = None
+        if tuning:
+            from .autotune import ChunkTuner
+            self.tuner = ChunkTuner(engine)
+        self._hasher_options = dict(engine=engine, cache=cache, workers=workers, batch_size=batch_size,
+                                    processes=processes, algorithm=algorithm, weak_algorithm=weak_algorithm)
+        # until a pair is tuned, hash with the size-based default
+        self.hasher = FileHasher(determine_chunk_size(0) if tuning else chunk_size, min_chunk_size=min_chunk_size,
+                                 max_chunk_size=max_chunk_size, window_size=window_size,
+                                 **self._hasher_options)
+        self.chunking = dict(self._chunking_params(), mode="fixed")
+        self.differ = FileDiffer(similarity_threshold)
+
+    def _chunking_params(self) -> Dict[str, Any]:
+        c = self.hasher.chunker
+        return {"engine": c.engine, "avg_chunk_size": c.avg_chunk_size, "min_chunk_size": c.min_chunk_size,
+                "max_chunk_size": c.max_chunk_size, "window_size": c.window_size}
+
+    def tune(self, old_file: str, new_file: str) -> Dict[str, Any]:
+        """Pick chunking parameters for this pair and rebuild the hasher with them"""
+        params = self.tuner.tune(old_file, new_file, self.tuning)
+        self.hasher = FileHasher(params["avg_chunk_size"], min_chunk_size=params["min_chunk_size"],
+                                 max_chunk_size=params["max_chunk_size"], window_size=params["window_size"],
+                                 **self._hasher_options)
+        self.chunking = params
+        logger.info(f"Tuned chunking ({self.tuning}): avg {params['avg_chunk_size']}, "
+                    f"min {params['min_chunk_size']}, max {params['max_chunk_size']}")
+        return params
 
-    def analyze_files(self, old_file: str, new_file: str) -> Dict[str, Any]:
-        """Analyze two files and return difference report plus raw chunk lists."""
+    def analyze_files(self, old_file: str, new_file: str,
+                      progress: Optional[Callable[..., None]] = None) -> Dict[str, Any]:
+        """
+        Analyze two files and return difference report plus raw chunk lists.
+        progress, if given, is called as progress(stage, bytes_chunked=...,
+        bytes_hashed=...) with byte counts over both files together.
+        """
         try:
             logger.info(f"Analyzing: {old_file} vs {new_file}")
-            old_map = self.hasher.create_chunk_map(old_file)
-            new_map = self.hasher.create_chunk_map(new_file)
+            if self.tuner is not None:
+                self.tune(old_file, new_file)
+            old_map = self.hasher.create_chunk_map(old_file, progress=self._file_progress(progress, "chunking old", 0))
+            base = os.path.getsize(old_file)
+            new_map = self.hasher.create_chunk_map(new_file, progress=self._file_progress(progress, "chunking new", base))
+            if progress is not None:
+                progress("diffing")
             diff    = self.differ.compare_files(old_map, new_map)
 
             formatted = self._format_results(diff)
-            # Inject raw chunks so generate_sync_plan can use their offsets/sizes/data
+            # Inject raw chunks so generate_sync_plan can use their offsets/sizes
             formatted["old_chunks"] = old_map["chunks"]
             formatted["new_chunks"] = new_map["chunks"]
+            formatted["chunking"] = self.chunking
 
             return {"success": True, "data": formatted, "error": None}
         except Exception as e:
             logger.error(f"Analysis failed: {e}", exc_info=True)
             return {"success": False, "data": None, "error": str(e)}
 
+    @staticmethod
+    def _file_progress(progress: Optional[Callable[..., None]], stage: str, base: int):
+        if progress is None:
+            return None
+        return lambda chunked, hashed: progress(stage, bytes_chunked=base + chunked, bytes_hashed=base + hashed)
+
     def _format_results(self, diff: Dict[str, Any]) -> Dict[str, Any]:
         stats = diff["stats"]
         return {
             "summary": {
                 "total_chunks":    stats["total_chunks"],
                 "unchanged":       stats["unchanged"],
+                "moved":           stats["moved"],
                 "added":           stats["added"],
                 "removed":         stats["removed"],
                 "modified":        stats["modified"],
@@ -53,60 +111,89 @@ class FileSyncer:
             "details": diff
         }
 
-    def generate_sync_plan(self, analysis: Dict[str, Any]) -> Dict[str, Any]:
+    def generate_sync_plan(self, analysis: Dict[str, Any], copy_refs: bool = False) -> Dict[str, Any]:
         """
         Build a sequence of operations (UNCHANGED, ADD, MODIFY, REMOVE),
         where each UNCHANGED carries its exact bytes (base64-encoded).
+
+        With copy_refs=True unchanged content is emitted as COPY operations
+        referencing (old_offset, size) in the old file instead, adjacent
+        copies merged into runs; only ADD/MODIFY carry bytes.
+
+        "target" describes the file the plan rebuilds (size, SHA-256 and
+        the new file's chunk digests) for PlanApplier to verify against.
         """
-        data     = analysis["data"]
-        details  = data["details"]
+        data       = analysis["data"]
         old_chunks = data.get("old_chunks", [])
         new_chunks = data.get("new_chunks", [])
 
-        # load old file bytes so we can slice out UNCHANGED segments
-        if old_chunks:
-            old_file_path = old_chunks[0]["filepath"]
-            old_bytes = Path(old_file_path).read_bytes()
-        else:
+        # map both files: UNCHANGED segments are sliced from the old one and
+        # only the chunks that have to be shipped are read from the new one
+        with ExitStack() as stack:
+            plan_stage = stack.enter_context(metrics.stage("plan", sum(c["size"] for c in new_chunks)))
+            plan_stage.add(chunks=len(new_chunks))
             old_bytes = b""
+            if old_chunks and not copy_refs:
+                old_bytes = stack.enter_context(mapped_file(old_chunks[0]["filepath"]))
+            new_bytes = stack.enter_context(mapped_file(new_chunks[0]["filepath"])) if new_chunks else b""
+            plan = self._build_sync_plan(data, old_bytes, new_bytes, copy_refs)
+            # whole-file digest (hashed on upload, if it was streamed in)
+            plan["target"]["sha256"] = data.get("new_sha256") or hashlib.sha256(new_bytes).hexdigest()
+            return plan
+
+    def _build_sync_plan(self, data: Dict[str, Any], old_bytes, new_bytes, copy_refs: bool = False) -> Dict[str, Any]:
+        details    = data["details"]
+        old_chunks = data.get("old_chunks", [])
+        new_chunks = data.get("new_chunks", [])
+
+        # keyed by new chunk index: in two-tier mode unconfirmed chunks have no
+        # digest, and with duplicates a digest does not say *which* old chunk
+        old_by_index = {oc["index"]: oc for oc in old_chunks}
+        if "matches" in details:
+            matches = {m["new_index"]: m for m in details["matches"]}
+        else:
+            # analyses from before alignment: first old chunk with the same digest
+            first_old: Dict[str, int] = {}
+            for oc in old_chunks:
+                first_old.setdefault(oc["hash"], oc["index"])
+            matches = {c["index"]: {"new_index": c["index"], "old_index": first_old[c["hash"]], "moved": False}
+                       for c in details.get("unchanged_chunks", [])}
+        mod_map = {m["new_chunk"]["index"]: m for m in details.get("modified_chunks", [])}
 
-        unchanged_hashes = {c["hash"] for c in details.get("unchanged_chunks", [])}
-        mod_map = {m["new_chunk"]["hash"]: m for m in details.get("modified_chunks", [])}
+        # every old offset holding a given digest, so copy runs can keep going
+        # through duplicate chunks
+        old_offsets: Dict[str, set] = {}
+        if copy_refs:
+            for oc in old_chunks:
+                old_offsets.setdefault(oc["hash"], set()).add(oc["offset"])
 
         ops = []
-        last_end = 0
 
         # 1) Walk the new file's chunks in order
         for chunk in new_chunks:
-            off, sz, h = chunk["offset"], chunk["size"], chunk["hash"]
+            off, sz, idx = chunk["offset"], chunk["size"], chunk["index"]
+            match = matches.get(idx)
 
-            # if there's a gap of bytes between last_end and this chunk → still UNCHANGED
-            if off > last_end:
-                segment = old_bytes[last_end:off]
-                ops.append({
-                    "type":   "UNCHANGED",
-                    "offset": last_end,
-                    "size":   off - last_end,
-                    "data":   base64.b64encode(segment).decode("utf-8")
-                })
-
-            if h in unchanged_hashes:
-                segment = old_bytes[off:off+sz]
-                ops.append({
-                    "type":   "UNCHANGED",
-                    "offset": off,
-                    "size":   sz,
-                    "data":   base64.b64encode(segment).decode("utf-8")
-                })
+            if match is not None:
+                oc = old_by_index[match["old_index"]]
+                if copy_refs:
+                    self._append_copy(ops, oc["offset"], old_offsets[oc["hash"]], off, sz, match["moved"])
+                else:
+                    segment = old_bytes[oc["offset"]:oc["offset"] + sz]
+                    ops.append({
+                        "type":   "UNCHANGED",
+                        "offset": off,
+                        "size":   sz,
+                        "data":   base64.b64encode(segment).decode("utf-8")
+                    })
 
-            elif h in mod_map:
-                nc = mod_map[h]["new_chunk"]
-                # new_chunk.data is already base64
+            elif idx in mod_map:
+                nc = mod_map[idx]["new_chunk"]
                 ops.append({
                     "type":   "MODIFY",
                     "offset": nc["offset"],
                     "size":   nc["size"],
-                    "data":   nc["data"]
+                    "data":   base64.b64encode(new_bytes[nc["offset"]:nc["offset"]+nc["size"]]).decode("utf-8")
                 })
 
             else:
@@ -115,26 +202,14 @@ class FileSyncer:
                     "type":   "ADD",
                     "offset": off,
                     "size":   sz,
-                    "data":   chunk["data"]
+                    "data":   base64.b64encode(new_bytes[off:off+sz]).decode("utf-8")
                 })
 
-            last_end = off + sz
-
-        # 2) if new file ends before old file, copy the tail as unchanged
         summary = data["summary"]
-        old_size = summary["old_size"]
-        if last_end < old_size:
-            tail = old_bytes[last_end:old_size]
-            ops.append({
-                "type":   "UNCHANGED",
-                "offset": last_end,
-                "size":   old_size - last_end,
-                "data":   base64.b64encode(tail).decode("utf-8")
-            })
-
-        # 3) For completeness, collect REMOVEs (not strictly needed to rebuild,
+
+        # 2) For completeness, collect REMOVEs (not strictly needed to rebuild,
         #    but useful for UI to show what's gone)
-        matched_old = {c["index"] for c in details.get("unchanged_chunks", [])}
+        matched_old = {m["old_index"] for m in matches.values()}
         matched_old |= {m["old_chunk"]["index"] for m in details.get("modified_chunks", [])}
         removes = [
             {"type": "REMOVE", "offset": oc["offset"], "size": oc["size"]}
@@ -143,14 +218,56 @@ class FileSyncer:
         ]
 
         return {
+            "format":         "copy" if copy_refs else "inline",
             "operations":     ops,
-            "changes":        sorted([o for o in ops if o["type"] != "UNCHANGED"] + removes,
+            "changes":        sorted([o for o in ops if o["type"] not in ("UNCHANGED", "COPY")] + removes,
                                      key=lambda o: o["offset"]),
             "total_bytes":    summary["bytes_changed"],
             "efficiency":     self._calculate_efficiency(summary),
-            "estimated_time": self._estimate_sync_time(summary["bytes_changed"])
+            "estimated_time": self._estimate_sync_time(summary["bytes_changed"]),
+            "target": {
+                "size":      sum(c["size"] for c in new_chunks),
+                "algorithm": self.hasher.algorithm,
+                "chunks":    [[c["offset"], c["size"], c["hash"]] for c in new_chunks if c["hash"]]
+            }
         }
 
+    @staticmethod
+    def _append_copy(ops: List[Dict[str, Any]], old_offset: int, same_content: set,
+                     offset: int, size: int, moved: bool = False) -> None:
+        """
+        Add a COPY reference to old_offset, extending the previous run instead
+        when it continues in the old file (at any offset holding the same
+        content). Moved blocks are flagged and kept in runs of their own.
+        """
+        prev = ops[-1] if ops and ops[-1]["type"] == "COPY" else None
+        if prev is not None and prev.get("moved", False) == moved:
+            if prev["old_offset"] + prev["size"] in same_content:
+                prev["size"] += size
+                return
+        op = {
+            "type":       "COPY",
+            "offset":     offset,
+            "old_offset": old_offset,
+            "size":       size
+        }
+        if moved:
+            op["moved"] = True
+        ops.append(op)
+
+    def apply_sync_plan(self, operations: List[Dict[str, Any]], old_file: Optional[str],
+                        output_path: str, target: Optional[Dict[str, Any]] = None,
+                        resume: bool = True) -> int:
+        """
+        Rebuild the new file from a plan's operations (see PlanApplier):
+        COPY runs are copied from old_file in the kernel where available,
+        each range is checked against target's chunk digests, and the result
+        is verified before it is renamed into place. An interrupted apply of
+        the same plan resumes where it stopped.
+        """
+        from .applier import PlanApplier
+        return PlanApplier(output_path, old_file, target).apply(operations, resume=resume)
+
     def _calculate_efficiency(self, summary: Dict[str, Any]) -> float:
         new_size = summary.get("new_size", 0)
         changed  = summary.get("bytes_changed", 0)
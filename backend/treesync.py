@@ -0,0 +1,251 @@
+import os
+import json
+import time
+import hashlib
+import logging
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, Any, List, Optional, Tuple
+
+from .chunker import determine_chunk_size
+from .hasher import FileHasher
+from .sigcache import SignatureCache
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_VERSION = 1
+
+
+def scan_tree(root: str) -> Dict[str, Tuple[int, int]]:
+    """Relative path (always '/'-separated) -> (size, mtime_ns) of every regular file"""
+    files = {}
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for name in filenames:
+            path = os.path.join(dirpath, name)
+            try:
+                st = os.stat(path, follow_symlinks=False)
+            except OSError:
+                continue
+            if not os.path.isfile(path) or os.path.islink(path):
+                continue
+            rel = os.path.relpath(path, root).replace(os.sep, "/")
+            files[rel] = (st.st_size, st.st_mtime_ns)
+    return files
+
+
+def _sync_pair(task: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Worker: diff one old/new pair and build its copy-reference plan. Runs in
+    a pool process, so everything it needs travels in the task dict and the
+    plan is either written out as a binary patch or returned inline.
+    """
+    from .syncer import FileSyncer
+    from .patch import encode_plan
+
+    opts = task["options"]
+    started = time.time()
+    entry = {"path": task["path"], "old_size": task["old_size"], "new_size": task["new_size"]}
+    try:
+        cache = SignatureCache(opts["cache_dir"]) if opts.get("cache_dir") else None
+        chunk_size = opts.get("chunk_size") or determine_chunk_size(max(task["old_size"], task["new_size"]))
+        syncer = FileSyncer(chunk_size=chunk_size, engine=opts["engine"],
+                            similarity_threshold=opts["similarity_threshold"], cache=cache,
+                            algorithm=opts["algorithm"], weak_algorithm=opts["weak_algorithm"])
+        res = syncer.analyze_files(task["old_path"], task["new_path"])
+        if not res["success"]:
+            raise ValueError(res["error"])
+        plan = syncer.generate_sync_plan(res, copy_refs=True)
+
+        ops = plan["operations"]
+        copied = sum(op["size"] for op in ops if op["type"] == "COPY")
+        literal = sum(op["size"] for op in ops if op["type"] in ("ADD", "MODIFY"))
+        in_place = (task["old_size"] == task["new_size"] and len(ops) == 1
+                    and ops[0]["type"] == "COPY" and ops[0]["old_offset"] == 0)
+        if in_place or task["new_size"] == task["old_size"] == 0:
+            entry.update(status="unchanged", reason="content")
+            return entry
+
+        entry.update(status="changed", summary=res["data"]["summary"],
+                     bytes_copied=copied, bytes_literal=literal, operations=len(ops))
+        if task.get("patch_path"):
+            with open(task["patch_path"], "wb") as out:
+                entry["patch_size"] = encode_plan(plan, out, target_sha256=plan["target"]["sha256"])
+            entry["patch"] = os.path.basename(task["patch_path"])
+        else:
+            entry["plan"] = ops
+    except Exception as e:
+        logger.error(f"Tree sync failed for {task['path']}: {e}", exc_info=True)
+        entry.update(status="error", error=str(e))
+    finally:
+        entry["elapsed"] = round(time.time() - started, 4)
+    return entry
+
+
+class TreeSyncer:
+    """
+    Synchronization plan for a whole directory tree.
+
+    Files are paired by relative path. Pairs with equal size and mtime are
+    skipped outright (the rsync quick check), as are pairs whose cached chunk
+    maps already agree; the rest are diffed by FileSyncer workers in a
+    process pool, largest files first so one big file does not straggle at
+    the end. The result is a single manifest of per-file plans plus
+    aggregate stats.
+    """
+
+    def __init__(self, chunk_size: Optional[int] = None, engine: str = 'gear',
+                 similarity_threshold: float = 0.7, processes: int = 0,
+                 algorithm: str = 'sha256', weak_algorithm: Optional[str] = None,
+                 cache: Optional[SignatureCache] = None):
+        """
+        chunk_size: average chunk size for every file (None picks one per
+        file from its size); processes: pool size (0 = one per CPU, 1 runs
+        the pairs in this process).
+        """
+        self.chunk_size = chunk_size
+        self.engine = engine
+        self.similarity_threshold = similarity_threshold
+        self.processes = processes or os.cpu_count() or 1
+        self.algorithm = algorithm
+        self.weak_algorithm = weak_algorithm
+        self.cache = cache
+
+    def _options(self) -> Dict[str, Any]:
+        return {
+            "chunk_size": self.chunk_size,
+            "engine": self.engine,
+            "similarity_threshold": self.similarity_threshold,
+            "algorithm": self.algorithm,
+            "weak_algorithm": self.weak_algorithm,
+            "cache_dir": self.cache.cache_dir if self.cache else None
+        }
+
+    def _cached_match(self, old_path: str, new_path: str, size: int) -> bool:
+        """True when both files have cached chunk maps with identical digests"""
+        if self.cache is None:
+            return False
+        chunk_size = self.chunk_size or determine_chunk_size(size)
+        params = FileHasher(chunk_size, engine=self.engine, algorithm=self.algorithm,
+                            weak_algorithm=self.weak_algorithm).signature_params()
+        old_map = self.cache.get(old_path, params)
+        if old_map is None or None in old_map["hashes"]:
+            return False
+        new_map = self.cache.get(new_path, params)
+        return new_map is not None and new_map["hashes"] == old_map["hashes"]
+
+    def sync_tree(self, old_root: str, new_root: str, patch_dir: Optional[str] = None,
+                  manifest_path: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Plan the changes turning old_root into new_root. With patch_dir each
+        changed file's plan is written there as a binary patch and the
+        manifest only references it; otherwise plans are kept inline.
+        """
+        for root in (old_root, new_root):
+            if not os.path.isdir(root):
+                raise FileNotFoundError(f"Directory not found: {root}")
+        started = time.time()
+        old_files = scan_tree(old_root)
+        new_files = scan_tree(new_root)
+        if patch_dir:
+            os.makedirs(patch_dir, exist_ok=True)
+
+        entries: Dict[str, Dict[str, Any]] = {}
+        tasks = []
+        for rel, (new_size, new_mtime) in new_files.items():
+            old_path = os.path.join(old_root, *rel.split("/"))
+            new_path = os.path.join(new_root, *rel.split("/"))
+            if rel not in old_files:
+                entries[rel] = {"path": rel, "status": "added", "new_size": new_size}
+                continue
+            old_size, old_mtime = old_files[rel]
+            if old_size == new_size and old_mtime == new_mtime:
+                entries[rel] = {"path": rel, "status": "unchanged", "reason": "stat",
+                                "old_size": old_size, "new_size": new_size}
+                continue
+            if old_size == new_size and self._cached_match(old_path, new_path, new_size):
+                entries[rel] = {"path": rel, "status": "unchanged", "reason": "digest",
+                                "old_size": old_size, "new_size": new_size}
+                continue
+            patch_path = None
+            if patch_dir:
+                patch_path = os.path.join(patch_dir, hashlib.sha256(rel.encode()).hexdigest()[:24] + ".fcsp")
+            tasks.append({"path": rel, "old_path": old_path, "new_path": new_path,
+                          "old_size": old_size, "new_size": new_size,
+                          "patch_path": patch_path, "options": self._options()})
+        for rel, (old_size, _) in old_files.items():
+            if rel not in new_files:
+                entries[rel] = {"path": rel, "status": "removed", "old_size": old_size}
+
+        # longest jobs first: with a shared queue this keeps the tail short
+        tasks.sort(key=lambda t: max(t["old_size"], t["new_size"]), reverse=True)
+        for entry in self._run(tasks):
+            entries[entry["path"]] = entry
+
+        manifest = {
+            "version": MANIFEST_VERSION,
+            "old_root": os.path.abspath(old_root),
+            "new_root": os.path.abspath(new_root),
+            "params": self._options(),
+            "files": [entries[rel] for rel in sorted(entries)],
+        }
+        manifest["stats"] = self._stats(manifest["files"], time.time() - started)
+
+        if manifest_path:
+            tmp = f"{manifest_path}.{os.getpid()}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(manifest, f, separators=(",", ":"))
+            os.replace(tmp, manifest_path)
+        return manifest
+
+    def _run(self, tasks: List[Dict[str, Any]]):
+        if self.processes <= 1 or len(tasks) <= 1:
+            for task in tasks:
+                yield _sync_pair(task)
+            return
+        with ProcessPoolExecutor(max_workers=min(self.processes, len(tasks))) as pool:
+            futures = [pool.submit(_sync_pair, task) for task in tasks]
+            for future in as_completed(futures):
+                yield future.result()
+
+    @staticmethod
+    def _stats(files: List[Dict[str, Any]], elapsed: float) -> Dict[str, Any]:
+        stats = {
+            "files": len(files),
+            "unchanged": 0,
+            "changed": 0,
+            "added": 0,
+            "removed": 0,
+            "errors": 0,
+            "skipped_stat": 0,
+            "skipped_digest": 0,
+            "old_bytes": 0,
+            "new_bytes": 0,
+            "bytes_copied": 0,
+            "bytes_literal": 0,
+            "bytes_added": 0,
+            "patch_bytes": 0,
+            "worker_seconds": 0.0,
+        }
+        for f in files:
+            status = f["status"]
+            stats["unchanged" if status == "unchanged" else "errors" if status == "error" else status] += 1
+            stats["old_bytes"] += f.get("old_size", 0)
+            stats["new_bytes"] += f.get("new_size", 0)
+            stats["worker_seconds"] += f.get("elapsed", 0.0)
+            if f.get("reason") == "stat":
+                stats["skipped_stat"] += 1
+            elif f.get("reason") == "digest":
+                stats["skipped_digest"] += 1
+            if status == "changed":
+                stats["bytes_copied"] += f["bytes_copied"]
+                stats["bytes_literal"] += f["bytes_literal"]
+                stats["patch_bytes"] += f.get("patch_size", 0)
+            elif status == "added":
+                stats["bytes_added"] += f["new_size"]
+
+        stats["worker_seconds"] = round(stats["worker_seconds"], 3)
+        stats["elapsed"] = round(elapsed, 3)
+        stats["throughput_mb_s"] = round(stats["new_bytes"] / (1024 * 1024) / elapsed, 2) if elapsed else 0.0
+        to_send = stats["bytes_literal"] + stats["bytes_added"]
+        stats["efficiency"] = round((1 - to_send / stats["new_bytes"]) * 100, 2) if stats["new_bytes"] else 0.0
+        return stats
@@ -0,0 +1,200 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+
+# change types, in the order their codes are stored
+CHANGE_TYPES = ('unchanged', 'moved', 'modified', 'added', 'removed')
+TYPE_COLORS = {"unchanged": "#9E9E9E", "moved": "#2196F3", "modified": "#FFC107",
+               "added": "#4CAF50", "removed": "#F44336"}
+# the new file's chunks are unchanged/moved/modified/added; the old file's unchanged/modified/removed
+TRACKS = ('new', 'old')
+
+
+class VisualizationIndex:
+    """
+    Compact, queryable form of a comparison for drawing chunk maps of any
+    size. Each track (the new file, and the old file for removals) keeps
+    its chunks as parallel arrays of offset, size and change-type code
+    (indexes are array positions, as the chunks tile the file in order),
+    plus per-type prefix sums of bytes and chunk counts, so the bytes and
+    chunks of each type inside any byte range take two binary searches.
+
+    bins() aggregates a range into a fixed number of bins (one per pixel
+    column, say) in time independent of the chunk count; chunks() pages
+    through the individual chunks of a range for the zoomed-in view.
+    """
+
+    def __init__(self, tracks: Dict[str, Dict[str, Any]]):
+        """
+        tracks: name -> {"sizes", "types"} covering the whole file in chunk
+        order (chunk i starts where chunk i - 1 ends), types as codes into
+        CHANGE_TYPES.
+        """
+        import numpy as np
+        self.tracks = {}
+        for name, t in tracks.items():
+            sizes = np.asarray(t["sizes"], dtype=np.uint32)
+            types = np.asarray(t["types"], dtype=np.uint8)
+            ends = np.cumsum(sizes, dtype=np.int64)
+            # prefix[k][i]: bytes / chunks of type k among the first i chunks
+            onehot = types[None, :] == np.arange(len(CHANGE_TYPES), dtype=np.uint8)[:, None]
+            zeros = np.zeros((len(CHANGE_TYPES), 1), dtype=np.int64)
+            self.tracks[name] = {
+                "size": int(ends[-1]) if len(ends) else 0,
+                "offsets": ends - sizes,
+                "sizes": sizes.astype(np.int64),
+                "types": types,
+                "byte_prefix": np.hstack([zeros, np.cumsum(np.where(onehot, sizes, 0), axis=1, dtype=np.int64)]),
+                "count_prefix": np.hstack([zeros, np.cumsum(onehot, axis=1, dtype=np.int64)]),
+            }
+
+    @classmethod
+    def from_analysis(cls, data: Dict[str, Any]) -> 'VisualizationIndex':
+        """Build from FileSyncer.analyze_files()["data"] (needs old_chunks/new_chunks)"""
+        details = data["details"]
+        new_chunks = data.get("new_chunks", [])
+        old_chunks = data.get("old_chunks", [])
+        code = {t: i for i, t in enumerate(CHANGE_TYPES)}
+
+        new_types = [code["added"]] * len(new_chunks)
+        old_types = [code["removed"]] * len(old_chunks)
+        matches = details.get("matches")
+        if matches is None:   # analyses from before alignment
+            matches = [{"new_index": c["index"], "old_index": None, "moved": False}
+                       for c in details.get("unchanged_chunks", [])]
+        for m in matches:
+            new_types[m["new_index"]] = code["moved" if m["moved"] else "unchanged"]
+            if m["old_index"] is not None:
+                old_types[m["old_index"]] = code["unchanged"]
+        for m in details.get("modified_chunks", []):
+            new_types[m["new_chunk"]["index"]] = code["modified"]
+            old_types[m["old_chunk"]["index"]] = code["modified"]
+
+        return cls({"new": {"sizes": [c["size"] for c in new_chunks], "types": new_types},
+                    "old": {"sizes": [c["size"] for c in old_chunks], "types": old_types}})
+
+    def save(self, path: str) -> None:
+        """Sizes and type codes only (5 bytes a chunk); offsets and sums are rebuilt on load"""
+        import numpy as np
+        arrays = {}
+        for name, t in self.tracks.items():
+            arrays[f"{name}_sizes"] = t["sizes"].astype(np.uint32)
+            arrays[f"{name}_types"] = t["types"]
+        tmp = f"{path}.{os.getpid()}.tmp.npz"
+        np.savez(tmp, **arrays)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> 'VisualizationIndex':
+        import numpy as np
+        with np.load(path) as f:
+            return cls({name: {"sizes": f[f"{name}_sizes"], "types": f[f"{name}_types"]}
+                        for name in TRACKS if f"{name}_sizes" in f.files})
+
+    def _track(self, name: str) -> Dict[str, Any]:
+        if name not in self.tracks:
+            raise ValueError(f"Unknown track: {name!r} (expected one of {TRACKS})")
+        return self.tracks[name]
+
+    @staticmethod
+    def _range(t: Dict[str, Any], start: Optional[int], end: Optional[int]):
+        start = 0 if start is None else max(0, int(start))
+        end = t["size"] if end is None else min(t["size"], int(end))
+        if end < start:
+            raise ValueError("end must not be before start")
+        return start, end
+
+    @staticmethod
+    def _bytes_before(t: Dict[str, Any], x):
+        """Bytes of each type in [0, x), for an array of positions x -> shape (types, len(x))"""
+        import numpy as np
+        offsets, sizes = t["offsets"], t["sizes"]
+        k = np.searchsorted(offsets, x, side="left")   # chunks starting before x
+        result = t["byte_prefix"][:, k]
+        if len(offsets):
+            # the last of them may run past x
+            last = np.maximum(k - 1, 0)
+            over = np.where(k > 0, np.maximum(offsets[last] + sizes[last] - x, 0), 0)
+            hit = t["types"][last][None, :] == np.arange(len(CHANGE_TYPES), dtype=np.uint8)[:, None]
+            result = result - np.where(hit, over, 0)
+        return result
+
+    def bins(self, n: int = 800, start: Optional[int] = None, end: Optional[int] = None,
+             track: str = 'new') -> Dict[str, Any]:
+        """
+        Split [start, end) of a track into n equal byte ranges and report,
+        per change type, the bytes and the number of chunks starting in each.
+        """
+        import numpy as np
+        t = self._track(track)
+        start, end = self._range(t, start, end)
+        n = max(1, min(int(n), max(1, end - start)))
+        edges = np.linspace(start, end, n + 1).round().astype(np.int64)
+        nbytes = np.diff(self._bytes_before(t, edges), axis=1)
+        first = np.searchsorted(t["offsets"], edges, side="left")
+        counts = np.diff(t["count_prefix"][:, first], axis=1)
+        present = [k for k, name in enumerate(CHANGE_TYPES) if counts[k].any() or nbytes[k].any()]
+        return {
+            "track": track,
+            "size": t["size"],
+            "start": start,
+            "end": end,
+            "edges": edges.tolist(),
+            "chunks_in_range": int(first[-1] - first[0]),
+            "bytes": {CHANGE_TYPES[k]: nbytes[k].tolist() for k in present},
+            "counts": {CHANGE_TYPES[k]: counts[k].tolist() for k in present},
+            "colors": {CHANGE_TYPES[k]: TYPE_COLORS[CHANGE_TYPES[k]] for k in present},
+        }
+
+    def chunks(self, start: Optional[int] = None, end: Optional[int] = None, track: str = 'new',
+               limit: int = 1000, cursor: int = 0) -> Dict[str, Any]:
+        """
+        Individual chunks overlapping [start, end), a page of `limit` at a
+        time; pass the returned next_cursor to get the following page.
+        """
+        import numpy as np
+        t = self._track(track)
+        start, end = self._range(t, start, end)
+        offsets = t["offsets"]
+        lo = max(int(np.searchsorted(offsets, start, side="right")) - 1, 0)
+        if lo < len(offsets) and offsets[lo] + t["sizes"][lo] <= start:
+            lo += 1
+        hi = int(np.searchsorted(offsets, end, side="left"))
+        first = lo + max(0, int(cursor))
+        last = min(hi, first + max(1, int(limit)))
+        page = [{"index": i, "offset": int(offsets[i]), "size": int(t["sizes"][i]),
+                 "type": CHANGE_TYPES[t["types"][i]], "color": TYPE_COLORS[CHANGE_TYPES[t["types"][i]]]}
+                for i in range(first, last)]
+        return {
+            "track": track,
+            "start": start,
+            "end": end,
+            "total": max(0, hi - lo),
+            "chunks": page,
+            "next_cursor": last - lo if last < hi else None
+        }
+
+
+class IndexCache:
+    """The few most recently used indexes, loaded from their files on demand"""
+
+    def __init__(self, max_entries: int = 4):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, path: str) -> VisualizationIndex:
+        mtime = os.stat(path).st_mtime_ns
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and entry[0] == mtime:
+                self._entries.move_to_end(path)
+                return entry[1]
+        index = VisualizationIndex.load(path)
+        with self._lock:
+            self._entries[path] = (mtime, index)
+            self._entries.move_to_end(path)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return index
@@ -1,18 +1,84 @@
 import os
 import sys
+import json
 import time
-import base64
+import uuid
+import hashlib
 import shutil
 import logging
-import textwrap
+import threading
 from pathlib import Path
-from flask import Flask, render_template, request, jsonify, send_from_directory
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from flask import Flask, Request, Response, render_template, request, jsonify, send_from_directory, g
+from flask.json import JSONEncoder
 from werkzeug.utils import secure_filename
 
 
 logging.basicConfig(level=logging.DEBUG)
+# per-chunk dumps of every chunk map; far too slow to leave on for real files
+logging.getLogger('backend.hasher.chunks').setLevel(logging.INFO)
 sys.path.append(str(Path(__file__).parent.parent))
 from backend.syncer import FileSyncer
+from backend.chunker import determine_chunk_size
+from backend.hasher import FileHasher
+from backend.delta import DeltaEngine
+from backend.patch import encode_plan, apply_patch as apply_binary_patch
+from backend.chunkmap import ChunkRecord
+from backend.sigcache import SignatureCache
+from backend.treesync import TreeSyncer
+from backend.chunkstore import ChunkStore
+from backend.jobs import JobManager, JobQueueFull
+from backend.ingest import ChunkingSink
+from backend.autotune import ChunkTuner
+from backend.metrics import metrics, RequestProfiler
+from backend.vizindex import VisualizationIndex, IndexCache
+from backend.applier import PlanApplier
+from backend.report import ReportWriter
+from backend.fanout import FanoutSyncer
+
+
+class ChunkJSONEncoder(JSONEncoder):
+    """Serialize compact chunk records as plain dicts (no payload)"""
+    def default(self, o):
+        if isinstance(o, ChunkRecord):
+            return o.to_dict()
+        return super().default(o)
+
+class StreamingRequest(Request):
+    """
+    Large uploads to the comparison endpoints are chunked and hashed while
+    they stream in (see ChunkingSink) instead of being saved and re-read.
+    Both files must be chunked alike, so the first upload fixes the
+    chunking parameters for the request: from the Content-Length (both
+    files together) and, when tuning, a profile of the first
+    UPLOAD_SPOOL_BYTES of its content. Small requests keep the
+    save-then-chunk path and its per-pair tuning.
+    """
+    stream_chunking = None
+    new_sha256 = None   # of the streamed new_file, hashed on the way in
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        small = total_content_length is not None and total_content_length < app.config['STREAM_MIN_BYTES']
+        if small or self.endpoint not in app.config['STREAM_CHUNK_ENDPOINTS']:
+            return super()._get_file_stream(total_content_length, content_type, filename, content_length)
+        # unknown length (chunked transfer): assume a large upload
+        size = content_length or total_content_length or 1 << 40
+        return ChunkingSink(lambda head: self._stream_hasher(size, head),
+                            app.config['UPLOAD_SPOOL_DIR'], app.config['UPLOAD_SPOOL_BYTES'])
+
+    def _stream_hasher(self, size: int, head: bytes) -> FileHasher:
+        if self.stream_chunking is None:
+            tuner = ChunkTuner(app.config['CHUNK_ENGINE'])
+            if app.config['CHUNK_TUNING'] == 'size':
+                self.stream_chunking = tuner.size_params(size)
+            else:
+                # no second file to try sizes against yet: trial falls back to the heuristic here
+                profile = tuner.profile_bytes(head)
+                self.stream_chunking = dict(tuner.choose(size, profile), mode='auto', profile=profile)
+        params = self.stream_chunking
+        return FileHasher(params['avg_chunk_size'], engine=params['engine'], cache=signature_cache,
+                          algorithm=app.config['HASH_ALGORITHM'], weak_algorithm=app.config['WEAK_HASH'],
+                          **ChunkTuner.size_kwargs(params))
 
 # Initialize Flask app
 BASE_DIR = Path(__file__).parent.parent
@@ -21,19 +87,80 @@ app = Flask(
     template_folder=str(BASE_DIR / 'frontend' / 'templates'),
     static_folder=str(BASE_DIR / 'frontend' / 'static')
 )
+app.json_encoder = ChunkJSONEncoder
+app.request_class = StreamingRequest
 app.config['UPLOAD_FOLDER'] = 'uploads'
-app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024
+app.config['MAX_CONTENT_LENGTH'] = None   # uploads stream to disk, no size cap
+app.config['STREAM_CHUNK_ENDPOINTS'] = {'compare_files', 'submit_job'}
+app.config['STREAM_MIN_BYTES'] = 1024 * 1024      # smaller requests are saved, then chunked
+app.config['UPLOAD_SPOOL_DIR'] = str(Path('uploads') / '.incoming')
+app.config['UPLOAD_SPOOL_BYTES'] = 1024 * 1024   # larger uploads spool to disk while streaming
+app.config['CHUNK_ENGINE'] = 'gear'   # 'rolling' or 'gear' (FastCDC)
+app.config['CHUNK_TUNING'] = 'auto'   # 'size' (file size only), 'auto' (size + content), 'trial'
+app.config['SIMILARITY_THRESHOLD'] = 0.7
+app.config['HASH_ALGORITHM'] = 'sha256'   # sha256, blake2b, blake2s (+ xxh3_128/blake3 if installed)
+app.config['WEAK_HASH'] = None            # 'adler32' / 'xxh64' for two-tier matching
+app.config['HASH_WORKERS'] = os.cpu_count() or 1
+app.config['HASH_BATCH_SIZE'] = 256
+app.config['CHUNK_PROCESSES'] = os.cpu_count() or 1
+app.config['SIGNATURE_CACHE_DIR'] = str(Path('uploads') / '.sigcache')
+app.config['SIGNATURE_CACHE_MAX_BYTES'] = 256 * 1024 * 1024
+app.config['TREE_SYNC_PROCESSES'] = os.cpu_count() or 1
+app.config['FANOUT_PROCESSES'] = os.cpu_count() or 1
+app.config['BASELINE_INDEX_DIR'] = str(Path('uploads') / '.baselines')   # one index per baseline file
+app.config['CHUNK_STORE_DIR'] = str(Path('uploads') / '.chunkstore')
+app.config['CHUNK_STORE_CHUNK_SIZE'] = 4096   # fixed, so versions chunk alike and dedup
+app.config['JOB_WORKERS'] = 2                 # concurrent large comparisons
+app.config['JOB_SMALL_WORKERS'] = 2           # separate lane for small ones
+app.config['JOB_SMALL_BYTES'] = 8 * 1024 * 1024
+app.config['JOB_MAX_QUEUED'] = 64
+app.config['METRICS_ENABLED'] = True          # per-stage counters behind /metrics
+app.config['PROFILING_ENABLED'] = False       # allow ?profile=cpu|memory on any request
+app.config['PROFILE_DIR'] = str(Path('uploads') / '.profiles')
+app.config['VIZ_INLINE_MAX_CHUNKS'] = 2000     # larger maps are only served through /visualization
+app.config['VIZ_MAX_BINS'] = 4096
+app.config['VIZ_PAGE_LIMIT'] = 5000
+app.config['REPORT_DETAIL'] = 'changes'        # 'summary', 'changes' or 'full'
+app.config['REPORT_SNIPPET_BYTES'] = 80        # chunk previews are cut to this (None: whole chunks)
+app.config['REPORT_MAX_ENTRIES'] = 10000       # lines per listing
+app.config['REPORT_WORKERS'] = 1
+app.config['REPORT_WAIT_SECONDS'] = 30         # /analysis waits this long for a report being written
 app.secret_key = 'your-secret-key'
 Path(app.config['UPLOAD_FOLDER']).mkdir(exist_ok=True)
-
-def determine_chunk_size(file_size: int) -> int:
-    if file_size < 512:
-        return 8
-    if file_size < 1024 * 1024:
-        return 512
-    if file_size < 10 * 1024 * 1024:
-        return 4096
-    return 8192
+signature_cache = SignatureCache(app.config['SIGNATURE_CACHE_DIR'],
+                                 app.config['SIGNATURE_CACHE_MAX_BYTES'])
+metrics.enabled = app.config['METRICS_ENABLED']
+job_manager = JobManager(max_workers=app.config['JOB_WORKERS'],
+                         small_workers=app.config['JOB_SMALL_WORKERS'],
+                         small_job_bytes=app.config['JOB_SMALL_BYTES'],
+                         max_queued=app.config['JOB_MAX_QUEUED'])
+_chunk_store = None
+viz_cache = IndexCache()
+# analysis reports are written off the request path; name -> future until done
+report_executor = ThreadPoolExecutor(max_workers=app.config['REPORT_WORKERS'], thread_name_prefix="report")
+pending_reports = {}
+_reports_lock = threading.Lock()
+
+def write_report_async(writer: ReportWriter, path: Path) -> str:
+    """Queue the report to be streamed to path; returns its file name"""
+    def done(future):
+        with _reports_lock:
+            pending_reports.pop(path.name, None)
+        if future.exception() is not None:
+            logging.error("Failed to write analysis file", exc_info=future.exception())
+
+    future = report_executor.submit(writer.write, str(path))
+    with _reports_lock:
+        pending_reports[path.name] = future
+    future.add_done_callback(done)
+    return path.name
+
+def chunk_store() -> ChunkStore:
+    """Shared chunk store, opened on first use"""
+    global _chunk_store
+    if _chunk_store is None:
+        _chunk_store = ChunkStore(app.config['CHUNK_STORE_DIR'], algorithm=app.config['HASH_ALGORITHM'])
+    return _chunk_store
 
 def prepare_visualization(diff_report: dict) -> list:
     colors = {"added":"#4CAF50","removed":"#F44336","unchanged":"#9E9E9E","modified":"#FFC107"}
@@ -55,161 +182,519 @@ def prepare_visualization(diff_report: dict) -> list:
     viz.sort(key=lambda x: x["index"])
     return viz
 
+@app.before_request
+def start_profile():
+    """?profile=cpu|memory (or an X-Profile header) profiles this request"""
+    mode = request.args.get('profile') or request.headers.get('X-Profile')
+    if not mode or not app.config['PROFILING_ENABLED'] or mode not in RequestProfiler.MODES:
+        return
+    profiler = RequestProfiler(mode)
+    if profiler.start():
+        g.profiler = profiler
+
+@app.after_request
+def finish_profile(response):
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        report = profiler.stop()
+        name = f"{uuid.uuid4().hex}.txt"
+        Path(app.config['PROFILE_DIR']).mkdir(parents=True, exist_ok=True)
+        Path(app.config['PROFILE_DIR'], name).write_text(report, encoding='utf-8')
+        response.headers['X-Profile-Report'] = f"/profiles/{name}"
+    return response
+
+@app.route('/profiles/<name>')
+def profile_report(name):
+    return send_from_directory(os.path.abspath(app.config['PROFILE_DIR']), secure_filename(name),
+                               mimetype='text/plain')
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Per-stage timings, byte/chunk counts, chunk-size histogram and memory high-water marks"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/')
 def home():
     return render_template('index.html')
 
-@app.route('/compare', methods=['POST'])
-def compare_files():
+def save_uploads(prefix: str = ""):
+    """
+    Save the old_file/new_file uploads of the current request. Returns
+    (old_fn, new_fn, old_path, new_path) or an error response tuple.
+    """
+    if 'old_file' not in request.files or 'new_file' not in request.files:
+        return jsonify(status="error", message="Both files required"), 400
+
+    old_f = request.files['old_file']
+    new_f = request.files['new_file']
+    if not old_f.filename or not new_f.filename:
+        return jsonify(status="error", message="No files selected"), 400
+
+    old_fn = prefix + secure_filename(old_f.filename)
+    new_fn = prefix + secure_filename(new_f.filename)
+    UP = Path(app.config['UPLOAD_FOLDER'])
+    old_path = UP/old_fn
+    new_path = UP/new_fn
+    for f, path in ((old_f, old_path), (new_f, new_path)):
+        if isinstance(f.stream, ChunkingSink):
+            chunk_map = f.stream.finalize(str(path))   # already chunked and hashed
+            if f is new_f:
+                request.new_sha256 = chunk_map["sha256"]
+        else:
+            f.save(str(path))
+    return old_fn, new_fn, old_path, new_path
+
+def run_comparison(old_path: Path, new_path: Path, old_fn: str, new_fn: str,
+                   progress=None, chunking: dict = None, new_sha256: str = None) -> dict:
+    """
+    Analyze two saved files and build the sync plan, binary patch and text
+    report; returns the /compare payload. Runs in the request or as a job.
+    chunking: the parameters streamed uploads were chunked with (their maps
+    are then already cached); by default they are picked per CHUNK_TUNING.
+    new_sha256: digest of the new file if it was hashed while uploading.
+    """
+    UP = Path(app.config['UPLOAD_FOLDER'])
+    size = max(old_path.stat().st_size, new_path.stat().st_size)
+    tuning = app.config['CHUNK_TUNING']
+    sizes = {}   # none: FileSyncer tunes them for the pair (tuning='auto' / 'trial')
+    if chunking:
+        sizes = dict(ChunkTuner.size_kwargs(chunking), chunk_size=chunking['avg_chunk_size'])
+    elif tuning == 'size':
+        sizes = {"chunk_size": determine_chunk_size(size)}
+    syncer = FileSyncer(engine=app.config['CHUNK_ENGINE'],
+                        similarity_threshold=app.config['SIMILARITY_THRESHOLD'],
+                        cache=signature_cache,
+                        workers=app.config['HASH_WORKERS'],
+                        batch_size=app.config['HASH_BATCH_SIZE'],
+                        processes=app.config['CHUNK_PROCESSES'],
+                        algorithm=app.config['HASH_ALGORITHM'],
+                        weak_algorithm=app.config['WEAK_HASH'],
+                        tuning=None if sizes else tuning, **sizes)
+    if chunking:
+        syncer.chunking = chunking
+    elif tuning == 'size':
+        syncer.chunking["mode"] = "size"
+
+    res = syncer.analyze_files(str(old_path), str(new_path), progress=progress)
+    if not res.get("success", False):
+        raise ValueError(res.get("error", "Analysis failed"))
+
+    # Now call generate_sync_plan here to get the sync operations
+    # (unchanged content as copy references into the old file)
+    if progress:
+        progress("planning")
+    if new_sha256:
+        res["data"]["new_sha256"] = new_sha256
+    plan = syncer.generate_sync_plan(res, copy_refs=True)
+
+    # chunk-map index for /visualization; the per-chunk list only for small maps
+    data = res["data"]
+    viz = None
+    if len(data.get("new_chunks", [])) + len(data.get("old_chunks", [])) <= app.config['VIZ_INLINE_MAX_CHUNKS']:
+        viz = prepare_visualization(data)
     try:
-        if 'old_file' not in request.files or 'new_file' not in request.files:
-            return jsonify(status="error", message="Both files required"), 400
-
-        old_f = request.files['old_file']
-        new_f = request.files['new_file']
-        if not old_f.filename or not new_f.filename:
-            return jsonify(status="error", message="No files selected"), 400
-
-        old_fn = secure_filename(old_f.filename)
-        new_fn = secure_filename(new_f.filename)
-        UP = Path(app.config['UPLOAD_FOLDER'])
-        old_path = UP/old_fn
-        new_path = UP/new_fn
-        old_f.save(str(old_path))
-        new_f.save(str(new_path))
-
-        size = max(old_path.stat().st_size, new_path.stat().st_size)
-        cs = determine_chunk_size(size)
-        syncer = FileSyncer(chunk_size=cs)
-
-        start = time.time()
-        res = syncer.analyze_files(str(old_path), str(new_path))
-        if not res.get("success", False):
-            return jsonify(status="error", message=res.get("error", "Analysis failed")), 400
+        viz_id = uuid.uuid4().hex
+        VisualizationIndex.from_analysis(data).save(str(UP / f"viz_{viz_id}.npz"))
+    except Exception:
+        logging.exception("Failed to write visualization index")
+        viz_id = None
 
-        # Now call generate_sync_plan here to get the sync operations
-        plan = syncer.generate_sync_plan(res)
-        viz  = prepare_visualization(res["data"])
+    # binary patch of the same plan (a fraction of the JSON size)
+    try:
+        pf = UP / f"patch_{int(time.time())}_{uuid.uuid4().hex[:8]}.fcsp"
+        with open(pf, "wb") as out:
+            patch_size = encode_plan(plan, out, target_sha256=plan["target"]["sha256"])
+        patch_file = pf.name
+    except Exception:
+        logging.exception("Failed to write patch file")
+        patch_file, patch_size = None, None
+
+    # the text report streams to disk in the background; /analysis waits for it
+    writer = ReportWriter(old_fn, new_fn, res["data"], plan,
+                          detail=app.config['REPORT_DETAIL'],
+                          snippet_bytes=app.config['REPORT_SNIPPET_BYTES'],
+                          max_entries=app.config['REPORT_MAX_ENTRIES'])
+    analysis_file = write_report_async(writer, UP / f"analysis_{int(time.time())}_{uuid.uuid4().hex[:8]}.txt")
+
+    return {
+        "status":       "success",
+        "diff_report":  res["data"],
+        "sync_plan":    plan,
+        "visualization":viz,
+        "visualization_id":viz_id,
+        "analysis_file":analysis_file,
+        "patch_file":   patch_file,
+        "patch_size":   patch_size,
+        "old_filename": old_fn,
+        "new_filename": new_fn,
+        # …
+    }
 
-        # write analysis file
+@app.route('/compare', methods=['POST'])
+def compare_files():
+    try:
+        # unique names, as for jobs: the report writer still reads these
+        # files after the reply, so a later upload must not overwrite them
+        saved = save_uploads(prefix=f"{uuid.uuid4().hex[:8]}_")
+        if not isinstance(saved[0], str):
+            return saved
+        old_fn, new_fn, old_path, new_path = saved
         try:
-            txt = generate_human_readable_analysis(
-                old_fn, new_fn,
-                res["data"],     # <-- diff_data
-                plan
-            )
-            af = UP / f"analysis_{int(time.time())}.txt"
-            af.write_text(txt, encoding="utf-8")
-            analysis_file = af.name
-        except Exception:
-            logging.exception("Failed to write analysis file")
-            analysis_file = None
-
-        return jsonify({
-            "status":       "success",
-            "diff_report":  res["data"],
-            "sync_plan":    plan,
-            "visualization":viz,
-            "analysis_file":analysis_file,
-            # …
-        })
+            return jsonify(run_comparison(old_path, new_path, old_fn, new_fn,
+                                          chunking=request.stream_chunking, new_sha256=request.new_sha256))
+        except ValueError as e:
+            return jsonify(status="error", message=str(e)), 400
 
     except Exception:
         logging.exception("Error in /compare")
         return jsonify(status="error", message="Internal server error"), 500
 
-def generate_human_readable_analysis(old_fn, new_fn, diff_data, sync_plan):
-    """
-    A concise analysis report.
-    - Lists old/new chunks (in index order).
-    - References them from diff_data['old_chunks'] / ['new_chunks'].
-    - Shows each operation in the sync_plan.
-    """
-    lines = []
-    lines.append(f"Old File: {old_fn}")
-    lines.append(f"New File: {new_fn}")
-    lines.append("=" * 50)
-
-    # Summary
-    s = diff_data["summary"]
-    lines.append("=== Summary ===")
-    lines.append(f"Total Chunks : {s['total_chunks']}")
-    lines.append(f"Unchanged    : {s['unchanged']}")
-    lines.append(f"Added        : {s['added']} ({s['bytes_added']} bytes)")
-    lines.append(f"Removed      : {s['removed']} ({s['bytes_removed']} bytes)")
-    lines.append(f"Modified     : {s['modified']}")
-    lines.append(f"Change%      : {s['changed_percent']:.1f}%")
-    lines.append("")
-
-    def fmt_chunks(chunks, title):
-        lines.append(f"=== {title} ===")
-        for c in sorted(chunks, key=lambda c: c["index"]):
-            # decode once
-            raw = base64.b64decode(c["data"])
-            txt = raw.decode("utf-8", errors="replace")
-            # show embedded newlines as ↵, strip
-            single = txt.replace("\r\n", "\n").replace("\n", "↵").strip()
-            lines.append(f"Chunk {c['index'] + 1}: {single}")
-        lines.append("")
-
-    # **Use top‐level** old_chunks / new_chunks, not diff_data["details"]
-    fmt_chunks(diff_data.get("old_chunks", []), "Old File Chunks")
-    fmt_chunks(diff_data.get("new_chunks", []), "New File Chunks")
-
-    # Sync Plan
-    lines.append("=== Synchronization Plan ===")
-    lines.append(f"Total Ops : {len(sync_plan['operations'])}")
-    lines.append(f"Efficiency : {sync_plan['efficiency']:.1f}%")
-    lines.append("")
-
-    for i, op in enumerate(sync_plan["operations"], 1):
-        t   = op["type"]
-        off = op["offset"]
-        sz  = op["size"]
-
-        if t == "UNCHANGED":
-            lines.append(f"{i}. UNCHANGED @offset {off:<3} size {sz}")
-        elif t == "REMOVE":
-            lines.append(f"{i}. REMOVE    @offset {off:<3} size {sz}")
-        else:  # ADD or MODIFY
-            label = "ADD" if t == "ADD" else "MODIFY"
-            # try to grab a one‐line snippet
-            snippet = ""
-            b64     = op.get("data") or op.get("new_data", "")
-            try:
-                raw = base64.b64decode(b64)
-                txt = raw.decode("utf-8", errors="replace").splitlines()[0].strip()
-                snippet = txt
-            except:
-                pass
-
-            lines.append(f"{i}. {label:8}@offset {off:<3} size {sz}")
-            if snippet:
-                wrapped = textwrap.fill(snippet, width=60)
-                for ln in wrapped.splitlines():
-                    lines.append(f"    → {ln}")
-        lines.append("")
-
-    return "\n".join(lines)
+@app.route('/jobs', methods=['POST'])
+def submit_job():
+    """
+    Asynchronous /compare: save the uploads, queue the analysis and reply
+    at once with a job id to poll (/jobs/<id>), stream (/jobs/<id>/events)
+    and collect (/jobs/<id>/result).
+    """
+    # job uploads get a unique prefix so concurrent jobs never share files
+    saved = save_uploads(prefix=f"{uuid.uuid4().hex[:8]}_")
+    if not isinstance(saved[0], str):
+        return saved
+    old_fn, new_fn, old_path, new_path = saved
+
+    size = old_path.stat().st_size + new_path.stat().st_size
+    try:
+        job_id = job_manager.submit(run_comparison, size=size, old_path=old_path, new_path=new_path,
+                                    old_fn=old_fn, new_fn=new_fn, chunking=request.stream_chunking,
+                                    new_sha256=request.new_sha256)
+    except JobQueueFull as e:
+        old_path.unlink()
+        new_path.unlink()
+        return jsonify(status="error", message=str(e)), 503
+    return jsonify(status="queued", job_id=job_id,
+                   status_url=f"/jobs/{job_id}", events_url=f"/jobs/{job_id}/events",
+                   result_url=f"/jobs/{job_id}/result"), 202
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    status = job_manager.status(job_id)
+    if status is None:
+        return jsonify(status="error", message="Unknown job"), 404
+    return jsonify(status="success", job=status)
+
+@app.route('/jobs/<job_id>/result')
+def job_result(job_id):
+    job = job_manager.result(job_id)
+    if job is None:
+        return jsonify(status="error", message="Unknown job"), 404
+    if job["status"] == "failed":
+        return jsonify(status="error", message=job["error"]), 500
+    if job["status"] != "done":
+        return jsonify(status=job["status"], progress=job["progress"]), 202
+    return jsonify(job["result"])
+
+@app.route('/jobs/<job_id>/events')
+def job_events(job_id):
+    """Server-sent events: one message per progress change until the job finishes"""
+    if job_manager.status(job_id) is None:
+        return jsonify(status="error", message="Unknown job"), 404
+
+    def stream():
+        snapshot = None
+        while True:
+            snapshot = job_manager.wait(job_id, since=snapshot)
+            if snapshot is None:
+                return
+            yield f"data: {json.dumps(snapshot)}\n\n"
+            if snapshot["status"] in ("done", "failed"):
+                return
+
+    return Response(stream(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+def _viz_index(viz_id: str) -> VisualizationIndex:
+    path = Path(app.config['UPLOAD_FOLDER']) / f"viz_{secure_filename(viz_id)}.npz"
+    return viz_cache.get(str(path))
+
+def _int_arg(name: str, default=None):
+    value = request.args.get(name)
+    return default if value in (None, "") else int(value)
+
+@app.route('/visualization/<viz_id>')
+def visualization_bins(viz_id):
+    """
+    The chunk map of [start, end) of a track ('new' or 'old') aggregated
+    into `bins` equal byte ranges: bytes and chunk counts per change type.
+    """
+    try:
+        index = _viz_index(viz_id)
+    except FileNotFoundError:
+        return jsonify(status="error", message="Unknown visualization"), 404
+    try:
+        bins = min(_int_arg('bins', 800), app.config['VIZ_MAX_BINS'])
+        result = index.bins(bins, _int_arg('start'), _int_arg('end'), request.args.get('track', 'new'))
+    except ValueError as e:
+        return jsonify(status="error", message=str(e)), 400
+    return jsonify(status="success", **result)
+
+@app.route('/visualization/<viz_id>/chunks')
+def visualization_chunks(viz_id):
+    """The individual chunks overlapping [start, end) of a track, a page at a time (?cursor=)"""
+    try:
+        index = _viz_index(viz_id)
+    except FileNotFoundError:
+        return jsonify(status="error", message="Unknown visualization"), 404
+    try:
+        limit = min(_int_arg('limit', 1000), app.config['VIZ_PAGE_LIMIT'])
+        result = index.chunks(_int_arg('start'), _int_arg('end'), request.args.get('track', 'new'),
+                              limit=limit, cursor=_int_arg('cursor', 0))
+    except ValueError as e:
+        return jsonify(status="error", message=str(e)), 400
+    return jsonify(status="success", **result)
 
 @app.route("/synchronize", methods=["POST"])
 def synchronize():
+    output_path = "uploads/synced_old_version.txt"  # Updated filename
+
+    # binary patch body: streamed straight into the applier
+    if request.mimetype == "application/octet-stream":
+        old_file = request.args.get("old_file")
+        if not old_file:
+            return jsonify(status="error", success=False, message="old_file required"), 400
+        old_path = str(Path(app.config['UPLOAD_FOLDER']) / secure_filename(old_file))
+        try:
+            written = apply_binary_patch(request.stream, old_path, output_path)
+        except (ValueError, OSError) as e:
+            logging.exception("Patch application failed")
+            return jsonify(status="error", success=False, message=str(e)), 400
+        return jsonify({"status": "success", "success": True, "size": written,
+                        "message": f"File written to {output_path}"})
+
     sync_plan = request.get_json()
 
-    output_path = "uploads/synced_old_version.txt"  # Updated filename
+    old_file = sync_plan.get("old_file")
+    old_path = str(Path(app.config['UPLOAD_FOLDER']) / secure_filename(old_file)) if old_file else None
+    # the plan's target (size, digests) is verified; an interrupted apply of
+    # the same plan resumes from its journal when posted again
+    applier = PlanApplier(output_path, old_path, sync_plan.get("target"))
+    try:
+        written = applier.apply(sync_plan["operations"])
+    except (KeyError, ValueError) as e:
+        logging.exception("Synchronization failed")
+        return jsonify(status="error", success=False, message=str(e)), 400
+    except OSError as e:
+        logging.exception("Synchronization interrupted")
+        return jsonify(status="error", success=False, resumable=True, message=str(e)), 500
+
+    return jsonify({"status": "success", "success": True, "size": written,
+                    "resumed_operations": applier.resumed_ops, "verified_chunks": applier.verified_chunks,
+                    "message": f"File written to {output_path}"})
+
+@app.route('/signature/<filename>')
+def file_signature(filename):
+    """Signature (offsets, sizes, weak + strong hashes) of a file held by the server"""
+    path = Path(app.config['UPLOAD_FOLDER']) / secure_filename(filename)
+    if not path.is_file():
+        return jsonify(status="error", message="File not found"), 404
+
+    cs = request.args.get('chunk_size', type=int) or determine_chunk_size(path.stat().st_size)
+    engine = DeltaEngine(FileHasher(cs, engine=app.config['CHUNK_ENGINE']))
+    return jsonify(status="success", signature=engine.create_signature(str(path)))
+
+@app.route('/delta', methods=['POST'])
+def file_delta():
+    """
+    Receiver posts the signature of its copy plus the name of the server's
+    newer version; the reply holds literals only for regions it lacks.
+    """
+    body = request.get_json(silent=True) or {}
+    signature = body.get('signature')
+    if not signature or not body.get('file'):
+        return jsonify(status="error", message="signature and file required"), 400
 
-    content = bytearray()
-    for op in sync_plan["operations"]:
-        chunk = base64.b64decode(op["data"])
-        content.extend(chunk)
+    path = Path(app.config['UPLOAD_FOLDER']) / secure_filename(body['file'])
+    if not path.is_file():
+        return jsonify(status="error", message="File not found"), 404
 
-    Path(output_path).write_bytes(content)
+    try:
+        engine = DeltaEngine.for_signature(signature)
+        delta = engine.compute_delta(signature, str(path))
+    except (KeyError, ValueError) as e:
+        return jsonify(status="error", message=str(e)), 400
+    return jsonify(status="success", delta=delta)
+
+@app.route('/patch/<filename>', methods=['POST'])
+def apply_patch(filename):
+    """Bring a server-side file up to date from a delta computed against its signature"""
+    path = Path(app.config['UPLOAD_FOLDER']) / secure_filename(filename)
+    if not path.is_file():
+        return jsonify(status="error", message="File not found"), 404
+
+    delta = request.get_json(silent=True)
+    if not delta or "operations" not in delta:
+        return jsonify(status="error", message="delta required"), 400
 
-    return jsonify({"success": True, "message": f"File written to {output_path}"})
+    try:
+        DeltaEngine.check_delta(delta)
+        written = PlanApplier(str(path), str(path), delta["target"]).apply(delta["operations"])
+    except (KeyError, ValueError) as e:
+        return jsonify(status="error", message=str(e)), 400
+    return jsonify(status="success", message=f"{path.name} updated", size=written)
+
+def upload_subdir(name: str):
+    """Directory under the upload folder, or None if name escapes it"""
+    root = Path(app.config['UPLOAD_FOLDER']).resolve()
+    path = (root / name).resolve()
+    if path != root and root not in path.parents:
+        return None
+    return path
+
+@app.route('/compare-tree', methods=['POST'])
+def compare_tree():
+    """
+    Plan the sync of one directory tree (under the upload folder) onto
+    another. Changed files get binary patches; the reply carries the
+    aggregate stats and the name of the combined manifest.
+    """
+    body = request.get_json(silent=True) or {}
+    if not body.get('old_dir') or not body.get('new_dir'):
+        return jsonify(status="error", message="old_dir and new_dir required"), 400
+    old_dir = upload_subdir(body['old_dir'])
+    new_dir = upload_subdir(body['new_dir'])
+    if old_dir is None or new_dir is None or not old_dir.is_dir() or not new_dir.is_dir():
+        return jsonify(status="error", message="Directory not found"), 404
+
+    UP = Path(app.config['UPLOAD_FOLDER'])
+    run_id = f"{int(time.time())}_{uuid.uuid4().hex[:8]}"
+    syncer = TreeSyncer(engine=app.config['CHUNK_ENGINE'],
+                        similarity_threshold=app.config['SIMILARITY_THRESHOLD'],
+                        processes=app.config['TREE_SYNC_PROCESSES'],
+                        algorithm=app.config['HASH_ALGORITHM'],
+                        weak_algorithm=app.config['WEAK_HASH'],
+                        cache=signature_cache)
+    try:
+        manifest = syncer.sync_tree(str(old_dir), str(new_dir),
+                                    patch_dir=str(UP / f"patches_{run_id}"),
+                                    manifest_path=str(UP / f"manifest_{run_id}.json"))
+    except (OSError, ValueError) as e:
+        logging.exception("Tree comparison failed")
+        return jsonify(status="error", message=str(e)), 400
+
+    return jsonify(status="success", stats=manifest["stats"],
+                   manifest_file=f"manifest_{run_id}.json", patch_dir=f"patches_{run_id}")
+
+@app.route('/fanout', methods=['POST'])
+def fanout():
+    """
+    Diff many files (under the upload folder) against one baseline, whose
+    chunk index is built once and kept for later batches. Every target gets
+    a binary patch; the reply ranks the targets by similarity to the baseline.
+    Body: {"baseline": path, "targets": [paths]} or {"baseline": path, "targets_dir": dir}.
+    """
+    body = request.get_json(silent=True) or {}
+    if not body.get('baseline') or not (body.get('targets') or body.get('targets_dir')):
+        return jsonify(status="error", message="baseline and targets (or targets_dir) required"), 400
+    baseline = upload_subdir(body['baseline'])
+    if baseline is None or not baseline.is_file():
+        return jsonify(status="error", message="Baseline not found"), 404
+    if body.get('targets_dir'):
+        targets_dir = upload_subdir(body['targets_dir'])
+        if targets_dir is None or not targets_dir.is_dir():
+            return jsonify(status="error", message="Directory not found"), 404
+        paths = sorted(p for p in targets_dir.rglob('*') if p.is_file() and p != baseline)
+        root = targets_dir
+    else:
+        paths = [upload_subdir(name) for name in body['targets']]
+        if any(p is None or not p.is_file() for p in paths):
+            return jsonify(status="error", message="Target not found"), 404
+        root = Path(app.config['UPLOAD_FOLDER']).resolve()
+    if not paths:
+        return jsonify(status="error", message="No targets"), 400
+
+    UP = Path(app.config['UPLOAD_FOLDER'])
+    run_id = f"{int(time.time())}_{uuid.uuid4().hex[:8]}"
+    index_dir = Path(app.config['BASELINE_INDEX_DIR']) / hashlib.sha256(str(baseline).encode()).hexdigest()[:24]
+    syncer = FanoutSyncer(engine=app.config['CHUNK_ENGINE'],
+                          similarity_threshold=app.config['SIMILARITY_THRESHOLD'],
+                          processes=app.config['FANOUT_PROCESSES'],
+                          algorithm=app.config['HASH_ALGORITHM'],
+                          cache=signature_cache)
+    try:
+        manifest = syncer.diff_many(str(baseline), {p.relative_to(root).as_posix(): str(p) for p in paths},
+                                    index_dir=str(index_dir),
+                                    patch_dir=str(UP / f"fanout_{run_id}"),
+                                    manifest_path=str(UP / f"fanout_{run_id}.json"))
+    except (OSError, ValueError) as e:
+        logging.exception("Fan-out comparison failed")
+        return jsonify(status="error", message=str(e)), 400
+
+    return jsonify(status="success", stats=manifest["stats"], ranking=manifest["ranking"],
+                   manifest_file=f"fanout_{run_id}.json", patch_dir=f"fanout_{run_id}")
+
+@app.route('/store/<name>', methods=['POST'])
+def store_file(name):
+    """Store an uploaded file as a new version, deduplicated against every stored chunk"""
+    f = request.files.get('file')
+    if f is None or not f.filename:
+        return jsonify(status="error", message="file required"), 400
+    name = secure_filename(name)
+    path = Path(app.config['UPLOAD_FOLDER']) / f"store_{uuid.uuid4().hex}_{name}"
+    f.save(str(path))
+    try:
+        hasher = FileHasher(app.config['CHUNK_STORE_CHUNK_SIZE'], engine=app.config['CHUNK_ENGINE'],
+                            algorithm=app.config['HASH_ALGORITHM'])
+        result = chunk_store().put_file(str(path), name, hasher)
+    except (OSError, ValueError) as e:
+        logging.exception("Storing file failed")
+        return jsonify(status="error", message=str(e)), 400
+    finally:
+        path.unlink()
+    return jsonify(status="success", **result)
+
+@app.route('/store/<name>')
+def stored_versions(name):
+    return jsonify(status="success", name=name, versions=chunk_store().versions(secure_filename(name)))
+
+@app.route('/store/<name>/<int:version>')
+def restore_file(name, version):
+    """Reassemble a stored version into the upload folder and send it"""
+    name = secure_filename(name)
+    out = f"restored_{name}_v{version}"
+    try:
+        chunk_store().restore(name, str(Path(app.config['UPLOAD_FOLDER']) / out), version=version)
+    except KeyError:
+        return jsonify(status="error", message="Version not found"), 404
+    except (OSError, ValueError) as e:
+        logging.exception("Restore failed")
+        return jsonify(status="error", message=str(e)), 500
+    return send_from_directory(os.path.abspath(app.config['UPLOAD_FOLDER']), out, as_attachment=True)
+
+@app.route('/store/<name>/<int:version>', methods=['DELETE'])
+def delete_stored_version(name, version):
+    try:
+        chunk_store().delete_version(secure_filename(name), version)
+    except KeyError:
+        return jsonify(status="error", message="Version not found"), 404
+    return jsonify(status="success")
+
+@app.route('/store-gc', methods=['POST'])
+def store_gc():
+    """Reclaim pack space held by chunks no stored version references"""
+    result = chunk_store().gc()
+    return jsonify(status="success", gc=result, stats=chunk_store().stats())
 
 @app.route('/analysis/<filename>')
 def serve_analysis_file(filename):
-    return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+    with _reports_lock:
+        future = pending_reports.get(filename)
+    if future is not None:
+        try:
+            future.result(timeout=app.config['REPORT_WAIT_SECONDS'])
+        except FutureTimeout:
+            return jsonify(status="pending", message="Report is still being written"), 202
+        except Exception:
+            return jsonify(status="error", message="Report could not be written"), 500
+    return send_from_directory(os.path.abspath(app.config['UPLOAD_FOLDER']), filename)
 
 @app.route('/uploads/<filename>')
 def serve_uploaded_file(filename):
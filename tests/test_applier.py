@@ -0,0 +1,112 @@
+import hashlib
+import random
+
+import pytest
+
+import backend.applier as applier
+from backend.applier import PlanApplier
+from backend.syncer import FileSyncer
+
+
+@pytest.fixture
+def pair(tmp_path):
+    rng = random.Random(21)
+    old = rng.randbytes(1_000_000)
+    new = old[:200_000] + rng.randbytes(30_000) + old[260_000:800_000] + old[:50_000]
+    old_path = tmp_path / "old"
+    old_path.write_bytes(old)
+    (tmp_path / "new").write_bytes(new)
+    syncer = FileSyncer(chunk_size=4096, engine="gear")
+    res = syncer.analyze_files(str(old_path), str(tmp_path / "new"))
+    plan = syncer.generate_sync_plan(res, copy_refs=True)
+    return old_path, new, plan
+
+
+def test_plan_carries_whole_file_digest(pair):
+    _, new, plan = pair
+    assert plan["target"]["sha256"] == hashlib.sha256(new).hexdigest()
+
+
+def test_resume_after_interrupted_apply(tmp_path, pair, monkeypatch):
+    old_path, new, plan = pair
+    out = tmp_path / "out"
+    monkeypatch.setattr(applier, "CHECKPOINT_OPS", 1)
+
+    real_copy = applier.copy_range_at
+    calls = []
+
+    def failing_copy(*args):
+        calls.append(args)
+        if len(calls) == 3:
+            raise OSError("device went away")
+        return real_copy(*args)
+
+    monkeypatch.setattr(applier, "copy_range_at", failing_copy)
+    with pytest.raises(OSError):
+        PlanApplier(str(out), str(old_path), plan["target"]).apply(plan["operations"])
+    assert not out.exists()
+    assert (tmp_path / "out.partial").exists() and (tmp_path / "out.journal").exists()
+
+    monkeypatch.setattr(applier, "copy_range_at", real_copy)
+    resumed = PlanApplier(str(out), str(old_path), plan["target"])
+    assert resumed.apply(plan["operations"]) == len(new)
+    assert resumed.resumed_ops >= 2
+    assert resumed.verified_chunks == len(plan["target"]["chunks"])
+    assert out.read_bytes() == new
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["new", "old", "out"]
+
+
+def test_journal_of_another_plan_is_not_resumed(tmp_path, pair, monkeypatch):
+    old_path, new, plan = pair
+    out = tmp_path / "out"
+    monkeypatch.setattr(applier, "CHECKPOINT_OPS", 1)
+    real_copy = applier.copy_range_at
+
+    def failing_copy(*args):
+        raise OSError("interrupted")
+
+    monkeypatch.setattr(applier, "copy_range_at", failing_copy)
+    with pytest.raises(OSError):
+        PlanApplier(str(out), str(old_path), plan["target"]).apply(plan["operations"])
+    monkeypatch.setattr(applier, "copy_range_at", real_copy)
+
+    other = dict(plan["target"], sha256="0" * 64)
+    with pytest.raises(ValueError):
+        PlanApplier(str(out), str(old_path), other).apply(plan["operations"])
+    applied = PlanApplier(str(out), str(old_path), plan["target"])
+    applied.apply(plan["operations"])
+    assert applied.resumed_ops == 0
+    assert out.read_bytes() == new
+
+
+def test_mismatch_discards_partial_state_and_keeps_output(tmp_path, pair):
+    old_path, _, plan = pair
+    wrong = tmp_path / "wrong"
+    wrong.write_bytes(bytes(old_path.stat().st_size))
+    out = tmp_path / "out"
+    out.write_bytes(b"previous contents")
+    with pytest.raises(ValueError):
+        PlanApplier(str(out), str(wrong), plan["target"]).apply(plan["operations"])
+    assert out.read_bytes() == b"previous contents"
+    assert not (tmp_path / "out.partial").exists() and not (tmp_path / "out.journal").exists()
+
+
+def test_chunk_spanning_two_operations_is_verified(tmp_path, pair):
+    # every op boundary moved off the chunk grid: no chunk lies inside a single op
+    old_path, _, plan = pair
+    old = old_path.read_bytes()
+    ops = [{"type": "COPY", "offset": o, "old_offset": o, "size": min(3001, len(old) - o)}
+           for o in range(0, len(old), 3001)]
+    chunks = [[o, min(4096, len(old) - o)] for o in range(0, len(old), 4096)]
+    target = {"size": len(old), "algorithm": "sha256",
+              "chunks": [[o, s, hashlib.sha256(old[o:o + s]).hexdigest()] for o, s in chunks]}
+    corrupt = bytearray(old)
+    corrupt[5000] ^= 0xFF
+    bad_old = tmp_path / "bad_old"
+    bad_old.write_bytes(corrupt)
+
+    with pytest.raises(ValueError, match="offset 4096"):
+        PlanApplier(str(tmp_path / "out"), str(bad_old), target).apply([dict(op) for op in ops])
+    ok = PlanApplier(str(tmp_path / "out"), str(old_path), target)
+    ok.apply([dict(op) for op in ops])
+    assert ok.verified_chunks == len(chunks)
@@ -0,0 +1,131 @@
+import random
+
+import pytest
+
+from backend import chunker as chunker_module
+from backend.chunker import FileChunker, StreamChunker
+
+
+def _data(size, seed=1, text=False):
+    rng = random.Random(seed)
+    if text:
+        words = [rng.randbytes(rng.randrange(2, 9)).hex().encode() for _ in range(200)]
+        out = bytearray()
+        while len(out) < size:
+            out += b" ".join(rng.choice(words) for _ in range(rng.randrange(3, 12))) + b"\n"
+        return bytes(out[:size])
+    return rng.randbytes(size)
+
+
+def _reference_gear_cuts(data, min_size, avg_size, max_size):
+    """Byte-at-a-time FastCDC: sequential gear hash, normalized size zones"""
+    from backend.fastcdc import GEAR, GearChunker
+    masks = GearChunker(min_size, avg_size, max_size)
+    gear = [int(g) for g in GEAR]
+    hashes = []
+    h = 0
+    for b in data:
+        h = ((h << 1) + gear[b]) & 0xFFFFFFFF
+        hashes.append(h)
+
+    cuts = []
+    s, n = 0, len(data)
+    while s < n:
+        if n - s <= masks.min_size:
+            cuts.append(n)
+            break
+        limit = min(s + masks.max_size, n)
+        normal = min(s + masks.avg_size, limit)
+        cut = limit
+        for c in range(s + masks.min_size, limit):
+            mask = masks.mask_s if c < normal else masks.mask_l
+            if hashes[c - 1] & mask == 0:
+                cut = c
+                break
+        cuts.append(cut)
+        s = cut
+    return cuts
+
+
+@pytest.mark.parametrize("avg", [64, 256, 1024])
+def test_gear_cuts_match_sequential_reference(avg):
+    data = _data(200_000, seed=avg)
+    c = FileChunker(avg, engine="gear")
+    expected = _reference_gear_cuts(data, c.min_chunk_size, c.avg_chunk_size, c.max_chunk_size)
+    assert [end for _, end in c.iter_boundaries(data)] == expected
+    sizes = [b - a for a, b in zip([0] + expected, expected)]
+    assert min(sizes[:-1]) < max(sizes) <= c.max_chunk_size   # content-defined, not fixed-size
+
+
+def test_gear_cuts_independent_of_hash_block_size():
+    data = _data(300_000, seed=2)
+    c = FileChunker(512, engine="gear")
+    c.gear.block_size = c.max_chunk_size + 17   # many block seams, off any chunk size
+    expected = _reference_gear_cuts(data, c.min_chunk_size, c.avg_chunk_size, c.max_chunk_size)
+    assert [end for _, end in c.iter_boundaries(data)] == expected
+
+
+def test_parallel_gear_cuts_match_single_process(tmp_path, monkeypatch):
+    data = _data(1_000_000, seed=3)
+    path = tmp_path / "f"
+    path.write_bytes(data)
+    monkeypatch.setattr(chunker_module, "PARALLEL_MIN_BYTES", 1)
+    monkeypatch.setattr(chunker_module, "PARALLEL_SEGMENT_BYTES", 100_003)
+    parallel = FileChunker(1024, engine="gear", processes=2).chunk_file(str(path))
+    assert parallel == list(FileChunker(1024, engine="gear").iter_boundaries(data))
+
+
+def _apply_edits(data, edits):
+    """edits: (old_offset, old_len, replacement) in old coordinates, non-overlapping"""
+    out, pos = bytearray(), 0
+    for offset, old_len, replacement in sorted(edits):
+        out += data[pos:offset] + replacement
+        pos = offset + old_len
+    return bytes(out + data[pos:])
+
+
+@pytest.mark.parametrize("engine", ["gear", "rolling"])
+@pytest.mark.parametrize("edits", [
+    [(1000, 0, b"inserted bytes")],
+    [(50_000, 300, b"")],
+    [(10, 5, b"xyz"), (30_000, 0, b"q" * 2000), (79_000, 900, b"tail edit")],
+    [(0, 100, b"new head")],
+])
+def test_rechunk_matches_full_pass(engine, edits):
+    old = _data(80_000, seed=4, text=True)
+    new = _apply_edits(old, edits)
+    c = FileChunker(256, engine=engine)
+    old_bounds = [(s, e - s) for s, e in c.iter_boundaries(old)]
+    spec = [(offset, old_len, len(replacement)) for offset, old_len, replacement in edits]
+
+    result = list(c.rechunk(new, old_bounds, spec, len(old)))
+    assert [(s, e) for s, e, _ in result] == list(c.iter_boundaries(new))
+    # reused chunks really hold the same bytes as the old chunk they came from
+    for s, e, i in result:
+        if i is not None:
+            o, size = old_bounds[i]
+            assert new[s:e] == old[o:o + size]
+    assert any(i is not None for _, _, i in result)
+
+
+def test_rechunk_rejects_edits_that_do_not_add_up():
+    c = FileChunker(256, engine="gear")
+    data = _data(10_000)
+    with pytest.raises(ValueError):
+        list(c.rechunk(data, [(0, len(data))], [(0, 10, 20)], len(data)))
+
+
+@pytest.mark.parametrize("engine", ["gear", "rolling"])
+@pytest.mark.parametrize("piece", [1, 777, 65_536])
+def test_stream_chunker_matches_full_pass(engine, piece):
+    data = _data(120_000 if piece > 1 else 20_000, seed=5, text=True)
+    c = FileChunker(512, engine=engine)
+    seen = []
+    stream = StreamChunker(c, lambda offset, chunk: seen.append((offset, offset + len(chunk), bytes(chunk))),
+                           batch_bytes=4096)
+    for i in range(0, len(data), piece):
+        stream.feed(data[i:i + piece])
+    assert stream.finish() == len(data)
+
+    assert [(s, e) for s, e, _ in seen] == list(c.iter_boundaries(data))
+    assert all(chunk == data[s:e] for s, e, chunk in seen)
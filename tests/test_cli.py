@@ -0,0 +1,94 @@
+import random
+
+import pytest
+
+from backend import cli
+
+
+@pytest.fixture
+def blocks():
+    rng = random.Random(7)
+    return rng.randbytes(300000), rng.randbytes(300000)
+
+
+def _write(path, data):
+    path.write_bytes(data)
+    return str(path)
+
+
+def test_diff_identical_files_exit_0(tmp_path, blocks):
+    a, b = blocks
+    old = _write(tmp_path / "old", a + b)
+    new = _write(tmp_path / "new", a + b)
+    assert cli.main(["diff", old, new]) == cli.EXIT_OK
+
+
+def test_diff_changed_files_exit_1(tmp_path, blocks):
+    a, b = blocks
+    old = _write(tmp_path / "old", a + b)
+    new = _write(tmp_path / "new", a + b"tail")
+    assert cli.main(["diff", old, new]) == cli.EXIT_DIFFERENT
+
+
+def test_diff_reordered_chunks_exit_1(tmp_path, blocks):
+    # two whole chunks swapped: nothing added, removed or modified, same size
+    data = b"".join(blocks)
+    old = _write(tmp_path / "old", data)
+    syncer = cli._syncer(cli.build_parser().parse_args(["diff", old, old]))
+    chunks = syncer.analyze_files(old, old)["data"]["old_chunks"]
+    parts = [data[c["offset"]:c["offset"] + c["size"]] for c in chunks]
+    parts[3], parts[4] = parts[4], parts[3]
+    new = _write(tmp_path / "new", b"".join(parts))
+
+    s = syncer.analyze_files(old, new)["data"]["summary"]
+    assert (s["added"], s["removed"], s["modified"]) == (0, 0, 0)
+    assert cli.main(["diff", old, new]) == cli.EXIT_DIFFERENT
+
+
+def test_patch_apply_round_trip_exit_0(tmp_path, blocks):
+    a, b = blocks
+    old = _write(tmp_path / "old", a + b)
+    new = _write(tmp_path / "new", a + b"inserted" + b)
+    patch = str(tmp_path / "update.fcsp")
+    out = str(tmp_path / "out")
+    assert cli.main(["patch", old, new, "-o", patch]) == cli.EXIT_OK
+    assert cli.main(["apply", old, patch, "-o", out]) == cli.EXIT_OK
+    assert (tmp_path / "out").read_bytes() == a + b"inserted" + b
+
+
+def test_patch_from_signature_round_trip_exit_0(tmp_path, blocks):
+    a, b = blocks
+    old = _write(tmp_path / "old", a + b)
+    new = _write(tmp_path / "new", b + a[:1000])
+    sig = str(tmp_path / "old.sig")
+    patch = str(tmp_path / "update.fcsp")
+    assert cli.main(["signature", old, "-o", sig]) == cli.EXIT_OK
+    assert cli.main(["patch", "--signature", sig, new, "-o", patch]) == cli.EXIT_OK
+    assert cli.main(["apply", old, patch]) == cli.EXIT_OK
+    assert (tmp_path / "old").read_bytes() == b + a[:1000]
+
+
+def test_missing_file_exit_2(tmp_path):
+    missing = str(tmp_path / "missing")
+    assert cli.main(["signature", missing]) == cli.EXIT_ERROR
+    assert cli.main(["diff", missing, missing]) == cli.EXIT_ERROR
+
+
+def test_bad_patch_exit_3(tmp_path, blocks):
+    a, b = blocks
+    old = _write(tmp_path / "old", a + b)
+    garbage = _write(tmp_path / "garbage", b"not a patch at all")
+    assert cli.main(["apply", old, garbage, "-o", str(tmp_path / "out")]) == cli.EXIT_INVALID
+
+    new = _write(tmp_path / "new", a + b"x")
+    patch = str(tmp_path / "update.fcsp")
+    assert cli.main(["patch", old, new, "-o", patch]) == cli.EXIT_OK
+    other = _write(tmp_path / "other", b + a)
+    assert cli.main(["apply", other, patch, "-o", str(tmp_path / "out")]) == cli.EXIT_INVALID
+    assert not (tmp_path / "out").exists()
+
+
+def test_bad_signature_exit_3(tmp_path, blocks):
+    new = _write(tmp_path / "new", blocks[0])
+    sig = _write(tmp_path / "bad.sig", b"{}")
+    assert cli.main(["patch", "--signature", sig, new, "-o", str(tmp_path / "p")]) == cli.EXIT_INVALID
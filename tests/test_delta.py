@@ -0,0 +1,57 @@
+import io
+import random
+
+import pytest
+
+from backend.applier import PlanApplier
+from backend.delta import DeltaEngine
+from backend.hasher import FileHasher
+from backend.patch import apply_patch, encode_plan
+
+
+@pytest.fixture
+def pair(tmp_path):
+    rng = random.Random(6)
+    old = rng.randbytes(300_000)
+    # moved and inserted content: old offsets and target offsets diverge
+    new = old[200_000:] + rng.randbytes(4_000) + old[:150_000]
+    (tmp_path / "old").write_bytes(old)
+    (tmp_path / "new").write_bytes(new)
+    engine = DeltaEngine(FileHasher(2048, engine="gear"))
+    signature = engine.create_signature(str(tmp_path / "old"))
+    delta = DeltaEngine.for_signature(signature).compute_delta(signature, str(tmp_path / "new"))
+    return tmp_path, new, delta
+
+
+def test_delta_uses_plan_operation_schema(pair):
+    _, new, delta = pair
+    offset = 0
+    for op in delta["operations"]:
+        assert op["type"] in ("COPY", "ADD") and op["offset"] == offset
+        offset += op["size"]
+    assert offset == delta["target"]["size"] == len(new)
+    assert any(op["type"] == "COPY" and op["old_offset"] != op["offset"] for op in delta["operations"])
+    assert delta["stats"]["copied_bytes"] > 0 and delta["stats"]["literal_bytes"] > 0
+
+
+def test_delta_applies_in_place_through_plan_applier(pair):
+    tmp_path, new, delta = pair
+    DeltaEngine.check_delta(delta)
+    old = str(tmp_path / "old")
+    assert PlanApplier(old, old, delta["target"]).apply(delta["operations"]) == len(new)
+    assert (tmp_path / "old").read_bytes() == new
+
+
+def test_delta_encodes_as_binary_patch(pair):
+    tmp_path, new, delta = pair
+    buf = io.BytesIO()
+    encode_plan(delta, buf, target_sha256=delta["target"]["sha256"])
+    buf.seek(0)
+    apply_patch(buf, str(tmp_path / "old"), str(tmp_path / "out"))
+    assert (tmp_path / "out").read_bytes() == new
+
+
+def test_old_format_delta_is_rejected(pair):
+    _, _, delta = pair
+    with pytest.raises(ValueError):
+        DeltaEngine.check_delta(dict(delta, version=1))
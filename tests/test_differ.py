@@ -0,0 +1,42 @@
+import random
+
+import pytest
+
+from backend.differ import FileDiffer
+from backend.hasher import FileHasher
+
+
+@pytest.fixture
+def files(tmp_path):
+    rng = random.Random(10)
+    old = rng.randbytes(300_000)
+    new = old[:120_000] + rng.randbytes(3_000) + old[120_000:]
+    paths = []
+    for name, data in (("old", old), ("new", new), ("unrelated", rng.randbytes(300_000))):
+        (tmp_path / name).write_bytes(data)
+        paths.append(str(tmp_path / name))
+    return paths
+
+
+def test_two_tier_maps_match_like_strong_maps(files):
+    old, new, _ = files
+    strong = FileHasher(2048, engine="gear")
+    two_tier = FileHasher(2048, engine="gear", weak_algorithm="adler32")
+    expected = FileDiffer().compare_files(strong.create_chunk_map(old), strong.create_chunk_map(new))
+    result = FileDiffer().compare_files(two_tier.create_chunk_map(old), two_tier.create_chunk_map(new))
+    assert result["matches"] == expected["matches"]
+    assert result["stats"]["added"] == expected["stats"]["added"] > 0
+
+
+def test_maps_with_different_weak_algorithms_are_rejected(files):
+    old, _, unrelated = files
+    old_map = FileHasher(2048, engine="gear", weak_algorithm="adler32").create_chunk_map(old)
+    new_map = FileHasher(2048, engine="gear").create_chunk_map(unrelated)
+    # a two-tier map has no strong digests up front: comparing it with any
+    # other scheme would line every chunk up on hash=None
+    assert all(c["hash"] is None for c in old_map["chunks"])
+    for_new = dict(new_map, weak_algorithm="xxh64",
+                   chunks=[dict(c.to_dict(), hash=None, weak=0) for c in new_map["chunks"]])
+    for a, b in ((old_map, new_map), (new_map, old_map), (old_map, for_new)):
+        with pytest.raises(ValueError, match="weak algorithms"):
+            FileDiffer().compare_files(a, b)
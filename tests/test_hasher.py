@@ -0,0 +1,52 @@
+import random
+
+import pytest
+
+from backend.hasher import FileHasher
+from backend.metrics import metrics
+from backend.sigcache import SignatureCache
+
+
+def _records(chunk_map):
+    return [(c["offset"], c["size"], c["hash"]) for c in chunk_map["chunks"]]
+
+
+@pytest.fixture
+def log(tmp_path):
+    path = tmp_path / "app.log"
+    path.write_bytes(random.Random(14).randbytes(400_000))
+    return path
+
+
+def _incremental_maps():
+    return metrics.snapshot()["counters"].get("incremental_chunk_maps", 0)
+
+
+def test_pure_append_is_rechunked_incrementally(tmp_path, log):
+    hasher = FileHasher(2048, engine="gear", cache=SignatureCache(str(tmp_path / "cache")))
+    hasher.create_chunk_map(str(log))
+    with open(log, "ab") as f:
+        f.write(b"appended line\n" * 500)
+
+    before = _incremental_maps()
+    incremental = hasher.create_chunk_map(str(log))
+    assert _incremental_maps() == before + 1
+    assert _records(incremental) == _records(FileHasher(2048, engine="gear").create_chunk_map(str(log)))
+
+
+def test_edit_then_append_is_not_taken_for_an_append(tmp_path, log):
+    hasher = FileHasher(2048, engine="gear", cache=SignatureCache(str(tmp_path / "cache")))
+    old_map = hasher.create_chunk_map(str(log))
+    quarter = old_map["chunks"][len(old_map["chunks"]) // 4]
+    with open(log, "r+b") as f:   # same inode: the cache offers the old map as a base
+        f.seek(quarter["offset"] + 10)
+        f.write(b"x" * 50)
+        f.seek(0, 2)
+        f.write(b"appended line\n" * 500)
+
+    assert hasher.detect_append(old_map, str(log)) is None
+    before = _incremental_maps()
+    remapped = hasher.create_chunk_map(str(log))
+    assert _incremental_maps() == before
+    assert _records(remapped) == _records(FileHasher(2048, engine="gear").create_chunk_map(str(log)))
+    assert _records(hasher.update_chunk_map(old_map, str(log))) == _records(remapped)
@@ -0,0 +1,109 @@
+import io
+import random
+import threading
+
+import pytest
+
+from backend.patch import encode_plan, decode_patch, apply_patch
+from backend.syncer import FileSyncer
+
+
+def _codecs():
+    codecs = ["none", "zlib"]
+    try:
+        import zstandard  # noqa: F401
+        codecs.append("zstd")
+    except ImportError:
+        pass
+    return codecs
+
+
+@pytest.fixture
+def pair(tmp_path):
+    rng = random.Random(11)
+    old = rng.randbytes(400_000)
+    new = old[:100_000] + rng.randbytes(5_000) + old[150_000:300_000] + old[:20_000] + b"appended"
+    old_path, new_path = tmp_path / "old", tmp_path / "new"
+    old_path.write_bytes(old)
+    new_path.write_bytes(new)
+    syncer = FileSyncer(chunk_size=2048, engine="gear")
+    res = syncer.analyze_files(str(old_path), str(new_path))
+    plan = syncer.generate_sync_plan(res, copy_refs=True)
+    return old_path, new, plan
+
+
+@pytest.mark.parametrize("codec", _codecs())
+def test_encode_decode_apply_round_trip(tmp_path, pair, codec):
+    old_path, new, plan = pair
+    buf = io.BytesIO()
+    encode_plan(plan, buf, codec=codec, target_sha256=plan["target"]["sha256"])
+
+    buf.seek(0)
+    decoded = decode_patch(buf)
+    assert decoded["target_size"] == len(new)
+    assert decoded["target_sha256"] == plan["target"]["sha256"]
+    assert sum(op["size"] for op in decoded["operations"]) == len(new)
+
+    buf.seek(0)
+    out = tmp_path / "out"
+    assert apply_patch(buf, str(old_path), str(out)) == len(new)
+    assert out.read_bytes() == new
+
+
+def test_decoded_plan_re_encodes_to_the_same_patch(pair):
+    _, _, plan = pair
+    first = io.BytesIO()
+    encode_plan(plan, first, codec="zlib", target_sha256=plan["target"]["sha256"])
+    first.seek(0)
+    second = io.BytesIO()
+    encode_plan(decode_patch(first), second, codec="zlib", target_sha256=plan["target"]["sha256"])
+    assert second.getvalue() == first.getvalue()
+
+
+def test_apply_rejects_wrong_old_file_and_keeps_output(tmp_path, pair):
+    old_path, new, plan = pair
+    buf = io.BytesIO()
+    encode_plan(plan, buf, target_sha256=plan["target"]["sha256"])
+    wrong = tmp_path / "wrong"
+    wrong.write_bytes(bytes(len(old_path.read_bytes())))
+    out = tmp_path / "out"
+    out.write_bytes(b"previous contents")
+
+    buf.seek(0)
+    with pytest.raises(ValueError):
+        apply_patch(buf, str(wrong), str(out))
+    assert out.read_bytes() == b"previous contents"
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["new", "old", "out", "wrong"]
+
+
+@pytest.mark.parametrize("cut", [3, 40, -10])
+def test_apply_rejects_truncated_patch(tmp_path, pair, cut):
+    old_path, _, plan = pair
+    buf = io.BytesIO()
+    encode_plan(plan, buf, target_sha256=plan["target"]["sha256"])
+    data = buf.getvalue()
+    with pytest.raises(ValueError):
+        apply_patch(io.BytesIO(data[:cut]), str(old_path), str(tmp_path / "out"))
+
+
+def test_concurrent_applies_to_one_output_do_not_collide(tmp_path, pair):
+    old_path, new, plan = pair
+    buf = io.BytesIO()
+    encode_plan(plan, buf, codec="none", target_sha256=plan["target"]["sha256"])
+    out = tmp_path / "out"
+    errors = []
+
+    def worker():
+        try:
+            apply_patch(io.BytesIO(buf.getvalue()), str(old_path), str(out))
+        except Exception as e:   # collected: a thread's exception would be lost
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert errors == []
+    assert out.read_bytes() == new
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["new", "old", "out"]
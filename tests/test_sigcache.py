@@ -0,0 +1,34 @@
+import os
+
+from backend.hasher import FileHasher
+from backend.sigcache import SignatureCache
+
+
+def _names(cache_dir, suffix):
+    return sorted(n for n in os.listdir(cache_dir) if n.endswith(suffix))
+
+
+def test_eviction_drops_pointers_of_evicted_entries(tmp_path):
+    cache_dir = tmp_path / "cache"
+    cache = SignatureCache(str(cache_dir), max_bytes=1 << 30)
+    hasher = FileHasher(64, engine="gear", cache=cache)
+    paths = []
+    for i in range(20):
+        path = tmp_path / f"f{i}"
+        path.write_bytes(os.urandom(5_000))
+        hasher.create_chunk_map(str(path))
+        paths.append(str(path))
+    assert len(_names(cache_dir, ".json")) == len(_names(cache_dir, ".latest")) == 20
+
+    cache.max_bytes = sum(os.path.getsize(cache_dir / n) for n in _names(cache_dir, ".json")) // 4
+    cache.evict()
+    kept = _names(cache_dir, ".json")
+    assert 0 < len(kept) < 20
+    # every remaining pointer leads to a remaining entry, and each entry keeps its pointer
+    targets = sorted((cache_dir / n).read_text().strip() for n in _names(cache_dir, ".latest"))
+    assert targets == kept
+    assert all(cache.latest(p, hasher.signature_params()) is not None for p in paths[-len(kept):])
+
+    cache.max_bytes = 0
+    cache.evict()
+    assert os.listdir(cache_dir) == []